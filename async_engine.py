@@ -0,0 +1,1096 @@
+"""基于asyncio的下载引擎
+
+HTTP请求使用aiohttp，ffmpeg通过asyncio子进程调用，重试退避和限速等待都使用asyncio.sleep，
+因此数百个分页请求或分P下载同时进行时只占用一个事件循环线程。
+AsyncBiliEngine 实现与 BiliDownloader 的 get_video_info、get_collection_info、
+_direct_download、_download_file 相同的操作，并复用其配置、限速器、镜像测速、
+API缓存和playurl缓存。
+
+AsyncBiliDownloader 在后台线程中运行事件循环，对外保持 BiliDownloader 的同步接口，
+CLI 和 GUI 通过 create_downloader 按配置项 engine 选择使用。
+"""
+import asyncio
+import copy
+import functools
+import os
+import random
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+from urllib.parse import urlparse
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from disk_writer import WriteStream
+from 音乐批量下载 import (
+    BiliDownloader, DownloadQuality, DownloadContent, VideoType, MirrorManager, SlowMirrorError,
+    DownloadCancelled, FFmpegError, TaskCounter, current_page_task, HostSessions, request_headers, MP4_COPY_AUDIO_CODECS, SEGMENT_MIN_SIZE, MIRROR_RACE_BYTES, COLLECTION_PAGE_SIZE,
+    console
+)
+
+
+class AsyncBiliEngine:
+    """异步下载引擎，所有协程都应在同一个事件循环中运行
+
+    并发上限与线程版一致：api_concurrency 限制playurl接口调用，
+    transfer_concurrency 限制CDN传输，postprocess_workers 限制同时运行的ffmpeg进程。
+    """
+
+    def __init__(self, downloader: BiliDownloader):
+        if aiohttp is None:
+            raise ImportError("asyncio引擎需要安装aiohttp: pip install aiohttp")
+        self.downloader = downloader
+        self.session = None
+        # 主机类别 -> {"requests", "connections"}，由 aiohttp 的请求追踪回调在事件循环线程中累加
+        self.connection_stats = {}
+        self.reset_limits()
+
+    @property
+    def config(self) -> Dict:
+        return self.downloader.config
+
+    def reset_limits(self):
+        """根据配置重建并发上限，设置变更后调用"""
+        self.api_semaphore = asyncio.Semaphore(max(1, int(self.config.get("api_concurrency", 4))))
+        self.transfer_semaphore = asyncio.Semaphore(max(1, int(self.config.get("transfer_concurrency", 8))))
+        self.ffmpeg_semaphore = asyncio.Semaphore(self.downloader.postprocessor.max_workers)
+
+    def _status(self, message: str):
+        if self.downloader.status_callback:
+            self.downloader.status_callback(message)
+
+    async def _get_session(self) -> "aiohttp.ClientSession":
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=int(self.config.get("async_connection_limit", 100)))
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_request_start.append(self._on_request_start)
+            trace_config.on_connection_create_end.append(self._on_connection_create_end)
+            self.session = aiohttp.ClientSession(connector=connector, trace_configs=[trace_config])
+        return self.session
+
+    async def _on_request_start(self, session, context, params):
+        context.stats = self.connection_stats.setdefault(
+            self.downloader.rate_limiter.classify(str(params.url)), {"requests": 0, "connections": 0})
+        context.stats["requests"] += 1
+
+    async def _on_connection_create_end(self, session, context, params):
+        context.stats["connections"] += 1
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def _proxy(self, url: str) -> Optional[str]:
+        """aiohttp每个请求只接受一个代理地址，按URL协议从proxies配置中选取"""
+        proxies = self.downloader.proxies or {}
+        return proxies.get(urlparse(url).scheme)
+
+    async def request(self, method: str, url: str, headers: Optional[Dict] = None,
+                      timeout: float = 30, max_retries: int = 5) -> "aiohttp.ClientResponse":
+        """带限速与重试的请求，重试策略与 _safe_request 一致
+
+        Args:
+            method: 请求方法
+            url: 请求URL
+            headers: 额外的请求头
+            timeout: 连接与读取超时（秒）
+            max_retries: 最大尝试次数
+
+        Returns:
+            尚未读取响应体的响应，调用方负责关闭
+        """
+        session = await self._get_session()
+        rate_limiter = self.downloader.rate_limiter
+        client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        host_class = rate_limiter.classify(url)
+        last_error = None
+
+        for retry in range(max_retries):
+            if retry > 0:
+                await asyncio.sleep(random.uniform(1, 3) * retry)
+
+            wait_time = rate_limiter.reserve(url)
+            if wait_time > 0:
+                await asyncio.sleep(wait_time)
+
+            # 与 _safe_request 相同：随机选一套预生成的请求头，调用方指定的其他请求头优先
+            base_headers = request_headers(host_class)
+            if headers:
+                merged_headers = dict(base_headers)
+                merged_headers.update(headers)
+                merged_headers["User-Agent"] = base_headers["User-Agent"]
+            else:
+                merged_headers = base_headers
+            try:
+                response = await session.request(method, url, headers=merged_headers, timeout=client_timeout,
+                                                 proxy=self._proxy(url))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                last_error = e
+                self._status(f"网络错误: {str(e) or type(e).__name__} 重试({retry+1}/{max_retries})")
+                if retry < max_retries - 1:
+                    await asyncio.sleep(min(4 * (retry + 1), 20))
+                continue
+
+            status = response.status
+            rate_limiter.report(url, status)
+            if status < 400:
+                return response
+
+            response.release()
+            last_error = Exception(f"HTTP错误 {status}: {url}")
+            if status == 412:
+                self._status(f"触发反爬机制，降低请求速率至 {rate_limiter.current_rate(url)}/s "
+                             f"(尝试 {retry+1}/{max_retries})")
+                await asyncio.sleep(5 + 5 * (retry + 1))
+            elif status == 403:
+                self._status(f"访问被拒绝，可能需要登录... (尝试 {retry+1}/{max_retries})")
+                await asyncio.sleep(3 + 3 * (retry + 1))
+            elif status == 429:
+                wait_time = min(2 ** (retry + 1), 60)
+                self._status(f"请求频繁，等待{wait_time}秒 (尝试 {retry+1}/{max_retries})")
+                await asyncio.sleep(wait_time)
+            elif status in (500, 502, 503):
+                wait_time = min(2 ** (retry + 1), 30)
+                self._status(f"服务器错误，等待{wait_time}秒 (尝试 {retry+1}/{max_retries})")
+                await asyncio.sleep(wait_time)
+            elif retry < max_retries - 1:
+                self._status(f"HTTP错误 {status}，重试中 ({retry+1}/{max_retries})")
+                await asyncio.sleep(2 * (retry + 1))
+
+        if self.downloader.error_callback:
+            self.downloader.error_callback("request", f"请求失败: {url}")
+        raise Exception(f"请求失败，已达到最大重试次数: {url} ({last_error})")
+
+    async def get_json(self, url: str) -> Dict:
+        response = await self.request("GET", url)
+        async with response:
+            return await response.json(content_type=None)
+
+    async def single_flight(self, key: tuple, func, *args):
+        """协程版 SingleFlight.do，与线程中的调用共用同一张进行中的请求表"""
+        flights = self.downloader.single_flight
+        while True:
+            future, leader = flights.acquire(key)
+            if not leader:
+                try:
+                    # shield：本协程被取消时不取消共用的请求
+                    return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(future)))
+                except asyncio.CancelledError:
+                    if future.cancelled():
+                        # 发出请求的协程被取消，由本调用方重新发出
+                        continue
+                    raise
+            try:
+                result = await func(*args)
+            except asyncio.CancelledError:
+                flights.release(key, future)
+                future.cancel()
+                raise
+            except BaseException as e:
+                flights.release(key, future)
+                future.set_exception(e)
+                raise
+            flights.release(key, future)
+            future.set_result(result)
+            return result
+
+    async def get_view_data(self, bvid: str) -> Dict:
+        """异步版 _get_view_data，共用同一个API缓存"""
+        data = self.downloader.api_cache.get("view", bvid)
+        if data is not None:
+            return data
+        return await self.single_flight(("view", bvid), self._fetch_view_data, bvid)
+
+    async def _fetch_view_data(self, bvid: str) -> Dict:
+        api_base = self.downloader.api_base
+        data = self.downloader._parse_view_response(
+            await self.get_json(f"{api_base}/x/web-interface/view?bvid={bvid}")
+        )
+        self.downloader.api_cache.set("view", bvid, data)
+        return data
+
+    async def get_video_info(self, bvid: str) -> Dict:
+        """异步版 get_video_info"""
+        max_retries = 3
+        for retry_count in range(1, max_retries + 1):
+            try:
+                data = await self.get_view_data(bvid)
+                return self.downloader._build_video_info(bvid, data)
+            except Exception as e:
+                if retry_count < max_retries:
+                    self._status(f"获取视频信息失败，正在重试({retry_count}/{max_retries})...")
+                    await asyncio.sleep(2)
+                else:
+                    if self.downloader.error_callback:
+                        self.downloader.error_callback(bvid, f"获取视频信息失败: {str(e)}")
+                    raise ValueError(f"无法获取视频信息: {str(e)}")
+
+        raise ValueError("获取视频信息失败，已达到最大重试次数")
+
+    async def get_collection_info(self, collection_id: str, collection_type: str) -> Dict:
+        """异步版 get_collection_info，分集顺序与合集中的顺序一致"""
+        info, pages = await self.resolve_collection(collection_id, collection_type)
+        if collection_type == "bvid":
+            info["pages"] = pages
+        else:
+            info["pages"] = [page async for page in pages]
+        return info
+
+    async def resolve_collection(self, collection_id: str, collection_type: str):
+        """异步版 resolve_collection，UGC合集返回分P列表，收藏夹与课程返回异步迭代器"""
+        if collection_type == "bvid":
+            data = await self.get_view_data(collection_id)
+            info = self.downloader._build_season_info(collection_id, data)
+            return info, info.pop("pages")
+
+        meta = await self._get_collection_meta(collection_id, collection_type)
+        info = {
+            "bvid": "",
+            "title": self.downloader.sanitize_filename(meta.get("title") or f"{collection_type}_{collection_id}"),
+            "author": meta.get("author") or "未知UP主",
+            "author_mid": meta.get("author_mid", ""),
+            "type": VideoType.COLLECTION
+        }
+        return info, self.iter_collection_episodes(collection_id, collection_type, int(meta.get("total") or 1))
+
+    async def iter_collection_episodes(self, collection_id: str, collection_type: str, total_pages: int,
+                                       read_ahead: int = None):
+        """异步版 iter_collection_episodes，等待当前分页时最多预读 read_ahead 个分页，按顺序逐个产出分集"""
+        if read_ahead is None:
+            read_ahead = self.config.get("collection_read_ahead", 4)
+        read_ahead = max(0, int(read_ahead))
+        console.print(f"[yellow]检测到合集包含约{total_pages*COLLECTION_PAGE_SIZE}个视频，开始分页获取...[/yellow]")
+
+        idx = 1
+        next_pn = 1
+        window = deque()
+        try:
+            while window or next_pn <= total_pages:
+                while next_pn <= total_pages and len(window) <= read_ahead:
+                    window.append((next_pn, asyncio.ensure_future(
+                        self._get_collection_page(collection_id, collection_type, next_pn)
+                    )))
+                    next_pn += 1
+
+                pn, task = window.popleft()
+                try:
+                    episodes = await task
+                except Exception as e:
+                    console.print(f"[red]分页获取失败: {str(e)}[/red]")
+                    # 跳过的分页仍占用序号，后续分集的p与文件名保持不变
+                    idx = pn * COLLECTION_PAGE_SIZE + 1
+                    continue
+                for ep in episodes:
+                    yield self.downloader._episode_to_page(ep, idx)
+                    idx += 1
+        finally:
+            # 调用方提前结束迭代时取消尚未完成的预读
+            for _, task in window:
+                task.cancel()
+
+    async def _get_collection_meta(self, collection_id: str, collection_type: str) -> Dict:
+        cache_key = f"{collection_type}:{collection_id}:meta"
+        cached = self.downloader.api_cache.get("collection", cache_key)
+        if cached is not None:
+            return cached
+        try:
+            return await self.single_flight(("collection", cache_key), self._fetch_collection_meta,
+                                            collection_id, collection_type, cache_key)
+        except Exception:
+            return {"total": 1}
+
+    async def _fetch_collection_meta(self, collection_id: str, collection_type: str, cache_key: str) -> Dict:
+        response_json = await self.get_json(self.downloader._collection_api_url(collection_id, collection_type))
+        meta = self.downloader._parse_collection_meta(collection_type, response_json)
+        self.downloader.api_cache.set("collection", cache_key, meta)
+        return meta
+
+    async def _get_collection_page(self, collection_id: str, collection_type: str, pn: int) -> list:
+        cache_key = f"{collection_type}:{collection_id}:{pn}"
+        cached = self.downloader.api_cache.get("collection", cache_key)
+        if cached is not None:
+            return cached
+        return await self.single_flight(("collection", cache_key), self._fetch_collection_page,
+                                        collection_id, collection_type, pn, cache_key)
+
+    async def _fetch_collection_page(self, collection_id: str, collection_type: str, pn: int,
+                                     cache_key: str) -> list:
+        api_url = self.downloader._collection_api_url(collection_id, collection_type, pn)
+        for retry in range(1, 4):
+            try:
+                episodes = self.downloader._parse_collection_page(collection_type, await self.get_json(api_url))
+                self.downloader.api_cache.set("collection", cache_key, episodes)
+                return episodes
+            except Exception:
+                await asyncio.sleep(retry * 1.5)
+        raise Exception(f"分页{pn}获取失败")
+
+    async def get_playurl(self, bvid: str, cid: int, qn: int = 112, fnval: int = 16) -> Dict:
+        """异步版 _get_playurl，共用同一个playurl缓存"""
+        key = (bvid, cid, qn, fnval)
+        data = self.downloader._lookup_playurl(key)
+        if data is not None:
+            return data
+
+        fetched = []
+
+        async def fetch():
+            fetched.append(True)
+            return await self._fetch_playurl(key)
+
+        data = await self.single_flight(("playurl",) + key, fetch)
+        self.downloader._count_playurl_lookup(bool(fetched))
+        return data
+
+    async def _fetch_playurl(self, key: tuple) -> Dict:
+        bvid, cid, qn, fnval = key
+        error_msgs = []
+        for api_url in self.downloader._playurl_api_urls(bvid, cid, qn, fnval):
+            try:
+                async with self.api_semaphore:
+                    response_json = await self.get_json(api_url)
+                data = self.downloader._parse_playurl_response(response_json)
+                self.downloader._store_playurl(key, data)
+                return data
+            except Exception as e:
+                error_msgs.append(str(e))
+
+        raise Exception("无法获取下载地址: " + "; ".join(error_msgs))
+
+    async def run_ffmpeg(self, job_name: str, cmd: List[str]) -> bytes:
+        """以子进程方式异步执行ffmpeg/ffprobe，stderr记录到后处理器的任务日志
+
+        Returns:
+            标准输出内容
+
+        Raises:
+            FFmpegError: 命令返回非零退出码
+        """
+        async with self.ffmpeg_semaphore:
+            process = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+        self.downloader.postprocessor.record_log(job_name, stderr)
+        if process.returncode != 0:
+            raise FFmpegError(process.returncode, cmd, stdout, stderr)
+        return stdout
+
+    async def _probe_audio_codec(self, audio_path: Path) -> Optional[str]:
+        try:
+            stdout = await self.run_ffmpeg(f"probe_{audio_path.name}", self.downloader._probe_command(audio_path))
+        except (OSError, FFmpegError):
+            return None
+        return stdout.decode('utf-8', errors='ignore').strip().lower() or None
+
+    async def _mux_streams(self, video_path: Path, audio_path: Path, output_path: Path) -> str:
+        """异步版 _mux_streams，返回 "copy" 或 "transcode" """
+        downloader = self.downloader
+        codec = await self._probe_audio_codec(audio_path)
+        if codec is None or codec in MP4_COPY_AUDIO_CODECS:
+            try:
+                await self.run_ffmpeg(f"mux_{output_path.name}",
+                                      downloader._mux_command(video_path, audio_path, output_path, transcode=False))
+                with downloader.lock:
+                    downloader.merge_stats["copy"] += 1
+                return "copy"
+            except FFmpegError:
+                self._status(f"音频({codec or '未知编码'})无法直接封装，改为转码...")
+
+        await self.run_ffmpeg(f"mux_{output_path.name}",
+                              downloader._mux_command(video_path, audio_path, output_path, transcode=True))
+        with downloader.lock:
+            downloader.merge_stats["transcode"] += 1
+        return "transcode"
+
+    async def _convert_to_mp3(self, input_path: Path, output_path: Path) -> bool:
+        """异步版 _convert_to_mp3"""
+        self._status(f"转换音频格式: {output_path.name}")
+        temp_path = output_path.with_name(output_path.stem + "_converting.mp3")
+        await self.run_ffmpeg(f"convert_{output_path.name}", self.downloader._mp3_command(input_path, temp_path))
+
+        if temp_path.exists() and temp_path.stat().st_size > 0:
+            os.replace(temp_path, output_path)
+            if input_path.exists():
+                input_path.unlink()
+            return True
+        return False
+
+    async def direct_download(self, info: Dict, page: Dict, quality: DownloadQuality,
+                              content_type: DownloadContent, download_dir: Path) -> bool:
+        """异步版 _direct_download，下载、合并与转码都不占用额外线程
+
+        Args:
+            info: 视频信息
+            page: 分P信息
+            quality: 下载质量
+            content_type: 下载内容类型
+            download_dir: 下载目录
+
+        Returns:
+            是否下载成功
+        """
+        downloader = self.downloader
+        try:
+            output_filename = downloader._output_filename(page)
+            if content_type == DownloadContent.VIDEO:
+                output_path = download_dir / f"{output_filename}.mp4"
+                file_type = "视频"
+            elif content_type == DownloadContent.AUDIO:
+                output_path = download_dir / f"{output_filename}.mp3"
+                file_type = "音频"
+            else:
+                return False
+
+            if output_path.exists() and output_path.stat().st_size > 0:
+                self._status(f"文件已存在: {output_path.name}")
+                return True
+
+            self._status(f"获取{file_type}下载地址...")
+            selector = downloader._create_stream_selector(quality)
+            api_data = await self.get_playurl(page.get('bvid') or info['bvid'], page['cid'], qn=selector.qn, fnval=4048)
+
+            video_url = None
+            audio_url = None
+            dash = api_data.get('dash') or {}
+            durl = api_data.get('durl') or []
+
+            audio_stream = selector.select_audio(dash.get('audio') or [])
+            if audio_stream:
+                audio_url = downloader._stream_urls(audio_stream)
+
+            if content_type == DownloadContent.AUDIO:
+                if not audio_url and durl:
+                    audio_url = downloader._stream_urls(durl[0])
+                if not audio_url:
+                    raise Exception("无法获取音频下载地址")
+            else:
+                video_stream = selector.select_video(dash.get('video') or []) if audio_url else None
+                if video_stream:
+                    video_url = downloader._stream_urls(video_stream)
+                    self._status(
+                        f"选择视频流: 清晰度{video_stream.get('id')} {video_stream.get('codecs', '')} "
+                        f"{video_stream.get('width', '?')}x{video_stream.get('height', '?')}"
+                    )
+                elif durl:
+                    video_url = downloader._stream_urls(durl[0])
+                    audio_url = None
+                if not video_url:
+                    raise Exception("无法获取视频下载地址")
+
+            headers = {
+                'Referer': 'https://www.bilibili.com',
+                'Range': 'bytes=0-'
+            }
+
+            if content_type == DownloadContent.AUDIO:
+                self._status(f"开始下载音频: {output_path.name}")
+                audio_source = download_dir / f"{output_filename}_audio_src.m4a"
+                if not audio_source.exists():
+                    await self.download_file(audio_url, audio_source, headers, f"download_{page['p']}_audio")
+                await self._convert_to_mp3(audio_source, output_path)
+            elif video_url and audio_url:
+                self._status(f"开始下载视频: {output_path.name}")
+                video_temp = download_dir / f"{output_filename}_video_temp.mp4"
+                audio_temp = download_dir / f"{output_filename}_audio_temp.m4a"
+                streams = [
+                    (video_url, video_temp, f"download_{page['p']}_video"),
+                    (audio_url, audio_temp, f"download_{page['p']}_audio")
+                ]
+                await asyncio.gather(*[
+                    self.download_file(url, path, headers, task_id)
+                    for url, path, task_id in streams if not path.exists()
+                ])
+                await self._merge(video_temp, audio_temp, output_path,
+                                  download_dir / f"{output_filename}_merging.mp4", api_data, headers, page)
+            else:
+                self._status(f"开始下载视频: {output_path.name}")
+                await self.download_file(video_url, output_path, headers, f"download_{page['p']}_video")
+
+            downloader._verify_output(output_path, file_type)
+            return True
+
+        except Exception as e:
+            downloader._report_download_error(page, content_type, e)
+            return False
+
+    async def _merge(self, video_temp: Path, audio_temp: Path, output_path: Path, merge_temp: Path,
+                     api_data: Dict, headers: Dict, page: Dict):
+        """合并音视频流，失败时改为直接下载durl中的完整视频"""
+        self._status(f"合并视频和音频: {output_path.name}")
+        try:
+            audio_mode = await self._mux_streams(video_temp, audio_temp, merge_temp)
+            os.replace(merge_temp, output_path)
+            mode_text = "音频直接复制" if audio_mode == "copy" else "音频转码为AAC"
+            self._status(f"合并完成({mode_text}): {output_path.name}")
+            for temp in (video_temp, audio_temp):
+                if temp.exists():
+                    temp.unlink()
+        except Exception as e:
+            self._status(f"合并视频失败: {str(e)}，尝试直接下载...")
+            if not api_data.get('durl'):
+                raise Exception(f"无法合并视频和音频: {str(e)}")
+            direct_urls = self.downloader._stream_urls(api_data['durl'][0])
+            await self.download_file(direct_urls, output_path, headers, f"download_{page['p']}_direct")
+
+    async def download_file(self, url: Union[str, List[str]], output_path: Path, headers: Dict,
+                            task_id: str) -> bool:
+        """异步版 _download_file
+
+        断点记录格式与线程版相同（.part 与 .part.json），两种引擎可以互相续传。
+        大文件按 segment_count 拆分为多个协程同时下载；镜像排序、测速与故障切换复用 MirrorManager。
+        """
+        urls = [url] if isinstance(url, str) else list(url)
+        async with self.transfer_semaphore:
+            page_task = current_page_task.get()
+            progress = self.downloader.progress_bus.task(task_id, label=output_path.name,
+                                                         group=page_task["key"] if page_task else None)
+            try:
+                result = await self._transfer_file(urls, output_path, headers, progress)
+            except BaseException:
+                progress.finish(False)
+                raise
+            progress.finish(result)
+            return result
+
+    async def _transfer_file(self, urls: List[str], output_path: Path, headers: Dict,
+                             progress: TaskCounter) -> bool:
+        downloader = self.downloader
+        mirror_manager = downloader.mirror_manager
+        part_path = output_path.with_name(output_path.name + ".part")
+        state_path = output_path.with_name(output_path.name + ".part.json")
+
+        if len(urls) > 1:
+            urls = await self._order_mirrors(urls, headers)
+
+        total_size, accept_ranges, etag = 0, False, None
+        for index, url in enumerate(urls):
+            total_size, accept_ranges, etag = await self._probe_remote_size(url, headers)
+            if total_size or accept_ranges:
+                urls = urls[index:] + urls[:index]
+                break
+            mirror_manager.record_failure(url)
+
+        state = downloader._load_part_state(state_path)
+        if state and not (
+            accept_ranges
+            and part_path.exists()
+            and state.get("total_size") == total_size
+            and state.get("etag") == etag
+        ):
+            state = None
+        if state is None:
+            state = {"etag": etag, "total_size": total_size, "completed": []}
+            if part_path.exists():
+                part_path.unlink()
+        else:
+            done = sum(end - start + 1 for start, end in state["completed"])
+            self._status(f"继续未完成的下载: {output_path.name} ({done}/{total_size} 字节)")
+
+        segment_count = int(self.config.get("segment_count", 1) or 1)
+        if segment_count > 1 and accept_ranges and total_size >= SEGMENT_MIN_SIZE:
+            await self._segmented_download(urls, part_path, state_path, state, headers, progress, segment_count)
+        else:
+            for index, url in enumerate(urls):
+                try:
+                    await self._stream_download(url, part_path, state_path, state, headers, progress,
+                                                accept_ranges, fallbacks=urls[index + 1:])
+                    break
+                except DownloadCancelled:
+                    raise
+                except Exception as e:
+                    if index == len(urls) - 1:
+                        raise
+                    if not isinstance(e, SlowMirrorError):
+                        mirror_manager.record_failure(url)
+                    self._status(f"切换镜像 {MirrorManager.host(urls[index + 1])}: {str(e)}")
+
+        actual_size = part_path.stat().st_size
+        expected_size = state["total_size"]
+        if expected_size and actual_size != expected_size:
+            raise Exception(f"文件长度校验失败: {actual_size}/{expected_size} 字节")
+        os.replace(part_path, output_path)
+        if state_path.exists():
+            state_path.unlink()
+        return True
+
+    async def _order_mirrors(self, urls: List[str], headers: Dict) -> List[str]:
+        """异步版 _order_mirrors，各镜像同时请求前若干字节测速"""
+        mirror_manager = self.downloader.mirror_manager
+        if all(mirror_manager.is_known(url) for url in urls):
+            return mirror_manager.rank(urls)
+
+        async def race(url):
+            race_headers = dict(headers)
+            race_headers['Range'] = f'bytes=0-{MIRROR_RACE_BYTES - 1}'
+            start = time.monotonic()
+            try:
+                response = await self.request("GET", url, headers=race_headers, timeout=10, max_retries=1)
+                async with response:
+                    received = 0
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        received += len(chunk)
+                        if received >= MIRROR_RACE_BYTES:
+                            break
+                mirror_manager.record(url, received, time.monotonic() - start)
+            except Exception:
+                mirror_manager.record_failure(url)
+
+        await asyncio.gather(*[race(url) for url in urls])
+        ranked = mirror_manager.rank(urls)
+        self._status(f"镜像测速完成，使用 {MirrorManager.host(ranked[0])}")
+        return ranked
+
+    async def _probe_remote_size(self, url: str, headers: Dict) -> tuple:
+        """异步版 _probe_remote_size，返回 (文件总字节数, 是否支持分段请求, ETag)"""
+        probe_headers = dict(headers)
+        probe_headers['Range'] = 'bytes=0-0'
+        try:
+            response = await self.request("GET", url, headers=probe_headers, timeout=15)
+        except Exception:
+            return 0, False, None
+
+        async with response:
+            etag = response.headers.get('ETag')
+            content_range = response.headers.get('Content-Range', '')
+            if response.status == 206 and '/' in content_range:
+                # 读完1字节的响应体，连接才能放回连接池
+                await response.read()
+                total = content_range.rsplit('/', 1)[-1].strip()
+                if total.isdigit():
+                    return int(total), True, etag
+            return int(response.headers.get('Content-Length', 0)), False, etag
+
+    async def _stream_download(self, url: str, part_path: Path, state_path: Path, state: Dict,
+                               headers: Dict, progress: TaskCounter, accept_ranges: bool,
+                               fallbacks: List[str] = ()):
+        """异步版 _stream_download，单连接下载并从已完成的前缀继续"""
+        downloader = self.downloader
+        completed = state["completed"]
+        resume_from = completed[0][1] + 1 if accept_ranges and completed and completed[0][0] == 0 else 0
+        min_speed = float(self.config.get("mirror_min_speed", 0) or 0)
+        check_interval = float(self.config.get("mirror_check_interval", 5))
+
+        request_headers = dict(headers)
+        request_headers['Range'] = f'bytes={resume_from}-'
+        progress.host = MirrorManager.host(url)
+        response = await self.request("GET", url, headers=request_headers)
+
+        async with response:
+            if response.status not in (200, 206):
+                raise Exception(f"下载请求失败: HTTP {response.status}")
+            if response.status == 200:
+                resume_from = 0
+            elif state["total_size"] and not response.headers.get('Content-Range', '').endswith(f"/{state['total_size']}"):
+                raise Exception("镜像返回的文件长度与记录不一致")
+            if not state["total_size"]:
+                state["total_size"] = resume_from + int(response.headers.get('Content-Length', 0))
+            total_size = state["total_size"]
+
+            downloaded = resume_from
+            last_progress_time = time.time()
+            progress.update(0, total_size - resume_from)
+            window_start, window_bytes = time.monotonic(), 0
+            throttle = downloader._throttle(url)
+            # 写盘由后台写入器完成，事件循环只把数据复制进缓冲区
+            writer, preallocated = downloader._open_disk_writer(part_path, resume_from, total_size)
+            stream = WriteStream(writer, resume_from)
+            try:
+                async for chunk in response.content.iter_chunked(1024 * 1024):
+                    await self._write_chunk(stream, chunk)
+                    downloaded += len(chunk)
+                    window_bytes += len(chunk)
+                    progress.add(len(chunk))
+
+                    # 带宽限制的等待不计入镜像吞吐量
+                    wait_time = throttle.consume(len(chunk))
+                    if wait_time > 0:
+                        await asyncio.sleep(wait_time)
+                        window_start += wait_time
+
+                    window_elapsed = time.monotonic() - window_start
+                    if window_elapsed >= check_interval:
+                        downloader.mirror_manager.record(url, window_bytes, window_elapsed)
+                        if (window_bytes / window_elapsed < min_speed
+                                and downloader.mirror_manager.has_better(url, fallbacks)):
+                            raise SlowMirrorError(
+                                f"镜像速度过低: {window_bytes / window_elapsed / 1024:.0f}KB/s"
+                            )
+                        window_start, window_bytes = time.monotonic(), 0
+
+                    current_time = time.time()
+                    if current_time - last_progress_time >= 0.2:
+                        downloader._check_cancelled()
+                        written = writer.end
+                        await self._checkpoint(writer)
+                        state["completed"] = [[0, written - 1]] if written else []
+                        downloader._save_part_state(state_path, state)
+                        last_progress_time = current_time
+                downloader.mirror_manager.record(url, window_bytes, time.monotonic() - window_start)
+                stream.flush()
+                await asyncio.get_running_loop().run_in_executor(None, writer.flush)
+            finally:
+                stream.flush()
+                # 等待剩余的写入在线程池中完成，预分配的文件截断到实际写入的长度
+                await asyncio.get_running_loop().run_in_executor(None, writer.close, preallocated)
+                state["completed"] = [[0, writer.end - 1]] if writer.end else []
+                downloader._save_part_state(state_path, state)
+
+    @staticmethod
+    async def _write_chunk(stream: WriteStream, chunk: bytes):
+        """把数据复制进写入器的缓冲区；缓冲区都在等待写盘时到线程池中等待，不阻塞事件循环"""
+        if stream.would_block(len(chunk)):
+            await asyncio.get_running_loop().run_in_executor(None, stream.write, chunk)
+        else:
+            stream.write(chunk)
+
+    @staticmethod
+    async def _checkpoint(writer):
+        """checkpoint 同步策略下在线程池中 fsync"""
+        if writer.sync_policy == "checkpoint":
+            await asyncio.get_running_loop().run_in_executor(None, writer.checkpoint)
+
+    async def _segmented_download(self, urls: List[str], part_path: Path, state_path: Path, state: Dict,
+                                  headers: Dict, progress: TaskCounter, segment_count: int):
+        """异步版 _segmented_download
+
+        未完成的区间平均分给 segment_count 个协程。单个分段读取超时
+        （segment_stall_timeout）或吞吐过低时，从当前位置换镜像重新请求；
+        断点记录每秒保存一次。
+        """
+        downloader = self.downloader
+        mirror_manager = downloader.mirror_manager
+        stall_timeout = float(self.config.get("segment_stall_timeout", 15))
+        min_speed = float(self.config.get("mirror_min_speed", 0) or 0)
+        check_interval = float(self.config.get("mirror_check_interval", 5))
+        total_size = state["total_size"]
+        completed = downloader._merge_ranges(state["completed"])
+
+        gaps = []
+        cursor = 0
+        for start, end in completed + [[total_size, total_size]]:
+            if start > cursor:
+                gaps.append((cursor, start - 1))
+            cursor = max(cursor, end + 1)
+        missing = sum(end - start + 1 for start, end in gaps)
+
+        segment_size = max(-(-missing // segment_count), 1)
+        segments = []
+        for gap_start, gap_end in gaps:
+            for start in range(gap_start, gap_end + 1, segment_size):
+                segments.append({"start": start, "end": min(start + segment_size - 1, gap_end),
+                                 "pos": start, "written": start})
+        counter = {"downloaded": total_size - missing}
+
+        async def fetch_segment(seg):
+            attempts = 0
+            slow_host = None
+            while seg["pos"] <= seg["end"]:
+                url = mirror_manager.rank(urls, exclude=slow_host)[0]
+                slow_host = None
+                progress.host = MirrorManager.host(url)
+                seg_headers = dict(headers)
+                seg_headers['Range'] = f'bytes={seg["pos"]}-{seg["end"]}'
+                try:
+                    response = await self.request("GET", url, headers=seg_headers, timeout=stall_timeout)
+                    async with response:
+                        if response.status != 206:
+                            raise Exception(f"服务器未返回分段内容: HTTP {response.status}")
+                        if not response.headers.get('Content-Range', '').endswith(f"/{total_size}"):
+                            raise Exception("镜像返回的文件长度与记录不一致")
+
+                        window_start, window_bytes = time.monotonic(), 0
+                        throttle = downloader._throttle(url)
+                        stream = WriteStream(writer, seg["pos"], functools.partial(on_written, seg))
+                        try:
+                            async for chunk in response.content.iter_chunked(256 * 1024):
+                                allowed = min(len(chunk), seg["end"] - seg["pos"] + 1)
+                                if allowed <= 0:
+                                    break
+                                await self._write_chunk(stream, chunk if allowed == len(chunk) else chunk[:allowed])
+                                seg["pos"] += allowed
+
+                                wait_time = throttle.consume(allowed)
+                                if wait_time > 0:
+                                    await asyncio.sleep(wait_time)
+                                    window_start += wait_time
+
+                                window_bytes += allowed
+                                window_elapsed = time.monotonic() - window_start
+                                if window_elapsed >= check_interval:
+                                    mirror_manager.record(url, window_bytes, window_elapsed)
+                                    if (window_bytes / window_elapsed < min_speed
+                                            and mirror_manager.has_better(url, urls)):
+                                        slow_host = MirrorManager.host(url)
+                                        break
+                                    window_start, window_bytes = time.monotonic(), 0
+                            else:
+                                mirror_manager.record(url, window_bytes, time.monotonic() - window_start)
+                        finally:
+                            stream.flush()
+                    attempts = 0
+                except Exception:
+                    if writer.error is not None:
+                        raise
+                    mirror_manager.record_failure(url)
+                    attempts += 1
+                    if attempts >= 5:
+                        raise
+                    await asyncio.sleep(min(2 * attempts, 10))
+
+        def on_written(seg, offset, length):
+            # 在写入线程中计数，计数满即表示数据已全部落盘
+            seg["written"] = offset + length
+            counter["downloaded"] += length
+            progress.add(length)
+
+        async def save_state():
+            written = [[s["start"], s["written"] - 1] for s in segments if s["written"] > s["start"]]
+            await self._checkpoint(writer)
+            state["completed"] = downloader._merge_ranges(completed + written)
+            downloader._save_part_state(state_path, state)
+
+        last_save_time = time.time()
+        progress.update(0, missing)
+        # 临时文件扩展到总长度；每个分段协程至少有一个缓冲区可填充，另有一个等待写盘
+        writer, _ = downloader._open_disk_writer(part_path, total_size, total_size,
+                                                 max(int(self.config.get("disk_buffers", 4)), segment_count + 1))
+        tasks = [asyncio.ensure_future(fetch_segment(seg)) for seg in segments]
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=0.2)
+                current_time = time.time()
+                downloader._check_cancelled()
+                if current_time - last_save_time >= 1:
+                    await save_state()
+                    last_save_time = current_time
+                for task in done:
+                    task.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.get_running_loop().run_in_executor(None, writer.close)
+            await save_state()
+
+        if writer.error is not None:
+            raise writer.error
+        if counter["downloaded"] != total_size:
+            raise Exception(f"分段下载不完整: {counter['downloaded']}/{total_size} 字节")
+
+    async def download_video(self, url: str, quality: DownloadQuality = None, content: List[DownloadContent] = None,
+                             custom_max_workers: int = None, selected_pages: List[int] = None,
+                             on_task_state=None) -> bool:
+        """异步版 download_video，每个下载任务是一个协程，并发数由 max_workers 控制"""
+        downloader = self.downloader
+        try:
+            self._status("正在解析视频信息...")
+            parsed = await asyncio.get_running_loop().run_in_executor(None, downloader.parse_url, url)
+
+            # 合集的分集列表边获取边下载
+            if parsed["type"] == VideoType.COLLECTION:
+                collection_type = "bvid" if "bvid" in parsed else ("ssid" if "ssid" in parsed else "mlid")
+                info, pages = await self.resolve_collection(parsed[collection_type], collection_type)
+            else:
+                info = await self.get_video_info(parsed["bvid"])
+                pages = info['pages'] if info else []
+
+            if not info:
+                raise Exception("无法获取视频信息")
+
+            return await self.download_pages(info, pages, quality, content, custom_max_workers, selected_pages,
+                                             on_task_state)
+
+        except Exception as e:
+            if downloader.error_callback:
+                downloader.error_callback("download", str(e))
+            return False
+
+    async def download_pages(self, info: Dict, pages, quality: DownloadQuality = None,
+                             content: List[DownloadContent] = None, custom_max_workers: int = None,
+                             selected_pages: List[int] = None, on_task_state=None) -> bool:
+        """异步版 download_pages，pages可以是列表或异步迭代器
+
+        合并在 direct_download 内完成，on_task_state 不会收到 muxing 状态。
+        每个分P任务在自己的协程中运行，current_page_task 随协程上下文传递给流下载。
+        """
+        downloader = self.downloader
+        try:
+            quality, content_types = downloader._resolve_download_options(quality, content)
+            output_dir = downloader._output_dir(info)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            self._status(f"准备下载到: {output_dir}")
+
+            max_workers = max(1, int(custom_max_workers or self.config.get("max_workers", 4)))
+            total_tasks = 0
+            progress = {"current": 0, "success": 0}
+            worker_semaphore = asyncio.Semaphore(max_workers)
+            self._status(f"开始下载 (并发 {max_workers})...")
+
+            async def run_task(page, content_type, task):
+                result = False
+                async with worker_semaphore:
+                    if not (downloader.cancel_event.is_set() or task["cancel"].is_set()):
+                        self._status(f"下载中: P{page['p']} - {content_type.value}")
+                        if on_task_state:
+                            on_task_state(page, content_type, "downloading")
+                        current_page_task.set(task)
+                        try:
+                            result = await self.direct_download(info, page, quality, content_type, output_dir)
+                        except Exception as e:
+                            if downloader.error_callback:
+                                downloader.error_callback("download", str(e))
+                if downloader.task_cancels.get(task["key"]) is task["cancel"]:
+                    del downloader.task_cancels[task["key"]]
+                if on_task_state:
+                    if result:
+                        on_task_state(page, content_type, "done")
+                    else:
+                        cancelled = task["cancel"].is_set() or downloader.cancel_event.is_set()
+                        on_task_state(page, content_type, "cancelled" if cancelled else "failed")
+                progress["current"] += 1
+                if result:
+                    progress["success"] += 1
+                if downloader.progress_callback:
+                    downloader.progress_callback("main", progress["current"], total_tasks, 0)
+
+            async def iter_pages():
+                if hasattr(pages, "__aiter__"):
+                    async for page in pages:
+                        yield page
+                elif isinstance(pages, (list, tuple)):
+                    for page in pages:
+                        yield page
+                else:
+                    # 同步迭代器可能在获取分页时阻塞，放到线程池中取下一个
+                    iterator = iter(pages)
+                    loop = asyncio.get_running_loop()
+                    while (page := await loop.run_in_executor(None, next, iterator, None)) is not None:
+                        yield page
+
+            tasks = []
+            try:
+                async for page in iter_pages():
+                    if downloader.cancel_event.is_set():
+                        break
+                    if selected_pages and page['p'] not in selected_pages:
+                        continue
+                    for content_type in content_types:
+                        task = {"key": downloader.page_task_key(page, content_type), "cancel": threading.Event()}
+                        downloader.task_cancels[task["key"]] = task["cancel"]
+                        if on_task_state:
+                            on_task_state(page, content_type, "queued")
+                        tasks.append(asyncio.ensure_future(run_task(page, content_type, task)))
+                        total_tasks += 1
+                if total_tasks == 0:
+                    raise Exception("未选择任何分P")
+                self._status(f"分集列表获取完成，共 {total_tasks} 个文件")
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+            downloader._check_cancelled()
+
+            success_count = progress["success"]
+            if success_count == 0:
+                raise Exception("所有下载任务均失败")
+            if success_count < total_tasks:
+                self._status(f"部分下载完成 ({success_count}/{total_tasks})")
+            else:
+                self._status(f"全部下载完成 ({success_count}/{total_tasks})")
+            return True
+
+        except Exception as e:
+            if downloader.error_callback:
+                downloader.error_callback("download", str(e))
+            return False
+
+
+class AsyncBiliDownloader(BiliDownloader):
+    """使用asyncio引擎的下载器，同步接口与 BiliDownloader 相同
+
+    事件循环运行在后台守护线程中，同步方法把协程提交到该循环并等待结果，
+    因此可以在CLI主线程或GUI的工作线程中直接调用。
+    """
+
+    def __init__(self, status_callback=None, progress_callback=None, error_callback=None):
+        super().__init__(status_callback, progress_callback, error_callback)
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, name="async_engine", daemon=True)
+        self.loop_thread.start()
+        self.engine = self._run(self._create_engine())
+
+    async def _create_engine(self) -> AsyncBiliEngine:
+        return AsyncBiliEngine(self)
+
+    def _run(self, coro):
+        """在后台事件循环中执行协程并阻塞等待结果"""
+        if threading.current_thread() is self.loop_thread:
+            coro.close()
+            raise RuntimeError("不能在事件循环线程中调用同步接口")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def _init_concurrency_limits(self):
+        super()._init_concurrency_limits()
+        if getattr(self, "engine", None) is not None:
+            self.loop.call_soon_threadsafe(self.engine.reset_limits)
+
+    def get_video_info(self, bvid: str) -> Dict:
+        return self._run(self.engine.get_video_info(bvid))
+
+    def get_collection_info(self, collection_id: str, collection_type: str) -> Dict:
+        return self._run(self.engine.get_collection_info(collection_id, collection_type))
+
+    def _direct_download(self, info: Dict, page: Dict, quality: DownloadQuality,
+                         content_type: DownloadContent, download_dir: Path, defer_merge: bool = False):
+        # 异步引擎中合并不占用下载线程，defer_merge 无需区分
+        return self._run(self.engine.direct_download(info, page, quality, content_type, download_dir))
+
+    def _download_file(self, url: Union[str, List[str]], output_path: Path, headers: Dict, task_id: str) -> bool:
+        return self._run(self.engine.download_file(url, output_path, headers, task_id))
+
+    def download_video(self, url: str, quality: DownloadQuality = None, content: List[DownloadContent] = None,
+                       custom_max_workers: int = None, selected_pages: List[int] = None, on_task_state=None):
+        return self._run(self.engine.download_video(url, quality, content, custom_max_workers, selected_pages,
+                                                    on_task_state))
+
+    def download_pages(self, info: Dict, pages, quality: DownloadQuality = None,
+                       content: List[DownloadContent] = None, custom_max_workers: int = None,
+                       selected_pages: List[int] = None, on_task_state=None) -> bool:
+        return self._run(self.engine.download_pages(info, pages, quality, content, custom_max_workers,
+                                                    selected_pages, on_task_state))
+
+    def get_connection_stats(self) -> Dict:
+        """aiohttp 连接池与同步会话（短链接解析等少量请求）的合计"""
+        stats = super().get_connection_stats()
+        by_class = {host_class: {"requests": counts["requests"], "connections": counts["connections"]}
+                    for host_class, counts in stats["classes"].items()}
+        for host_class, counts in list(self.engine.connection_stats.items()):
+            merged = by_class.setdefault(host_class, {"requests": 0, "connections": 0})
+            merged["requests"] += counts["requests"]
+            merged["connections"] += counts["connections"]
+        extra = {key: value for key, value in stats.items()
+                 if key not in ("requests", "connections", "reuse_ratio", "classes")}
+        return HostSessions.summarize(by_class, **extra)
+
+    def fork(self, status_callback=None, progress_callback=None, error_callback=None) -> "AsyncBiliDownloader":
+        """创建单个任务的下载器副本，与原下载器共用事件循环、aiohttp会话和并发配额"""
+        job = super().fork(status_callback, progress_callback, error_callback)
+        # 会话按需创建，先建好再复制，副本才会共用同一个连接池
+        self._run(self.engine._get_session())
+        job.engine = copy.copy(self.engine)
+        job.engine.downloader = job
+        return job
+
+    def close(self):
+        """关闭HTTP会话并停止事件循环"""
+        if self.loop.is_running():
+            self._run(self.engine.close())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
@@ -0,0 +1,42 @@
+"""线程引擎与asyncio引擎的吞吐量对比
+
+对本地模拟服务器下载同一个多P视频，逐级提高并发数（max_workers 与 transfer_concurrency），
+记录耗时、吞吐量、接口调用次数和下载进程内的线程数峰值。
+模拟服务器在子进程中运行，不计入线程数。
+
+用法：python benchmarks/bench_async_engine.py --pages 64 --concurrency 1 4 16 64
+"""
+import argparse
+
+from bench_suite import BenchEnv, run_downloads
+from mock_bilibili import MockOptions, MockProcess
+
+
+def main():
+    parser = argparse.ArgumentParser(description="线程引擎与asyncio引擎的吞吐量对比")
+    parser.add_argument("--pages", type=int, default=64, help="模拟视频的分P数")
+    parser.add_argument("--media-size", type=int, default=1024 * 1024, help="每个分P的字节数")
+    parser.add_argument("--latency", type=float, default=0.05, help="每个响应的固定延迟（秒）")
+    parser.add_argument("--bandwidth", type=int, default=4 * 1024 * 1024, help="单连接带宽上限（字节/秒）")
+    parser.add_argument("--segment-count", type=int, default=1, help="大文件分段数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--engines", nargs="+", default=["threads", "asyncio"])
+    args = parser.parse_args()
+
+    server = MockProcess(MockOptions(pages=args.pages, media_size=args.media_size,
+                                     latency=args.latency, bandwidth=args.bandwidth))
+    try:
+        print(f"{'引擎':<8}{'并发':>6}{'文件':>6}{'耗时(s)':>10}{'MB/s':>9}{'接口调用':>9}{'线程峰值':>9}")
+        for concurrency in args.concurrency:
+            for engine in args.engines:
+                with BenchEnv(server, engine, concurrency, args.segment_count) as env:
+                    r = run_downloads(env, ["https://www.bilibili.com/video/BV1mock"], args.pages)
+                print(f"{r['engine']:<10}{r['concurrency']:>6}{r['files']:>6}{r['seconds']:>10.2f}"
+                      f"{r['mb_per_s']:>9.1f}{r['api_calls']:>11}{r['peak_threads']:>11}"
+                      + ("" if not r["failed_urls"] else "  (失败)"))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
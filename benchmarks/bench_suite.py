@@ -0,0 +1,344 @@
+"""离线基准测试套件
+
+在子进程中启动 mock_bilibili.py 模拟B站接口与CDN，不访问真实的B站，测量以下场景：
+    single      单个大视频（默认64MB，可触发分段下载）
+    collection  500集的UGC合集，另测收藏夹与课程分页接口的元数据获取
+    batch       1000个URL的批量下载，URL写入文件后调用 batch_download_from_file
+
+每个场景报告 MB/s、每个分P的接口调用次数、分P下载耗时的p50/p99，
+以及服务器注入的412/429错误和连接重置次数。
+
+用法：
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --scenarios batch --batch-size 200 --engines threads asyncio
+    python benchmarks/bench_suite.py --error-412 0.01 --reset-rate 0.02 --json results.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rich.console import Console
+from rich.table import Table
+
+from mock_bilibili import MockOptions, MockProcess
+from 音乐批量下载 import DownloadContent, DownloadQuality, create_downloader
+
+console = Console()
+
+
+class ThreadSampler:
+    """后台采样进程内的线程数峰值"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+
+
+class BenchEnv:
+    """在临时目录中创建连接模拟服务器的下载器，并记录每个分P的下载耗时
+
+    Args:
+        server: 模拟服务器
+        engine: "threads" 或 "asyncio"
+        concurrency: 页面并发数、传输并发数与接口并发数
+        segment_count: 大文件分段数
+        rate_limit: 接口限速（请求/秒），默认放开以便测量引擎本身
+    """
+
+    def __init__(self, server: MockProcess, engine: str, concurrency: int, segment_count: int = 4,
+                 rate_limit: float = 10000):
+        self.server = server
+        self.engine = engine
+        self.concurrency = concurrency
+        self.config = {
+            "api_base": server.api_base,
+            "comment_base": server.api_base,
+            "max_workers": concurrency,
+            "transfer_concurrency": concurrency,
+            "api_concurrency": concurrency,
+            "segment_count": segment_count,
+            "async_connection_limit": max(100, concurrency * 2),
+            "rate_limits": {"api": {"rate": rate_limit, "burst": rate_limit, "max_rate": rate_limit}}
+        }
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.old_cwd = os.getcwd()
+        self.workdir = Path(tempfile.mkdtemp(prefix=f"bench_{self.engine}_"))
+        os.chdir(self.workdir)
+        with open("config.json", "w", encoding="utf-8") as f:
+            json.dump(self.config, f)
+        self.downloader = create_downloader(engine=self.engine)
+        self._instrument()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if hasattr(self.downloader, "close"):
+                self.downloader.close()
+            self.downloader.postprocessor.shutdown()
+        finally:
+            os.chdir(self.old_cwd)
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def _record(self, start: float):
+        with self.lock:
+            self.latencies.append(time.perf_counter() - start)
+
+    def _instrument(self):
+        """包装单个分P的下载方法，记录从开始下载到完成（含合并）的耗时"""
+        downloader = self.downloader
+        if hasattr(downloader, "engine"):
+            original = downloader.engine.direct_download
+
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await original(*args, **kwargs)
+                finally:
+                    self._record(start)
+
+            downloader.engine.direct_download = timed
+        else:
+            original = downloader._direct_download
+
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                result = original(*args, **kwargs)
+                if isinstance(result, Future):
+                    result.add_done_callback(lambda _: self._record(start))
+                else:
+                    self._record(start)
+                return result
+
+            downloader._direct_download = timed
+
+    def output_bytes(self) -> tuple:
+        """(输出文件数, 总字节数)"""
+        files = [f for f in (self.workdir / "downloads").rglob("*") if f.is_file()
+                 and f.suffix in (".mp4", ".mp3") and "_temp" not in f.name]
+        return len(files), sum(f.stat().st_size for f in files)
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def diff_stats(before: dict, after: dict) -> dict:
+    return {key: after.get(key, 0) - before.get(key, 0) for key in after}
+
+
+def run_downloads(env: BenchEnv, urls: list, expected_pages: int) -> dict:
+    """逐个下载URL并汇总结果"""
+    def download() -> int:
+        failed_urls = 0
+        for url in urls:
+            ok = env.downloader.download_video(
+                url,
+                quality=DownloadQuality.HIGH_1080,
+                content=[DownloadContent.VIDEO],
+                custom_max_workers=env.concurrency
+            )
+            if not ok:
+                failed_urls += 1
+        return failed_urls
+
+    return measure(env, download, expected_pages)
+
+
+def measure(env: BenchEnv, download, expected_pages: int) -> dict:
+    """执行下载函数（返回失败的URL数）并汇总结果"""
+    before = env.server.stats
+    connections_before = env.downloader.get_connection_stats()["connections"]
+    with ThreadSampler() as sampler:
+        start = time.perf_counter()
+        failed_urls = download()
+        elapsed = time.perf_counter() - start
+    server = diff_stats(before, env.server.stats)
+    connections = env.downloader.get_connection_stats()["connections"] - connections_before
+    files, total_bytes = env.output_bytes()
+    return {
+        "engine": env.engine,
+        "concurrency": env.concurrency,
+        "pages": expected_pages,
+        "files": files,
+        "failed_urls": failed_urls,
+        "seconds": elapsed,
+        "mb_per_s": total_bytes / elapsed / 1024 / 1024 if elapsed else 0,
+        "api_calls": server.get("api", 0),
+        "api_per_page": server.get("api", 0) / expected_pages if expected_pages else 0,
+        "p50": percentile(env.latencies, 50),
+        "p99": percentile(env.latencies, 99),
+        "injected_412": server.get("injected_412", 0),
+        "injected_429": server.get("injected_429", 0),
+        "resets": server.get("resets", 0),
+        "peak_threads": sampler.peak,
+        "connections_per_page": connections / expected_pages if expected_pages else 0
+    }
+
+
+def run_pagination(env: BenchEnv, collection_type: str, collection_id: str, expected_items: int) -> dict:
+    """只获取收藏夹/课程的元数据，测量分页接口"""
+    before = env.server.stats
+    connections_before = env.downloader.get_connection_stats()["connections"]
+    start = time.perf_counter()
+    info = env.downloader.get_collection_info(collection_id, collection_type)
+    elapsed = time.perf_counter() - start
+    server = diff_stats(before, env.server.stats)
+    connections = env.downloader.get_connection_stats()["connections"] - connections_before
+    return {
+        "engine": env.engine,
+        "concurrency": env.concurrency,
+        "pages": expected_items,
+        "files": len(info["pages"]),
+        "failed_urls": 0,
+        "seconds": elapsed,
+        "mb_per_s": 0.0,
+        "api_calls": server.get("api", 0),
+        "api_per_page": server.get("api", 0) / expected_items if expected_items else 0,
+        "p50": 0.0,
+        "p99": 0.0,
+        "injected_412": server.get("injected_412", 0),
+        "injected_429": server.get("injected_429", 0),
+        "resets": 0,
+        "peak_threads": 0,
+        "connections_per_page": connections / expected_items if expected_items else 0
+    }
+
+
+def scenario_single(args) -> list:
+    options = MockOptions(pages=1, media_size=args.single_size, latency=args.latency,
+                          bandwidth=args.bandwidth, **injection_options(args))
+    return [("single", options, lambda env: run_downloads(env, ["https://www.bilibili.com/video/BV1single"], 1))]
+
+
+def scenario_collection(args) -> list:
+    size = args.collection_size
+    options = MockOptions(collection_size=size, media_size=args.media_size, latency=args.latency,
+                          bandwidth=args.bandwidth, **injection_options(args))
+    return [
+        ("collection", options,
+         lambda env: run_downloads(env, [f"https://www.bilibili.com/video/BV1coll{size}"], size)),
+        ("medialist分页", options, lambda env: run_pagination(env, "mlid", "1001", size)),
+        ("pugv分页", options, lambda env: run_pagination(env, "ssid", "2002", size))
+    ]
+
+
+def scenario_batch(args) -> list:
+    urls = [f"https://www.bilibili.com/video/BV1batch{i:05d}" for i in range(args.batch_size)]
+    options = MockOptions(pages=1, media_size=args.media_size, latency=args.latency,
+                          bandwidth=args.bandwidth, **injection_options(args))
+
+    def run(env):
+        url_file = env.workdir / "urls.txt"
+        url_file.write_text("\n".join(urls), encoding="utf-8")
+
+        def download() -> int:
+            counts = env.downloader.batch_download_from_file(
+                url_file, quality_name=DownloadQuality.HIGH_1080.name,
+                content_names=[DownloadContent.VIDEO.name], custom_max_workers=env.concurrency
+            )
+            return counts.get("failed", 0) if counts else len(urls)
+
+        return measure(env, download, len(urls))
+
+    return [("batch", options, run)]
+
+
+SCENARIOS = {
+    "single": scenario_single,
+    "collection": scenario_collection,
+    "batch": scenario_batch
+}
+
+
+def injection_options(args) -> dict:
+    return {"error_412": args.error_412, "error_429": args.error_429, "reset_rate": args.reset_rate,
+            "seed": args.seed}
+
+
+def print_results(results: list):
+    table = Table(title="离线基准测试结果", header_style="bold cyan")
+    for column in ["场景", "引擎", "并发", "分P", "完成", "耗时(s)", "MB/s", "接口调用", "调用/分P",
+                   "p50(s)", "p99(s)", "412/429", "重置", "线程峰值", "新建连接/分P"]:
+        table.add_column(column, justify="right")
+    for r in results:
+        table.add_row(
+            r["scenario"], r["engine"], str(r["concurrency"]), str(r["pages"]),
+            str(r["files"]) if r["files"] == r["pages"] else f"[red]{r['files']}[/red]",
+            f"{r['seconds']:.2f}", f"{r['mb_per_s']:.1f}", str(r["api_calls"]), f"{r['api_per_page']:.2f}",
+            f"{r['p50']:.3f}", f"{r['p99']:.3f}", f"{r['injected_412']}/{r['injected_429']}",
+            str(r["resets"]), str(r["peak_threads"]), f"{r['connections_per_page']:.2f}"
+        )
+    console.print(table)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试套件")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--engines", nargs="+", default=["threads"], help="threads 和/或 asyncio")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--segment-count", type=int, default=4)
+    parser.add_argument("--rate-limit", type=float, default=10000, help="接口限速（请求/秒），默认不限")
+    parser.add_argument("--latency", type=float, default=0.02, help="每个响应的固定延迟（秒）")
+    parser.add_argument("--bandwidth", type=int, default=8 * 1024 * 1024, help="单连接带宽上限（字节/秒）")
+    parser.add_argument("--single-size", type=int, default=64 * 1024 * 1024, help="single场景的文件大小")
+    parser.add_argument("--media-size", type=int, default=256 * 1024, help="合集与批量场景每个分P的大小")
+    parser.add_argument("--collection-size", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--error-412", type=float, default=0.0, help="接口返回412的概率")
+    parser.add_argument("--error-429", type=float, default=0.0, help="接口返回429的概率")
+    parser.add_argument("--reset-rate", type=float, default=0.0, help="媒体传输中途重置连接的概率")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="同时把结果写入JSON文件")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenarios:
+        for label, options, run in SCENARIOS[name](args):
+            server = MockProcess(options)
+            try:
+                for engine in args.engines:
+                    console.print(f"[cyan]运行 {label} ({engine})...[/cyan]")
+                    with BenchEnv(server, engine, args.concurrency, args.segment_count, args.rate_limit) as env:
+                        result = run(env)
+                    result["scenario"] = label
+                    results.append(result)
+            finally:
+                server.stop()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""requests（HTTP/1.1）与 HTTP/2 传输后端的接口吞吐量对比
+
+对本地模拟服务器并发发起 view 与 playurl 接口调用（经由 _safe_request，不经过API缓存），
+逐级提高并发数，记录每秒接口调用数、新建连接数和实际使用HTTP/2的请求比例。
+HTTP/2后端对明文的模拟服务器使用h2c（prior knowledge），需要安装 httpx[http2]。
+
+用法：python benchmarks/bench_transport.py --calls 400 --concurrency 1 8 32 64
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_suite import BenchEnv
+from mock_bilibili import MockOptions, MockProcess
+
+
+def run_calls(env: BenchEnv, calls: int) -> dict:
+    """并发调用 view 和 playurl 接口，返回吞吐量与连接统计"""
+    downloader = env.downloader
+    api_base = env.server.api_base
+
+    def call(index: int) -> bool:
+        if index % 2:
+            url = f"{api_base}/x/player/playurl"
+            params = {"bvid": f"BV1bench{index:05d}", "cid": index, "qn": 80}
+        else:
+            url = f"{api_base}/x/web-interface/view"
+            params = {"bvid": f"BV1bench{index:05d}"}
+        response = downloader._safe_request("GET", url, params=params)
+        return response.json().get("code") == 0
+
+    before = downloader.get_connection_stats()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=env.concurrency) as executor:
+        ok = sum(executor.map(call, range(calls)))
+    elapsed = time.perf_counter() - start
+    after = downloader.get_connection_stats()
+    return {
+        "transport": after["transport"],
+        "concurrency": env.concurrency,
+        "ok": ok,
+        "seconds": elapsed,
+        "calls_per_s": calls / elapsed if elapsed else 0,
+        "connections": after["connections"] - before["connections"],
+        "http2_share": ((after.get("http2_requests", 0) - before.get("http2_requests", 0)) /
+                        max(1, after["requests"] - before["requests"]))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="requests 与 HTTP/2 传输后端的接口吞吐量对比")
+    parser.add_argument("--calls", type=int, default=400, help="每轮的接口调用次数")
+    parser.add_argument("--latency", type=float, default=0.05, help="每个响应的固定延迟（秒）")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--transports", nargs="+", default=["requests", "http2"])
+    args = parser.parse_args()
+
+    server = MockProcess(MockOptions(latency=args.latency))
+    try:
+        print(f"{'传输':<10}{'并发':>6}{'成功':>6}{'耗时(s)':>10}{'调用/s':>9}{'新建连接':>9}{'HTTP/2占比':>11}")
+        for concurrency in args.concurrency:
+            for transport in args.transports:
+                env = BenchEnv(server, "threads", concurrency)
+                env.config.update({"transport": transport, "http2_prior_knowledge": True})
+                with env:
+                    r = run_calls(env, args.calls)
+                print(f"{r['transport']:<10}{r['concurrency']:>6}{r['ok']:>6}{r['seconds']:>10.2f}"
+                      f"{r['calls_per_s']:>10.1f}{r['connections']:>11}{r['http2_share']:>12.0%}"
+                      + ("" if r["transport"] == transport else f"  ({transport}不可用)"))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,537 @@
+"""本地模拟B站接口与CDN，用于基准测试
+
+提供以下接口，响应结构与下载器的解析方式一致：
+    /x/web-interface/view        视频信息；bvid 含 "coll" 时返回带 ugc_season 的合集
+    /x/player/playurl 等         playurl，默认只返回durl（无需ffmpeg），--dash 时返回分离的音视频流
+    /x/v1/medialist/info         收藏夹/系列分页（每页100条，最新的在前）
+    /pugv/view/web/season        课程分页（按课程顺序）
+    /{cid}.xml                   弹幕XML
+    /media/...                   支持Range请求的合成媒体数据，内容按偏移生成，可逐字节校验
+    /__stats                     累计的各接口调用次数、发送字节数和注入的错误数
+
+可注入固定延迟、单连接带宽上限、接口412/429错误以及媒体传输中途的连接重置。
+安装了 h2 时，以HTTP/2连接前言开头的连接按h2c（prior knowledge）处理，
+每个请求流在独立线程中走同一套路由，用于对比HTTP/1.1与HTTP/2传输后端。
+接口地址形如 http://localhost:端口，媒体地址使用 http://127.0.0.1:端口，
+两者主机名不同，下载器的限速器会把媒体请求归为不限速的主机。
+
+单独运行：python benchmarks/mock_bilibili.py --port 8765 --pages 50
+"""
+import argparse
+import http.client
+import json
+import random
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.exceptions
+except ImportError:
+    h2 = None
+
+PAGE_SIZE = 100
+H2_PREFACE = b"PRI * HTTP/2.0\r\n\r\nSM\r\n\r\n"
+
+
+class MockOptions:
+    """模拟服务器参数
+
+    Args:
+        pages: 普通视频的分P数
+        collection_size: 合集、收藏夹和课程包含的视频数
+        media_size: 每个媒体文件的字节数
+        latency: 每个响应前的固定延迟（秒）
+        bandwidth: 单连接带宽上限（字节/秒），0为不限
+        dash: 为True时playurl返回分离的DASH音视频流（合并需要ffmpeg），否则只返回durl
+        error_412: 接口请求返回412的概率
+        error_429: 接口请求返回429的概率
+        reset_rate: 媒体传输到一半时重置连接的概率
+        seed: 错误注入使用的随机种子
+    """
+
+    def __init__(self, pages: int = 1, collection_size: int = 500, media_size: int = 2 * 1024 * 1024,
+                 latency: float = 0.05, bandwidth: int = 0, dash: bool = False, error_412: float = 0.0,
+                 error_429: float = 0.0, reset_rate: float = 0.0, seed: int = 0):
+        self.pages = pages
+        self.collection_size = collection_size
+        self.media_size = media_size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.dash = dash
+        self.error_412 = error_412
+        self.error_429 = error_429
+        self.reset_rate = reset_rate
+        self.seed = seed
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次发送，keep-alive连接上会触发Nagle与延迟确认的约40ms停顿
+    disable_nagle_algorithm = True
+    options = MockOptions()
+    stats = {}
+    lock = threading.Lock()
+    rng = random.Random(0)
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        if h2 is not None and self._peek_h2_preface():
+            H2Session(self).serve()
+            return
+        super().handle()
+
+    def _peek_h2_preface(self) -> bool:
+        """不消耗数据地检查连接是否以HTTP/2连接前言开头"""
+        try:
+            while True:
+                data = self.request.recv(len(H2_PREFACE), socket.MSG_PEEK)
+                if len(data) >= len(H2_PREFACE) or not data or not H2_PREFACE.startswith(data):
+                    return data == H2_PREFACE
+                time.sleep(0.001)
+        except OSError:
+            return False
+
+    def _count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + amount
+
+    def _chance(self, probability: float) -> bool:
+        if probability <= 0:
+            return False
+        with self.lock:
+            return self.rng.random() < probability
+
+    def _send_body(self, body: bytes, content_type: str, status: int = 200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, payload: dict):
+        self._send_body(json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    def _media_url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}/media/{name}"
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        if parsed.path == "/__stats":
+            with self.lock:
+                return self._send_json(dict(self.stats))
+        if self.options.latency:
+            time.sleep(self.options.latency)
+
+        if parsed.path.startswith("/media/"):
+            self._count("media")
+            return self._send_media()
+
+        # 接口请求先按概率注入限流错误
+        self._count("api")
+        if self._chance(self.options.error_412):
+            self._count("injected_412")
+            return self._send_body(b"", "text/plain", status=412)
+        if self._chance(self.options.error_429):
+            self._count("injected_429")
+            return self._send_body(b"", "text/plain", status=429)
+
+        if parsed.path == "/x/web-interface/view":
+            self._count("view")
+            self._send_json({"code": 0, "data": self._view_data(query.get("bvid", "BV1mock"))})
+        elif parsed.path.endswith("/playurl"):
+            self._count("playurl")
+            self._send_json({"code": 0, "data": self._playurl_data(query.get("cid", "0"))})
+        elif parsed.path == "/x/v1/medialist/info":
+            self._count("collection")
+            self._send_json({"code": 0, "data": self._medialist_data(query)})
+        elif parsed.path == "/pugv/view/web/season":
+            self._count("collection")
+            self._send_json({"code": 0, "data": self._pugv_data(query)})
+        elif parsed.path.endswith(".xml"):
+            self._count("comment")
+            self._send_body(self._comment_xml(parsed.path.strip("/")[:-4]), "text/xml")
+        else:
+            self._count("not_found")
+            self._send_body(b"", "text/plain", status=404)
+
+    @staticmethod
+    def _cid(bvid: str, index: int) -> int:
+        """按bvid和序号生成稳定的cid"""
+        return (sum(bvid.encode()) * 100000 + index) % 2 ** 31
+
+    def _episodes(self, prefix: str) -> list:
+        return [
+            {
+                "id": i,
+                "title": f"{prefix}第{i}集",
+                "duration": 60 + i % 240,
+                "cid": self._cid(prefix, i),
+                "bvid": f"BV1ep{i:05d}"
+            } for i in range(1, self.options.collection_size + 1)
+        ]
+
+    def _view_data(self, bvid: str) -> dict:
+        data = {
+            "bvid": bvid,
+            "title": f"模拟视频 {bvid}",
+            "owner": {"name": "模拟UP主", "mid": 1},
+            "videos": self.options.pages,
+            "pages": [
+                {"page": i, "part": f"分P{i}", "duration": 60, "cid": self._cid(bvid, i)}
+                for i in range(1, self.options.pages + 1)
+            ]
+        }
+        if "coll" in bvid:
+            data["ugc_season"] = {"sections": [{"episodes": self._episodes(bvid)}]}
+        return data
+
+    def _playurl_data(self, cid: str) -> dict:
+        size = self.options.media_size
+        if self.options.dash:
+            return {
+                "dash": {
+                    "video": [{"id": 80, "codecid": 7, "codecs": "avc1.640032", "width": 1920, "height": 1080,
+                               "frameRate": "30", "bandwidth": 1000000,
+                               "baseUrl": self._media_url(f"{cid}_video.m4s")}],
+                    "audio": [{"id": 30280, "codecs": "mp4a.40.2", "bandwidth": 320000,
+                               "baseUrl": self._media_url(f"{cid}_audio.m4s")}]
+                }
+            }
+        return {"durl": [{"order": 1, "size": size, "url": self._media_url(f"{cid}.flv")}]}
+
+    @staticmethod
+    def _page_slice(episodes: list, pn: str) -> list:
+        start = (int(pn or 1) - 1) * PAGE_SIZE
+        return episodes[start:start + PAGE_SIZE]
+
+    def _total_pages(self) -> int:
+        # 下载器把total当作分页数使用
+        return max(1, -(-self.options.collection_size // PAGE_SIZE))
+
+    def _medialist_data(self, query: dict) -> dict:
+        prefix = f"ml{query.get('biz_id', '0')}"
+        # 收藏夹按收藏时间倒序，新加入的视频出现在第一页
+        medias = self._page_slice(self._episodes(prefix)[::-1], query.get("pn"))
+        return {"title": f"模拟收藏夹{prefix}", "upper": {"mid": 10001, "name": "模拟UP主"},
+                "total": self._total_pages(), "medias": medias}
+
+    def _pugv_data(self, query: dict) -> dict:
+        prefix = f"ss{query.get('season_id', '0')}"
+        episodes = self._page_slice(self._episodes(prefix), query.get("pn"))
+        return {"title": f"模拟课程{prefix}", "up_info": {"mid": 10002, "uname": "模拟讲师"},
+                "page": {"total": self._total_pages()}, "episodes": episodes}
+
+    def _comment_xml(self, cid: str) -> bytes:
+        items = "".join(f'<d p="{i * 1.5},1,25,16777215,0,0,0,0">弹幕{i}</d>' for i in range(50))
+        return f'<?xml version="1.0" encoding="UTF-8"?><i><chatid>{cid}</chatid>{items}</i>'.encode("utf-8")
+
+    def _send_media(self):
+        size = self.options.media_size
+        start, end = 0, size - 1
+        range_header = self.headers.get("Range", "")
+        if range_header.startswith("bytes="):
+            first, _, last = range_header[6:].partition("-")
+            start = int(first or 0)
+            end = min(int(last), size - 1) if last else size - 1
+        if start >= size:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        length = end - start + 1
+        self.send_response(206 if range_header else 200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.send_header("ETag", f'"mock-{size}"')
+        self.send_header("Accept-Ranges", "bytes")
+        if range_header:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.end_headers()
+
+        # 探测请求（只取1字节）不注入重置
+        reset_at = start + length // 2 if length > 1 and self._chance(self.options.reset_rate) else None
+
+        # 内容按偏移生成，分段下载的结果可以逐字节校验
+        chunk_size = 64 * 1024
+        position = start
+        while position <= end:
+            n = min(chunk_size, end - position + 1)
+            if reset_at is not None and position + n > reset_at:
+                self._count("resets")
+                self._reset_connection()
+                return
+            block = bytes((position + i) % 251 for i in range(min(n, 251)))
+            data = (block * (n // len(block) + 1))[:n]
+            try:
+                self.wfile.write(data)
+            except OSError:
+                return
+            self._count("bytes", n)
+            position += n
+            if self.options.bandwidth:
+                time.sleep(n / self.options.bandwidth)
+
+    def _reset_connection(self):
+        """以RST方式立即断开连接"""
+        self.close_connection = True
+        try:
+            self.wfile.flush()
+            self.request.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self.request.close()
+        except OSError:
+            pass
+
+
+class H2Stream:
+    """以 BaseHTTPRequestHandler 的接口处理一个HTTP/2请求流，与 MockHandler 组合使用"""
+
+    def __init__(self, session: "H2Session", stream_id: int, headers: list):
+        self.session = session
+        self.stream_id = stream_id
+        self.server = session.handler.server
+        self.headers = http.client.HTTPMessage()
+        for name, value in headers:
+            if name == ":path":
+                self.path = value
+            elif name == ":method":
+                self.command = value
+            elif not name.startswith(":"):
+                self.headers[name] = value
+        self.status = 200
+        self.response_headers = []
+        self.wfile = self
+        self.reset = False
+
+    def send_response(self, code, message=None):
+        self.status = code
+
+    def send_header(self, keyword, value):
+        self.response_headers.append((keyword.lower(), str(value)))
+
+    def end_headers(self):
+        self.session.send_headers(self.stream_id, [(":status", str(self.status))] + self.response_headers)
+
+    def write(self, data: bytes):
+        self.session.send_data(self.stream_id, data)
+
+    def flush(self):
+        pass
+
+    def _reset_connection(self):
+        self.reset = True
+        self.session.reset_stream(self.stream_id)
+
+
+class H2Session:
+    """一个h2c连接，接收线程解析帧，每个请求流在独立线程中处理"""
+
+    def __init__(self, handler: MockHandler):
+        self.handler = handler
+        self.sock = handler.request
+        self.conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        self.cond = threading.Condition()
+        self.closed = False
+        self.stream_class = type("H2Handler", (H2Stream, type(handler)), {})
+
+    def _flush(self):
+        data = self.conn.data_to_send()
+        if data:
+            self.sock.sendall(data)
+
+    def serve(self):
+        with self.cond:
+            self.conn.initiate_connection()
+            self._flush()
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                with self.cond:
+                    for event in self.conn.receive_data(data):
+                        if isinstance(event, h2.events.RequestReceived):
+                            threading.Thread(target=self._handle_stream, args=(event.stream_id, event.headers),
+                                             daemon=True).start()
+                        elif isinstance(event, h2.events.ConnectionTerminated):
+                            return
+                    self._flush()
+                    # 窗口更新、设置变化和流重置都可能让等待发送的流继续
+                    self.cond.notify_all()
+        except (OSError, h2.exceptions.ProtocolError):
+            pass
+        finally:
+            with self.cond:
+                self.closed = True
+                self.cond.notify_all()
+
+    def _handle_stream(self, stream_id: int, headers: list):
+        stream = self.stream_class(self, stream_id, headers)
+        try:
+            stream.do_GET()
+            if not stream.reset:
+                with self.cond:
+                    self.conn.end_stream(stream_id)
+                    self._flush()
+        except (OSError, h2.exceptions.ProtocolError):
+            pass
+
+    def send_headers(self, stream_id: int, headers: list):
+        with self.cond:
+            self.conn.send_headers(stream_id, headers)
+            self._flush()
+
+    def send_data(self, stream_id: int, data: bytes):
+        """按流量控制窗口分帧发送，窗口用完时等待客户端的WINDOW_UPDATE"""
+        view = memoryview(data)
+        while view:
+            with self.cond:
+                while True:
+                    if self.closed:
+                        raise OSError("连接已关闭")
+                    try:
+                        window = min(self.conn.local_flow_control_window(stream_id),
+                                     self.conn.max_outbound_frame_size)
+                    except h2.exceptions.StreamClosedError:
+                        raise OSError("流已关闭")
+                    if window > 0:
+                        break
+                    self.cond.wait()
+                size = min(window, len(view))
+                self.conn.send_data(stream_id, view[:size].tobytes())
+                self._flush()
+            view = view[size:]
+
+    def reset_stream(self, stream_id: int):
+        with self.cond:
+            self.conn.reset_stream(stream_id)
+            self._flush()
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 默认的监听队列只有5，高并发建连时会被丢弃并触发秒级的SYN重传
+    request_queue_size = 1024
+
+    def handle_error(self, request, client_address):
+        # 客户端提前断开（镜像切换、分段被收回）和主动注入的重置属于正常情况
+        if not isinstance(sys.exc_info()[1], OSError):
+            super().handle_error(request, client_address)
+
+
+class MockServer:
+    """在当前进程的后台线程中运行的模拟服务器"""
+
+    def __init__(self, options: MockOptions = None, port: int = 0):
+        options = options or MockOptions()
+        handler = type("Handler", (MockHandler,), {
+            "options": options,
+            "stats": {},
+            "lock": threading.Lock(),
+            "rng": random.Random(options.seed)
+        })
+        self.handler = handler
+        self.httpd = QuietHTTPServer(("127.0.0.1", port), handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    @property
+    def api_base(self) -> str:
+        return f"http://localhost:{self.port}"
+
+    @property
+    def stats(self) -> dict:
+        with self.handler.lock:
+            return dict(self.handler.stats)
+
+    def start(self) -> "MockServer":
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class MockProcess:
+    """在子进程中运行模拟服务器，服务器线程不计入被测进程
+
+    Args:
+        options: 模拟服务器参数
+    """
+
+    def __init__(self, options: MockOptions = None):
+        options = options or MockOptions()
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.api_base = f"http://localhost:{self.port}"
+        cmd = [sys.executable, str(Path(__file__).resolve()), "--port", str(self.port)]
+        for name, value in vars(options).items():
+            flag = "--" + name.replace("_", "-")
+            if isinstance(value, bool):
+                cmd += [flag] if value else []
+            else:
+                cmd += [flag, str(value)]
+        self.process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+        for _ in range(50):
+            try:
+                self.stats
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError("模拟服务器启动失败")
+
+    @property
+    def stats(self) -> dict:
+        with urllib.request.urlopen(f"{self.api_base}/__stats", timeout=5) as response:
+            return json.load(response)
+
+    def stop(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+def parse_options(argv=None) -> tuple:
+    """解析命令行参数，返回 (MockOptions, 端口)"""
+    parser = argparse.ArgumentParser(description="本地模拟B站接口与CDN")
+    parser.add_argument("--port", type=int, default=8765)
+    defaults = MockOptions()
+    for name, value in vars(defaults).items():
+        flag = "--" + name.replace("_", "-")
+        if isinstance(value, bool):
+            parser.add_argument(flag, action="store_true")
+        else:
+            parser.add_argument(flag, type=type(value), default=value)
+    args = parser.parse_args(argv)
+    options = MockOptions(**{name: getattr(args, name) for name in vars(defaults)})
+    return options, args.port
+
+
+if __name__ == "__main__":
+    options, port = parse_options()
+    server = MockServer(options, port=port).start()
+    print(f"模拟服务器已启动: {server.api_base}  (Ctrl+C 退出)")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,293 @@
+"""下载数据的后台写盘
+
+下载线程把网络数据读入预先分配的缓冲区，写满的缓冲区交给每个文件一个的后台写入线程，
+写完后缓冲区回到空闲队列重复使用。缓冲区的数量固定，每个传输占用的内存不随文件大小变化；
+磁盘（例如网络存储）短暂卡顿时，网络读取可以继续填充其余缓冲区，
+只有全部缓冲区都在等待写盘时下载线程才会等待。
+
+可选项：
+    preallocate  用 posix_fallocate 预先分配磁盘空间，减少碎片并提前发现空间不足
+                 （不支持的文件系统上 glibc 会写零模拟，网络存储上不建议开启）
+    sync         none 不主动同步；close 文件写完时 fsync；
+                 checkpoint 另外在每次保存断点记录前 fsync，断点记录不会超前于已落盘的数据
+    direct       对齐的整块写入使用 O_DIRECT 绕过页缓存，仅 Linux 可用，文件系统不支持时自动关闭
+"""
+import mmap
+import os
+import queue
+import threading
+from http.client import HTTPException, IncompleteRead
+from typing import Callable, Optional
+
+from requests.exceptions import ChunkedEncodingError, ConnectionError
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# O_DIRECT 要求的缓冲区地址、文件偏移和长度对齐
+DIRECT_ALIGN = 4096
+# 单次从网络读取的最大字节数
+READ_SIZE = 256 * 1024
+SYNC_POLICIES = ("none", "close", "checkpoint")
+
+
+class DiskWriter:
+    """单个文件的后台写入器，线程安全
+
+    Args:
+        path: 文件路径，不存在时创建
+        size: 打开后把文件截断（或扩展）为该长度
+        buffer_size: 每个缓冲区的字节数，向上取整到 DIRECT_ALIGN
+        buffer_count: 缓冲区数量，至少为2
+        sync: 同步策略，见 SYNC_POLICIES
+        direct: 是否对对齐的写入使用 O_DIRECT
+    """
+
+    def __init__(self, path, size: int, buffer_size: int = DEFAULT_BUFFER_SIZE, buffer_count: int = 4,
+                 sync: str = "none", direct: bool = False):
+        self.sync_policy = sync if sync in SYNC_POLICIES else "none"
+        self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o666)
+        os.ftruncate(self.fd, size)
+        self.direct_fd = self._open_direct(path) if direct else None
+        self.buffer_size = max(DIRECT_ALIGN, -(-int(buffer_size) // DIRECT_ALIGN) * DIRECT_ALIGN)
+        # 匿名映射按页对齐，可直接用于 O_DIRECT
+        self.free = queue.Queue()
+        for _ in range(max(2, int(buffer_count))):
+            self.free.put(mmap.mmap(-1, self.buffer_size))
+        self.pending = queue.Queue()
+        # 已成功写入的最远位置
+        self.end = size
+        self.error: Optional[BaseException] = None
+        self.closed = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name="disk-writer", daemon=True)
+        self.thread.start()
+
+    @staticmethod
+    def _open_direct(path) -> Optional[int]:
+        flag = getattr(os, "O_DIRECT", 0)
+        if not flag:
+            return None
+        try:
+            return os.open(path, os.O_WRONLY | flag)
+        except OSError:
+            return None
+
+    def allocate(self, offset: int, length: int) -> bool:
+        """预分配磁盘空间，不支持时返回False"""
+        if length <= 0 or not hasattr(os, "posix_fallocate"):
+            return False
+        try:
+            os.posix_fallocate(self.fd, offset, length)
+            return True
+        except OSError:
+            return False
+
+    def acquire(self) -> mmap.mmap:
+        """取一个空闲缓冲区，全部缓冲区都在等待写盘时阻塞"""
+        buffer = self.free.get()
+        if self.error is not None:
+            self.free.put(buffer)
+            raise self.error
+        return buffer
+
+    def release(self, buffer: mmap.mmap):
+        """归还未使用的缓冲区"""
+        self.free.put(buffer)
+
+    def submit(self, buffer: mmap.mmap, offset: int, length: int,
+               on_written: Callable[[int, int], None] = None):
+        """把缓冲区前 length 字节写到文件的 offset 处，写完后在写入线程中调用 on_written(offset, length)
+
+        写入器已关闭（例如下载已放弃，被接管的慢连接此时才返回）时丢弃数据。
+        """
+        with self.lock:
+            if not self.closed:
+                self.pending.put((buffer, offset, length, on_written))
+                return
+        self.free.put(buffer)
+
+    def _run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                self.pending.task_done()
+                return
+            buffer, offset, length, on_written = item
+            try:
+                if self.error is None:
+                    self._write(buffer, offset, length)
+                    self.end = max(self.end, offset + length)
+                    if on_written:
+                        on_written(offset, length)
+            except BaseException as e:
+                # 记录错误后继续归还缓冲区，下载线程在下次取缓冲区时收到异常
+                self.error = e
+            finally:
+                self.free.put(buffer)
+                self.pending.task_done()
+
+    def _write(self, buffer: mmap.mmap, offset: int, length: int):
+        fd = self.fd
+        if self.direct_fd is not None and offset % DIRECT_ALIGN == 0 and length % DIRECT_ALIGN == 0:
+            fd = self.direct_fd
+        view = memoryview(buffer)[:length]
+        while view:
+            if hasattr(os, "pwrite"):
+                written = os.pwrite(fd, view, offset)
+            else:
+                # 只有写入线程操作文件位置，不需要加锁
+                os.lseek(fd, offset, os.SEEK_SET)
+                written = os.write(fd, view)
+            view = view[written:]
+            offset += written
+
+    def flush(self):
+        """等待已提交的写入全部完成，写入出错时抛出异常"""
+        self.pending.join()
+        if self.error is not None:
+            raise self.error
+
+    def checkpoint(self):
+        """保存断点记录之前调用，checkpoint 策略下把已写入的数据同步到磁盘"""
+        if self.sync_policy == "checkpoint" and not self.closed:
+            os.fsync(self.fd)
+
+    def close(self, trim: bool = False):
+        """等待写入完成并关闭文件，可重复调用；写入错误不在这里抛出，由 acquire()/flush() 抛出
+
+        Args:
+            trim: 为True时把文件截断到已写入的最远位置（用于预分配后未写满的顺序下载）
+        """
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.pending.put(None)
+        self.thread.join()
+        try:
+            if trim:
+                os.ftruncate(self.fd, self.end)
+            if self.sync_policy != "none" and self.error is None:
+                os.fsync(self.fd)
+        finally:
+            os.close(self.fd)
+            if self.direct_fd is not None:
+                os.close(self.direct_fd)
+
+
+class WriteStream:
+    """向文件中一段连续区域顺序写入的生产者端
+
+    数据先填入当前缓冲区，写满后提交给 DiskWriter 并换下一个缓冲区。
+    每个下载连接使用自己的 WriteStream，多个连接可以共用一个 DiskWriter。
+
+    Args:
+        writer: 后台写入器
+        offset: 起始写入位置
+        on_written: 每块数据写盘完成后在写入线程中调用 on_written(offset, length)
+    """
+
+    def __init__(self, writer: DiskWriter, offset: int, on_written: Callable[[int, int], None] = None):
+        self.writer = writer
+        self.offset = offset
+        self.on_written = on_written
+        self.buffer = None
+        self.view = None
+        self.start = offset
+        self.filled = 0
+
+    def space(self) -> memoryview:
+        """当前缓冲区的剩余空间，没有缓冲区时先取一个"""
+        if self.buffer is None:
+            self.buffer = self.writer.acquire()
+            self.view = memoryview(self.buffer)
+            self.start = self.offset
+            self.filled = 0
+        return self.view[self.filled:]
+
+    def would_block(self, length: int) -> bool:
+        """write() 写入 length 字节时是否可能因等待空闲缓冲区而阻塞"""
+        available = 0 if self.buffer is None else len(self.view) - self.filled
+        if length <= available:
+            return False
+        needed = -(-(length - available) // self.writer.buffer_size)
+        return self.writer.free.qsize() < needed
+
+    def commit(self, length: int):
+        """确认 space() 返回的空间中前 length 字节已填入数据"""
+        self.filled += length
+        self.offset += length
+        if self.filled >= len(self.view):
+            self.flush()
+
+    def readinto(self, read: Callable[[memoryview], int]) -> int:
+        """用 read 把数据直接读入缓冲区，返回读到的字节数，0表示数据已读完"""
+        length = read(self.space())
+        if length:
+            self.commit(length)
+        return length
+
+    def write(self, data: bytes):
+        """把已在内存中的数据复制进缓冲区"""
+        data = memoryview(data)
+        while data:
+            space = self.space()
+            length = min(len(space), len(data))
+            space[:length] = data[:length]
+            self.commit(length)
+            data = data[length:]
+
+    def flush(self):
+        """提交当前缓冲区中已填入的数据"""
+        if self.buffer is None:
+            return
+        buffer, self.buffer, self.view = self.buffer, None, None
+        if self.filled:
+            self.writer.submit(buffer, self.start, self.filled, self.on_written)
+        else:
+            self.writer.release(buffer)
+
+
+def response_reader(response, read_size: int = READ_SIZE) -> Callable[[memoryview], int]:
+    """返回把响应体读入给定缓冲区的函数 read(view) -> 字节数，读完时返回0
+
+    未压缩、非分块传输的 requests 响应绕过 urllib3，由 http.client 的 readinto
+    把套接字数据直接读入缓冲区（urllib3 的 readinto 内部仍是 read() 后再复制）；
+    其他响应（压缩、分块或HTTP/2后端）退回 iter_content 并复制进缓冲区。
+    """
+    raw = getattr(response, "raw", None)
+    fp = getattr(raw, "_fp", None)
+    encoding = response.headers.get("Content-Encoding", "identity").lower()
+    if (fp is not None and hasattr(fp, "readinto") and hasattr(raw, "release_conn")
+            and not getattr(raw, "chunked", True) and encoding in ("", "identity")):
+        def read(view: memoryview) -> int:
+            # 与 iter_content 相同的异常类型：超时为 ConnectionError，连接中断为 ChunkedEncodingError
+            try:
+                length = fp.readinto(view[:read_size])
+            except TimeoutError as e:
+                raise ConnectionError(e)
+            except (HTTPException, OSError) as e:
+                raise ChunkedEncodingError(e)
+            if not length and fp.length:
+                # http.client 在长度不足时只返回0，按 urllib3 的 enforce_content_length 报错
+                raise ChunkedEncodingError(IncompleteRead(b"", fp.length))
+            if fp.isclosed():
+                # 响应体已读完，把连接交还给连接池，否则关闭响应时连接会被断开
+                raw.release_conn()
+            return length
+        return read
+
+    chunks = response.iter_content(chunk_size=read_size)
+    leftover = memoryview(b"")
+
+    def read(view: memoryview) -> int:
+        nonlocal leftover
+        while not leftover:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return 0
+            leftover = memoryview(chunk)
+        length = min(len(view), len(leftover))
+        view[:length] = leftover[:length]
+        leftover = leftover[length:]
+        return length
+    return read
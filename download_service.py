@@ -0,0 +1,470 @@
+"""无界面的下载服务
+
+在本地端口上提供HTTP/JSON接口，供脚本和流水线提交、查询和取消下载任务：
+
+    POST   /jobs               提交任务，请求体见 DownloadService.submit
+    GET    /jobs               任务列表
+    GET    /jobs/{id}          任务详情
+    DELETE /jobs/{id}          取消任务
+    GET    /jobs/{id}/events   单个任务的事件流（Server-Sent Events）
+    GET    /events             全部任务的事件流（Server-Sent Events）
+    GET    /metrics            任务统计以及API缓存、限速器、带宽限制、镜像、合并和playurl缓存的统计
+
+所有任务共用同一个长期运行的下载器：HTTP连接池、API缓存、playurl缓存、限速器、
+并发配额和后处理线程池都只有一份，同时运行的任务共享限速和连接。
+每个任务使用 BiliDownloader.fork 得到的副本，拥有独立的回调和取消标志。
+
+配置项（config.json）：
+    service_host / service_port  监听地址，默认 127.0.0.1:8760
+    service_max_jobs             同时运行的任务数，默认 2
+    service_token                非空时请求需带 Authorization: Bearer <token>
+    service_job_history          保留的已结束任务数，默认 200
+
+用法：python download_service.py [--host 127.0.0.1] [--port 8760]
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+from 音乐批量下载 import BiliDownloader, DownloadQuality, DownloadContent, create_downloader, console
+
+JOB_MODES = ("download", "sync", "batch")
+
+
+class Job:
+    """一个下载任务的状态
+
+    state: queued、running、done、failed 或 cancelled
+    """
+
+    def __init__(self, job_id: str, mode: str, url: str, options: Dict):
+        self.id = job_id
+        self.mode = mode
+        self.url = url
+        self.options = options
+        self.state = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.message = ""
+        self.errors = deque(maxlen=50)
+        # 进行中的传输：进度总线的任务编号 -> 快照中的任务信息；以及汇总的速度与剩余时间
+        self.transfers = {}
+        self.aggregate = {"speed": 0.0, "eta": None}
+        # download_pages 报告的文件级进度
+        self.files_done = 0
+        self.files_total = 0
+        self.downloader = None
+        self.last_progress_event = 0.0
+
+    def to_dict(self, detail: bool = False) -> Dict:
+        data = {
+            "id": self.id,
+            "mode": self.mode,
+            "url": self.url,
+            "state": self.state,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "message": self.message,
+            "files_done": self.files_done,
+            "files_total": self.files_total,
+            "speed": round(self.aggregate["speed"] / 1024 / 1024, 3),
+            "eta": self.aggregate["eta"]
+        }
+        if detail:
+            data["options"] = self.options
+            data["errors"] = list(self.errors)
+            data["transfers"] = [
+                {"file": task["label"], "downloaded": task["downloaded"], "total": task["total"],
+                 "speed": round(task["speed"] / 1024 / 1024, 3), "eta": task["eta"]}
+                for task in list(self.transfers.values())
+            ]
+        return data
+
+
+class EventLog:
+    """带序号的事件环形缓冲区，SSE连接按序号读取新事件
+
+    Args:
+        max_events: 保留的事件数，断线重连时可以用 Last-Event-ID 补齐其中的事件
+    """
+
+    def __init__(self, max_events: int = 5000):
+        self.events = deque(maxlen=max_events)
+        self.seq = 0
+        self.condition = threading.Condition()
+
+    def publish(self, job_id: str, event_type: str, data: Dict):
+        with self.condition:
+            self.seq += 1
+            self.events.append((self.seq, job_id, event_type, data))
+            self.condition.notify_all()
+
+    def wait(self, after: int, job_id: Optional[str] = None, timeout: float = 15) -> tuple:
+        """等待序号大于after的事件
+
+        Returns:
+            (事件列表, 当前最新序号)，超时时事件列表为空
+        """
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while True:
+                events = [e for e in self.events if e[0] > after and (job_id is None or e[1] == job_id)]
+                remaining = deadline - time.monotonic()
+                if events or remaining <= 0:
+                    return events, self.seq
+                self.condition.wait(remaining)
+
+
+class DownloadService:
+    """管理任务队列和共用的下载器
+
+    Args:
+        downloader: 共用的下载器，为None时按配置创建
+    """
+
+    def __init__(self, downloader: BiliDownloader = None):
+        self.downloader = downloader or create_downloader()
+        config = self.downloader.config
+        self.max_jobs = max(1, int(config.get("service_max_jobs", 2)))
+        self.history = max(1, int(config.get("service_job_history", 200)))
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.events = EventLog()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix="job")
+        self.started = time.time()
+
+    def submit(self, payload: Dict) -> Job:
+        """提交任务
+
+        Args:
+            payload: {"url": 链接（batch模式为URL文件路径）,
+                      "mode": "download"（默认）、"sync" 或 "batch",
+                      "quality": DownloadQuality 名称, "content": DownloadContent 名称列表,
+                      "max_workers": 分P并发数, "pages": 选中的分P序号列表（download模式）,
+                      "full": 是否忽略水位（sync模式）}
+
+        Returns:
+            新建的任务
+        """
+        url = str(payload.get("url") or "").strip()
+        mode = payload.get("mode", "download")
+        if not url:
+            raise ValueError("缺少url")
+        if mode not in JOB_MODES:
+            raise ValueError(f"mode必须是 {', '.join(JOB_MODES)} 之一")
+        quality = payload.get("quality")
+        if quality is not None and quality not in DownloadQuality.__members__:
+            raise ValueError(f"无效的quality: {quality}")
+        content = payload.get("content")
+        if content is not None and (not isinstance(content, list)
+                                    or any(name not in DownloadContent.__members__ for name in content)):
+            raise ValueError("content必须是 DownloadContent 名称列表")
+        pages = payload.get("pages")
+        if pages is not None and not (isinstance(pages, list) and all(isinstance(p, int) for p in pages)):
+            raise ValueError("pages必须是分P序号列表")
+        max_workers = payload.get("max_workers")
+        if max_workers is not None and not (isinstance(max_workers, int) and 1 <= max_workers <= 32):
+            raise ValueError("max_workers必须在1-32之间")
+
+        options = {"quality": quality, "content": content, "max_workers": max_workers,
+                   "pages": pages, "full": bool(payload.get("full", False))}
+        job = Job(uuid.uuid4().hex[:12], mode, url, options)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._trim_history()
+        self.events.publish(job.id, "queued", job.to_dict())
+        self.executor.submit(self._run_job, job)
+        return job
+
+    def _trim_history(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self.lock:
+            return list(self.jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """取消任务，排队中的任务直接结束，运行中的任务在下一次进度检查时中断"""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        with self.lock:
+            job.options["cancelled"] = True
+            if job.downloader is not None:
+                job.downloader.cancel()
+        self.events.publish(job.id, "cancelling", job.to_dict())
+        return job
+
+    def _run_job(self, job: Job):
+        with self.lock:
+            if job.options.get("cancelled"):
+                self._finish(job, "cancelled")
+                return
+            job.downloader = self.downloader.fork(
+                status_callback=lambda message: self._on_status(job, message),
+                progress_callback=lambda task_id, downloaded, total, speed:
+                    self._on_progress(job, task_id, downloaded, total, speed),
+                error_callback=lambda task_id, error: self._on_error(job, task_id, error)
+            )
+            job.downloader.progress_bus.subscribe(lambda snapshot: self._on_snapshot(job, snapshot))
+        job.state = "running"
+        job.started = time.time()
+        self.events.publish(job.id, "started", job.to_dict())
+
+        options = job.options
+        quality = getattr(DownloadQuality, options["quality"]) if options["quality"] else None
+        content = [getattr(DownloadContent, name) for name in options["content"]] if options["content"] else None
+        try:
+            if job.mode == "sync":
+                ok = job.downloader.sync_collection(job.url, quality, content, options["max_workers"],
+                                                    full=options["full"])
+            elif job.mode == "batch":
+                counts = job.downloader.batch_download_from_file(
+                    Path(job.url), options["quality"], options["content"], options["max_workers"]
+                )
+                ok = bool(counts) and not counts.get("failed")
+            else:
+                ok = job.downloader.download_video(job.url, quality, content, options["max_workers"],
+                                                   options["pages"])
+        except Exception as e:
+            job.errors.append({"task": "job", "error": str(e), "time": time.time()})
+            ok = False
+        if job.downloader.cancel_event.is_set():
+            self._finish(job, "cancelled")
+        else:
+            self._finish(job, "done" if ok else "failed")
+
+    def _finish(self, job: Job, state: str):
+        job.state = state
+        job.finished = time.time()
+        job.transfers.clear()
+        job.aggregate = {"speed": 0.0, "eta": None}
+        self.events.publish(job.id, state, job.to_dict())
+
+    def _on_status(self, job: Job, message: str):
+        job.message = message
+        self.events.publish(job.id, "status", {"message": message})
+
+    def _on_progress(self, job: Job, task_id: str, downloaded: int, total: int, speed: float):
+        """文件级进度（download_pages 的 main 任务），每完成一个文件发布一次"""
+        if task_id != "main":
+            return
+        job.files_done, job.files_total = downloaded, total
+        self.events.publish(job.id, "progress", job.to_dict(detail=True))
+
+    def _on_snapshot(self, job: Job, snapshot: Dict):
+        """进度总线的订阅者，每个任务最多每0.5秒发布一次传输进度事件"""
+        for task in snapshot["tasks"]:
+            if task["state"] == "running":
+                job.transfers[task["id"]] = task
+            else:
+                job.transfers.pop(task["id"], None)
+        job.aggregate = snapshot["aggregate"]
+        now = time.monotonic()
+        if now - job.last_progress_event >= 0.5:
+            job.last_progress_event = now
+            self.events.publish(job.id, "progress", job.to_dict(detail=True))
+
+    def _on_error(self, job: Job, task_id: str, error: str):
+        job.errors.append({"task": task_id, "error": error, "time": time.time()})
+        self.events.publish(job.id, "error", {"task": task_id, "error": error})
+
+    def metrics(self) -> Dict:
+        """任务与共用组件的统计"""
+        jobs = self.list()
+        states = {}
+        for job in jobs:
+            states[job.state] = states.get(job.state, 0) + 1
+        downloader = self.downloader
+        return {
+            "uptime": time.time() - self.started,
+            "jobs": states,
+            "max_jobs": self.max_jobs,
+            "speed": round(sum(job.to_dict()["speed"] for job in jobs if job.state == "running"), 3),
+            "api_cache": downloader.api_cache.get_stats(),
+            "single_flight": downloader.single_flight.get_stats(),
+            "rate_limits": downloader.rate_limiter.get_stats(),
+            "bandwidth": downloader.bandwidth.get_stats(),
+            "mirrors": downloader.mirror_manager.get_stats(),
+            "connections": downloader.get_connection_stats(),
+            "playurl_cache": dict(downloader.playurl_stats),
+            "merges": dict(downloader.merge_stats),
+            "postprocess_pending": downloader.postprocessor.pending_count()
+        }
+
+    def shutdown(self):
+        for job in self.list():
+            if not job.finished:
+                self.cancel(job.id)
+        self.executor.shutdown(wait=True)
+        if hasattr(self.downloader, "close"):
+            self.downloader.close()
+        self.downloader.postprocessor.shutdown()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service: DownloadService = None
+    token = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status: int = 200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str):
+        self._send_json({"error": message}, status)
+
+    def _authorized(self) -> bool:
+        if not self.token:
+            return True
+        if self.headers.get("Authorization", "") == f"Bearer {self.token}":
+            return True
+        self._send_error(401, "未授权")
+        return False
+
+    def _route(self) -> List[str]:
+        return [part for part in urlparse(self.path).path.split("/") if part]
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts = self._route()
+        if parts == ["jobs"]:
+            self._send_json([job.to_dict() for job in self.service.list()])
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self.service.get(parts[1])
+            if job is None:
+                return self._send_error(404, "任务不存在")
+            self._send_json(job.to_dict(detail=True))
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            if self.service.get(parts[1]) is None:
+                return self._send_error(404, "任务不存在")
+            self._stream_events(parts[1])
+        elif parts == ["events"]:
+            self._stream_events(None)
+        elif parts == ["metrics"]:
+            self._send_json(self.service.metrics())
+        else:
+            self._send_error(404, "未知接口")
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        parts = self._route()
+        if parts != ["jobs"]:
+            return self._send_error(404, "未知接口")
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("请求体必须是JSON对象")
+            job = self.service.submit(payload)
+        except ValueError as e:
+            return self._send_error(400, str(e))
+        self._send_json(job.to_dict(detail=True), 201)
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        parts = self._route()
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self._send_error(404, "未知接口")
+        job = self.service.cancel(parts[1])
+        if job is None:
+            return self._send_error(404, "任务不存在")
+        self._send_json(job.to_dict(detail=True), 202)
+
+    def _stream_events(self, job_id: Optional[str]):
+        """以SSE格式推送事件，支持 Last-Event-ID 断线续传，空闲时每15秒发送注释保持连接"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        last_id = self.headers.get("Last-Event-ID")
+        after = int(last_id) if last_id and last_id.isdigit() else self.service.events.seq
+        try:
+            while True:
+                events, latest = self.service.events.wait(after, job_id)
+                if not events:
+                    self.wfile.write(b": keep-alive\n\n")
+                for seq, event_job_id, event_type, data in events:
+                    payload = json.dumps(dict(data, job_id=event_job_id), ensure_ascii=False)
+                    self.wfile.write(f"id: {seq}\nevent: {event_type}\ndata: {payload}\n\n".encode("utf-8"))
+                    after = seq
+                self.wfile.flush()
+                # 单个任务结束后关闭事件流
+                if job_id is not None:
+                    job = self.service.get(job_id)
+                    if job is None or (job.finished and not events):
+                        return
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+def serve(host: str = None, port: int = None, downloader: BiliDownloader = None) -> ServiceServer:
+    """创建下载服务和HTTP服务器（尚未开始监听循环）"""
+    service = DownloadService(downloader)
+    config = service.downloader.config
+    handler = type("BoundServiceHandler", (ServiceHandler,), {
+        "service": service,
+        "token": config.get("service_token") or None
+    })
+    if host is None:
+        host = config.get("service_host", "127.0.0.1")
+    if port is None:
+        port = int(config.get("service_port", 8760))
+    server = ServiceServer((host, port), handler)
+    server.service = service
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面的B站下载服务")
+    parser.add_argument("--host", help="监听地址，默认取配置 service_host")
+    parser.add_argument("--port", type=int, help="监听端口，默认取配置 service_port")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port)
+    host, port = server.server_address[:2]
+    console.print(f"[green]下载服务已启动: http://{host}:{port}  (Ctrl+C 退出)[/green]")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        console.print("\n[yellow]正在停止下载服务...[/yellow]")
+    finally:
+        server.server_close()
+        server.service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
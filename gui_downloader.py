@@ -9,7 +9,11 @@ from tkinter import filedialog, messagebox
 from enum import Enum
 
 # 导入核心下载器
-from 音乐批量下载 import BiliDownloader, DownloadQuality, DownloadContent, VideoType
+from 音乐批量下载 import (
+    BiliDownloader, DownloadQuality, DownloadContent, VideoType, BandwidthShaper, create_downloader
+)
+from progress_bus import format_eta
+from gui_task_table import TaskTable
 
 class BiliDownloaderGUI:
     def __init__(self):
@@ -23,11 +27,20 @@ class BiliDownloaderGUI:
         ctk.set_default_color_theme("blue")
         
         # 创建下载器实例
-        self.downloader = BiliDownloader(
+        self.downloader = create_downloader(
             status_callback=self._status_callback,
             progress_callback=self._progress_callback,
             error_callback=self._error_callback
         )
+        # 传输速度与剩余时间来自进度总线的定时快照
+        self.files_text = ""
+        self.batch_files_text = ""
+        self.pending_snapshot = None
+        self.snapshot_scheduled = False
+        self.downloader.progress_bus.subscribe(self._progress_snapshot_callback)
+        # 单视频/合集下载使用独立的子下载器，分P任务的取消和重试都作用于它
+        self.single_job = None
+        self.single_job_options = None
         
         # 创建主框架
         self.main_frame = ctk.CTkFrame(self.window)
@@ -65,22 +78,40 @@ class BiliDownloaderGUI:
         self.window.after(0, update_status)
         
     def _progress_callback(self, task_id: str, downloaded: int, total: int, speed: float):
-        """处理进度更新的回调函数"""
+        """处理文件级进度的回调函数，传输进度由 _progress_snapshot_callback 更新"""
         def update_progress():
-            # 更新进度条
-            if hasattr(self, 'progress_bar'):
+            # 批量下载按已处理的URL数更新批量进度条
+            if task_id == "batch":
                 if total > 0:
-                    progress = (downloaded / total) * 100
-                    self.progress_bar.set(progress / 100)  # customtkinter的进度条范围是0-1
-                    self.progress_label.configure(
-                        text=f"进度: {progress:.1f}% | 速度: {speed:.1f}MB/s"
-                    )
-                elif downloaded > 0:
-                    self.progress_label.configure(
-                        text=f"已下载: {downloaded/1024/1024:.1f}MB | 速度: {speed:.1f}MB/s"
-                    )
+                    self.batch_progress_bar.set(downloaded / total)
+                    self.batch_files_text = f"已处理: {downloaded}/{total}"
+                    self.batch_progress_label.configure(text=self.batch_files_text)
+                return
+            # 单视频/合集按已完成的文件数更新进度条
+            if task_id == "main" and total > 0:
+                self.progress_bar.set(downloaded / total)  # customtkinter的进度条范围是0-1
+                self.files_text = f"文件: {downloaded}/{total}"
+                self.progress_label.configure(text=self.files_text)
         self.window.after(0, update_progress)
         
+    def _progress_snapshot_callback(self, snapshot: Dict):
+        """进度总线的订阅者，在采样线程中调用；界面来不及刷新时只保留最新的快照"""
+        self.pending_snapshot = snapshot
+        if not self.snapshot_scheduled:
+            self.snapshot_scheduled = True
+            self.window.after(0, self._apply_progress_snapshot)
+            
+    def _apply_progress_snapshot(self):
+        """在界面线程中显示汇总速度与剩余时间"""
+        self.snapshot_scheduled = False
+        aggregate = self.pending_snapshot["aggregate"]
+        if not aggregate["active"]:
+            return
+        transfer_text = (f"速度: {aggregate['speed'] / 1024 / 1024:.1f}MB/s | "
+                         f"剩余: {format_eta(aggregate['eta'])}")
+        self.progress_label.configure(text=" | ".join(filter(None, [self.files_text, transfer_text])))
+        self.batch_progress_label.configure(text=" | ".join(filter(None, [self.batch_files_text, transfer_text])))
+        
     def _error_callback(self, task_id: str, error: str):
         """处理错误的回调函数"""
         def show_error():
@@ -163,6 +194,14 @@ class BiliDownloaderGUI:
         )
         self.progress_label.pack(padx=5, pady=5)
         
+        # 分P任务列表
+        self.task_table = TaskTable(
+            self.single_tab,
+            on_cancel=self._cancel_task,
+            on_retry=self._retry_task
+        )
+        self.task_table.pack(fill="both", expand=True, padx=10, pady=5)
+        
         # 下载按钮
         self.download_button = ctk.CTkButton(
             self.single_tab,
@@ -370,6 +409,38 @@ class BiliDownloaderGUI:
         )
         proxy_entry.pack(side="left", fill="x", expand=True, padx=5)
         
+        # 带宽限制设置，保存后正在进行的下载立即生效
+        bandwidth_frame = ctk.CTkFrame(self.settings_tab)
+        bandwidth_frame.pack(fill="x", padx=10, pady=5)
+        
+        ctk.CTkLabel(bandwidth_frame, text="带宽限制(KB/s, 0为不限):").pack(side="left", padx=5)
+        limits = self.downloader.config.get("bandwidth_limits") or {}
+        self.bandwidth_vars = {}
+        for scope, label in (("global", "全局"), ("job", "单任务"), ("host", "单主机")):
+            ctk.CTkLabel(bandwidth_frame, text=label).pack(side="left", padx=(10, 2))
+            var = ctk.StringVar(value=f"{float(limits.get(scope) or 0):g}")
+            self.bandwidth_vars[scope] = var
+            ctk.CTkEntry(
+                bandwidth_frame,
+                width=70,
+                textvariable=var
+            ).pack(side="left", padx=2)
+        
+        schedule_frame = ctk.CTkFrame(self.settings_tab)
+        schedule_frame.pack(fill="x", padx=10, pady=5)
+        
+        ctk.CTkLabel(schedule_frame, text="时段限速:").pack(side="left", padx=5)
+        self.bandwidth_schedule_var = ctk.StringVar(
+            value=BandwidthShaper.format_schedule(self.downloader.config.get("bandwidth_schedule"))
+        )
+        schedule_entry = ctk.CTkEntry(
+            schedule_frame,
+            textvariable=self.bandwidth_schedule_var,
+            width=300,
+            placeholder_text="例如: 09:00-18:00 2048; 23:00-07:00 global=0 job=512"
+        )
+        schedule_entry.pack(side="left", fill="x", expand=True, padx=5)
+        
         # 保存设置按钮
         ctk.CTkButton(
             self.settings_tab,
@@ -513,6 +584,22 @@ UP主: {info['author']}
             messagebox.showerror("错误", "线程数必须是有效的数字")
             return
         
+        # 每次下载使用新的子下载器，任务列表只显示本次下载的分P
+        job = self.downloader.fork(
+            status_callback=self._status_callback,
+            progress_callback=self._progress_callback,
+            error_callback=self._error_callback
+        )
+        job.progress_bus.subscribe(self._progress_snapshot_callback)
+        job.progress_bus.subscribe(self.task_table.snapshot)
+        self.single_job = job
+        self.single_job_options = {
+            "url": self.url_entry.get().strip(),
+            "quality": quality,
+            "threads": threads
+        }
+        self.task_table.clear()
+        
         # 开始下载
         def download_thread():
             try:
@@ -521,15 +608,16 @@ UP主: {info['author']}
                 self.download_button.configure(state="disabled")
                 self.progress_bar.set(0)
                 self.progress_label.configure(text="准备下载...")
+                self.files_text = ""
                 
                 # 开始下载
-                url = self.url_entry.get().strip()
-                self.downloader.download_video(
-                    url=url,
+                job.download_video(
+                    url=self.single_job_options["url"],
                     quality=quality,
                     content=content,
                     custom_max_workers=threads,
-                    selected_pages=selected_pages
+                    selected_pages=selected_pages,
+                    on_task_state=self._task_state_callback
                 )
                 
                 # 下载完成
@@ -547,6 +635,36 @@ UP主: {info['author']}
             
         threading.Thread(target=download_thread, daemon=True).start()
         
+    def _task_state_callback(self, page: Dict, content_type: DownloadContent, state: str):
+        """分P任务状态回调，在下载线程中调用，更新由任务列表按帧合并显示"""
+        key = self.single_job.page_task_key(page, content_type)
+        self.task_table.task_state(key, f"P{page['p']} {content_type.value} {page['title']}", state)
+        
+    def _cancel_task(self, key: str):
+        """取消任务列表中的单个分P任务"""
+        if self.single_job and not self.single_job.cancel_task(key):
+            self.status_bar.configure(text=f"任务 {key} 已结束")
+            
+    def _retry_task(self, key: str):
+        """重新下载失败或已取消的分P任务，与正在进行的下载并行"""
+        if not self.single_job:
+            return
+        job = self.single_job
+        options = self.single_job_options
+        p, content_name = key.split("_", 1)
+        
+        def retry_thread():
+            job.download_video(
+                url=options["url"],
+                quality=options["quality"],
+                content=[getattr(DownloadContent, content_name)],
+                custom_max_workers=1,
+                selected_pages=[int(p)],
+                on_task_state=self._task_state_callback
+            )
+            
+        threading.Thread(target=retry_thread, daemon=True).start()
+        
     def _select_batch_file(self):
         """选择批量下载文件"""
         file_path = filedialog.askopenfilename(
@@ -586,24 +704,28 @@ UP主: {info['author']}
                 self.batch_download_button.configure(state="disabled")
                 self.batch_progress_bar.set(0)
                 self.batch_progress_label.configure(text="准备下载...")
+                self.batch_files_text = ""
                 
-                # 开始下载
-                self.downloader.batch_download_from_file(
+                # 开始下载，中断后再次选择同一文件会从中断处继续
+                counts = self.downloader.batch_download_from_file(
                     file_path=Path(file_path),
                     quality_name=quality.name,
                     content_names=[c.name for c in content],
                     custom_max_workers=threads
                 )
+                if counts is None:
+                    raise Exception("文件不存在或没有有效的URL")
                 
                 # 下载完成
                 self.window.after(0, lambda: self.status_bar.configure(text="下载完成"))
                 self.window.after(0, lambda: self.batch_download_button.configure(state="normal"))
                 self.window.after(0, lambda: self.batch_progress_bar.set(1))
                 self.window.after(0, lambda: self.batch_progress_label.configure(text="下载完成"))
-                self.window.after(0, lambda: messagebox.showinfo("成功", "批量下载完成！"))
+                summary = f"批量下载完成！成功 {counts.get('done', 0)}，失败 {counts.get('failed', 0)}"
+                self.window.after(0, lambda: messagebox.showinfo("成功", summary))
                 
             except Exception as e:
-                self.window.after(0, lambda: messagebox.showerror("错误", f"下载失败: {str(e)}"))
+                self.window.after(0, lambda error=str(e): messagebox.showerror("错误", f"下载失败: {error}"))
                 self.window.after(0, lambda: self.status_bar.configure(text="下载失败"))
                 self.window.after(0, lambda: self.batch_download_button.configure(state="normal"))
                 self.window.after(0, lambda: self.batch_progress_label.configure(text="下载失败"))
@@ -632,6 +754,16 @@ UP主: {info['author']}
             if not download_path:
                 messagebox.showerror("错误", "请设置下载目录")
                 return
+            
+            # 验证带宽限制
+            bandwidth_limits = dict(self.downloader.config.get("bandwidth_limits") or {})
+            try:
+                for scope, var in self.bandwidth_vars.items():
+                    bandwidth_limits[scope] = max(0.0, float(var.get() or 0))
+                bandwidth_schedule = BandwidthShaper.parse_schedule(self.bandwidth_schedule_var.get())
+            except ValueError as e:
+                messagebox.showerror("错误", f"带宽限制格式错误: {str(e)}")
+                return
                 
             # 构建设置
             settings = {
@@ -645,7 +777,9 @@ UP主: {info['author']}
                 "proxies": {
                     "http": self.proxy_var.get(),
                     "https": self.proxy_var.get()
-                } if self.proxy_var.get() else None
+                } if self.proxy_var.get() else None,
+                "bandwidth_limits": bandwidth_limits,
+                "bandwidth_schedule": bandwidth_schedule
             }
             
             # 保存设置
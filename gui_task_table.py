@@ -0,0 +1,310 @@
+"""图形界面的分P任务列表
+
+任务数可能上千，列表只为可见的行创建画布元素，滚动时复用这些行显示不同的任务。
+下载线程和进度采样线程只把更新放入队列，界面线程每一帧合并处理一次队列并重绘可见行，
+不会为每个事件调用一次 after。
+"""
+import tkinter as tk
+from collections import deque
+from typing import Callable, Dict
+
+import customtkinter as ctk
+
+from progress_bus import format_eta
+
+# 界面刷新间隔（毫秒）
+FRAME_MS = 100
+ROW_HEIGHT = 24
+FONT = ("Microsoft YaHei", 10)
+
+BG_COLORS = ("#2b2b2b", "#323232")
+HEADER_BG = "#1f1f1f"
+TEXT_COLOR = "#dce4ee"
+LINK_COLOR = "#3b8ed0"
+BAR_TROUGH = "#4a4a4a"
+
+STATE_TEXT = {
+    "queued": "排队中",
+    "downloading": "下载中",
+    "muxing": "合并中",
+    "done": "完成",
+    "failed": "失败",
+    "cancelled": "已取消",
+}
+STATE_COLORS = {
+    "queued": "#9e9e9e",
+    "downloading": "#3b8ed0",
+    "muxing": "#d0a23b",
+    "done": "#4caf50",
+    "failed": "#e05353",
+    "cancelled": "#9e9e9e",
+}
+
+# (列名, 标题, 宽度)
+COLUMNS = [
+    ("label", "任务", 300),
+    ("state", "状态", 70),
+    ("bar", "进度", 150),
+    ("size", "已下载/总大小", 150),
+    ("speed", "速度", 90),
+    ("eta", "剩余", 70),
+    ("host", "主机", 220),
+    ("action", "操作", 60),
+]
+
+
+def format_size(downloaded: int, total: int) -> str:
+    if not total:
+        return f"{downloaded / 1024 / 1024:.1f}MB" if downloaded else ""
+    return f"{downloaded / 1024 / 1024:.1f}/{total / 1024 / 1024:.1f}MB"
+
+
+class TaskTable(ctk.CTkFrame):
+    """分P任务列表，显示每个任务的状态、字节数、速度、剩余时间和下载主机
+
+    task_state、snapshot 和 clear 可以在任意线程调用，其余方法只在界面线程使用。
+
+    Args:
+        master: 父控件
+        on_cancel: 点击"取消"时的回调，参数为任务键
+        on_retry: 点击"重试"时的回调，参数为任务键
+        height: 列表区域的高度（像素）
+    """
+
+    def __init__(self, master, on_cancel: Callable[[str], None], on_retry: Callable[[str], None],
+                 height: int = 240, **kwargs):
+        super().__init__(master, **kwargs)
+        self.on_cancel = on_cancel
+        self.on_retry = on_retry
+        # 其他线程放入的更新，由 _frame 统一处理
+        self.updates = deque()
+        # 任务键按加入顺序排列，行数据按键保存
+        self.keys = []
+        self.rows = {}
+        # 任务键 -> {计数器编号: 最近一次快照}，同一分P的视频流和音频流合并显示
+        self.transfers = {}
+        self.first = 0
+        self.slots = []
+        self.dirty = False
+
+        self.columns = []
+        x = 0
+        for name, title, width in COLUMNS:
+            self.columns.append((name, title, x, width))
+            x += width
+        total_width = x
+
+        header = tk.Canvas(self, height=ROW_HEIGHT, width=total_width, bg=HEADER_BG, highlightthickness=0)
+        for name, title, left, width in self.columns:
+            header.create_text(left + 6, ROW_HEIGHT // 2, text=title, anchor="w", fill=TEXT_COLOR, font=FONT)
+        header.grid(row=0, column=0, sticky="ew")
+
+        self.canvas = tk.Canvas(self, height=height, width=total_width, bg=BG_COLORS[0], highlightthickness=0)
+        self.canvas.grid(row=1, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=1, column=1, sticky="ns")
+        self.grid_rowconfigure(1, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.canvas.bind("<Configure>", self._on_resize)
+        self.canvas.bind("<MouseWheel>", lambda e: self._scroll(-1 if e.delta > 0 else 1, "units"))
+        self.canvas.bind("<Button-4>", lambda e: self._scroll(-1, "units"))
+        self.canvas.bind("<Button-5>", lambda e: self._scroll(1, "units"))
+        self.after(FRAME_MS, self._frame)
+
+    # ---- 线程安全的更新入口 ----
+
+    def clear(self):
+        """清空列表"""
+        self.updates.append(("clear",))
+
+    def task_state(self, key: str, label: str, state: str):
+        """登记任务或更新任务状态，参数与 download_pages 的 on_task_state 对应"""
+        self.updates.append(("state", key, label, state))
+
+    def snapshot(self, snapshot: Dict):
+        """进度总线的订阅者，按计数器的 group（任务键）更新对应的行"""
+        self.updates.append(("snapshot", snapshot))
+
+    def get_state(self, key: str) -> str:
+        row = self.rows.get(key)
+        return row["state"] if row else None
+
+    # ---- 界面线程 ----
+
+    def _frame(self):
+        """每帧处理一次积累的更新，只在有变化时重绘可见行"""
+        if not self.winfo_exists():
+            return
+        changed_groups = set()
+        while self.updates:
+            update = self.updates.popleft()
+            if update[0] == "clear":
+                self.keys.clear()
+                self.rows.clear()
+                self.transfers.clear()
+                changed_groups.clear()
+                self.first = 0
+                self.dirty = True
+            elif update[0] == "state":
+                self._apply_state(*update[1:])
+            else:
+                for task in update[1]["tasks"]:
+                    group = task["group"]
+                    if group in self.rows:
+                        self.transfers.setdefault(group, {})[task["id"]] = task
+                        changed_groups.add(group)
+        for group in changed_groups:
+            self._aggregate(group)
+        if self.dirty:
+            self.dirty = False
+            self._redraw()
+        self.after(FRAME_MS, self._frame)
+
+    def _apply_state(self, key: str, label: str, state: str):
+        row = self.rows.get(key)
+        if row is None:
+            row = {"label": label, "state": state, "downloaded": 0, "total": 0, "speed": 0.0, "eta": None,
+                   "host": ""}
+            self.rows[key] = row
+            self.keys.append(key)
+        else:
+            # 重试时清空上一次的传输记录
+            if state in ("queued", "downloading") and row["state"] in ("done", "failed", "cancelled"):
+                self.transfers.pop(key, None)
+                row.update(downloaded=0, total=0, speed=0.0, eta=None)
+            row["label"] = label
+            row["state"] = state
+        if state != "downloading":
+            row["speed"] = 0.0
+            row["eta"] = None
+        self.dirty = True
+
+    def _aggregate(self, key: str):
+        """合并同一任务下各计数器的进度"""
+        row = self.rows[key]
+        transfers = self.transfers[key].values()
+        row["downloaded"] = sum(t["downloaded"] for t in transfers)
+        row["total"] = sum(t["total"] for t in transfers)
+        running = [t for t in transfers if t["state"] == "running"]
+        row["speed"] = sum(t["speed"] for t in running)
+        remaining = sum(max(0, t["total"] - t["downloaded"]) for t in running)
+        row["eta"] = remaining / row["speed"] if row["speed"] > 0 and remaining else None
+        hosts = [t["host"] for t in running if t["host"]] or [t["host"] for t in transfers if t["host"]]
+        if hosts:
+            row["host"] = hosts[-1]
+        self.dirty = True
+
+    def _on_resize(self, event):
+        """按可见高度重建行，行数只与窗口高度有关"""
+        count = event.height // ROW_HEIGHT + 1
+        if count == len(self.slots):
+            return
+        self.canvas.delete("all")
+        self.slots = [self._create_slot(i) for i in range(count)]
+        self.dirty = True
+
+    def _create_slot(self, index: int) -> Dict:
+        canvas = self.canvas
+        top = index * ROW_HEIGHT
+        middle = top + ROW_HEIGHT // 2
+        slot = {"rendered": None}
+        slot["bg"] = canvas.create_rectangle(0, top, 10000, top + ROW_HEIGHT, width=0,
+                                             fill=BG_COLORS[index % 2])
+        for name, title, left, width in self.columns:
+            if name == "bar":
+                slot["trough"] = canvas.create_rectangle(left + 6, middle - 5, left + width - 6, middle + 5,
+                                                         width=0, fill=BAR_TROUGH, state="hidden")
+                slot["bar"] = canvas.create_rectangle(left + 6, middle - 5, left + 6, middle + 5, width=0,
+                                                      fill=STATE_COLORS["downloading"], state="hidden")
+                slot["bar_span"] = (left + 6, width - 12)
+            else:
+                slot[name] = canvas.create_text(left + 6, middle, text="", anchor="w", fill=TEXT_COLOR, font=FONT)
+        canvas.tag_bind(slot["action"], "<Button-1>", lambda e, i=index: self._on_action(i))
+        canvas.tag_bind(slot["action"], "<Enter>", lambda e: self.canvas.configure(cursor="hand2"))
+        canvas.tag_bind(slot["action"], "<Leave>", lambda e: self.canvas.configure(cursor=""))
+        return slot
+
+    def _redraw(self):
+        """把当前滚动位置对应的任务绑定到可见行，只修改内容变化的行"""
+        self.first = max(0, min(self.first, len(self.keys) - max(1, len(self.slots) - 1)))
+        canvas = self.canvas
+        for i, slot in enumerate(self.slots):
+            index = self.first + i
+            key = self.keys[index] if index < len(self.keys) else None
+            row = self.rows[key] if key else None
+            values = None if row is None else (
+                row["label"], row["state"], row["downloaded"], row["total"], int(row["speed"] / 10240),
+                None if row["eta"] is None else int(row["eta"]), row["host"])
+            if values == slot["rendered"]:
+                continue
+            slot["rendered"] = values
+            if row is None:
+                for name in ("label", "state", "size", "speed", "eta", "host", "action"):
+                    canvas.itemconfigure(slot[name], text="")
+                canvas.itemconfigure(slot["trough"], state="hidden")
+                canvas.itemconfigure(slot["bar"], state="hidden")
+                continue
+
+            state = row["state"]
+            label = row["label"]
+            canvas.itemconfigure(slot["label"], text=label if len(label) <= 28 else label[:27] + "…")
+            canvas.itemconfigure(slot["state"], text=STATE_TEXT.get(state, state),
+                                 fill=STATE_COLORS.get(state, TEXT_COLOR))
+            canvas.itemconfigure(slot["size"], text=format_size(row["downloaded"], row["total"]))
+            downloading = state == "downloading"
+            canvas.itemconfigure(slot["speed"], text=f"{row['speed'] / 1024 / 1024:.1f}MB/s" if downloading else "")
+            canvas.itemconfigure(slot["eta"], text=format_eta(row["eta"]) if downloading else "")
+            canvas.itemconfigure(slot["host"], text=row["host"])
+            if state in ("queued", "downloading"):
+                action = "取消"
+            elif state in ("failed", "cancelled"):
+                action = "重试"
+            else:
+                action = ""
+            canvas.itemconfigure(slot["action"], text=action, fill=LINK_COLOR)
+
+            if state == "done":
+                fraction = 1.0
+            else:
+                fraction = row["downloaded"] / row["total"] if row["total"] else 0.0
+            left, width = slot["bar_span"]
+            top, bottom = canvas.coords(slot["trough"])[1::2]
+            canvas.coords(slot["bar"], left, top, left + width * min(1.0, fraction), bottom)
+            canvas.itemconfigure(slot["bar"], fill=STATE_COLORS.get(state, TEXT_COLOR), state="normal")
+            canvas.itemconfigure(slot["trough"], state="normal")
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        count = len(self.keys)
+        visible = max(1, len(self.slots) - 1)
+        if count <= visible:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.first / count, (self.first + visible) / count)
+
+    def _scroll(self, amount: int, unit: str):
+        visible = max(1, len(self.slots) - 1)
+        step = amount * (visible if unit == "pages" else 3)
+        self.first = max(0, min(self.first + step, len(self.keys) - visible))
+        self._redraw()
+
+    def _on_scrollbar(self, command: str, *args):
+        """滚动条回调，参数与 tkinter 的 yscrollcommand 一致"""
+        visible = max(1, len(self.slots) - 1)
+        if command == "moveto":
+            self.first = max(0, min(int(float(args[0]) * len(self.keys)), len(self.keys) - visible))
+            self._redraw()
+        elif command == "scroll":
+            self._scroll(int(args[0]), args[1])
+
+    def _on_action(self, slot_index: int):
+        index = self.first + slot_index
+        if index >= len(self.keys):
+            return
+        key = self.keys[index]
+        state = self.rows[key]["state"]
+        if state in ("queued", "downloading"):
+            self.on_cancel(key)
+        elif state in ("failed", "cancelled"):
+            self.on_retry(key)
@@ -0,0 +1,228 @@
+"""可替换的HTTP传输层
+
+_safe_request 和文件下载通过传输对象发出请求，配置项 transport 选择后端：
+    requests  默认，HTTP/1.1，按主机分片的连接池（见 HostSessions）
+    http2     基于 httpx，同一主机的并发请求在一个HTTP/2连接上多路复用，
+              需额外安装 pip install httpx[http2]，未安装时退回 requests
+
+两种后端返回的响应对象接口一致（status_code、headers、json()、content、iter_content()、
+raise_for_status()、close() 和 with 语句），网络错误统一转换为 requests 的异常类型，
+调用方的重试逻辑不需要区分后端。
+"""
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+import requests
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class RequestsTransport:
+    """基于 requests 的HTTP/1.1传输
+
+    Args:
+        sessions: 按主机分片的会话（HostSessions）
+    """
+
+    name = "requests"
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        session, _ = self.sessions.get(url)
+        return session.request(method, url, **kwargs)
+
+    def get_stats(self) -> Dict:
+        return dict(self.sessions.get_stats(), transport=self.name)
+
+    def close(self):
+        pass
+
+
+class Http2Response:
+    """把 httpx.Response 包装成 requests.Response 的常用接口"""
+
+    def __init__(self, response: "httpx.Response"):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.http_version = response.http_version
+
+    @property
+    def content(self) -> bytes:
+        with _translate_errors():
+            return self.response.read()
+
+    @property
+    def text(self) -> str:
+        self.content
+        return self.response.text
+
+    def json(self, **kwargs):
+        self.content
+        return self.response.json(**kwargs)
+
+    def iter_content(self, chunk_size: int = 1) -> Iterator[bytes]:
+        with _translate_errors():
+            yield from self.response.iter_bytes(chunk_size)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error: {self.url}", response=self)
+
+    def close(self):
+        self.response.close()
+
+    def __enter__(self) -> "Http2Response":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def _translate_errors():
+    """把 httpx 的网络异常转换为 requests 的对应异常"""
+    try:
+        yield
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.Timeout(str(e) or type(e).__name__) from e
+    except (httpx.TransportError, httpx.DecodingError, httpx.StreamError) as e:
+        raise requests.exceptions.ConnectionError(str(e) or type(e).__name__) from e
+
+
+class Http2Transport:
+    """基于 httpx 的HTTP/2传输，线程安全
+
+    httpx 的连接池按主机保存连接，HTTP/2连接上的并发请求作为独立的流多路复用，
+    同一主机通常只需要一个连接。服务器不支持HTTP/2时通过ALPN自动使用HTTP/1.1。
+
+    Args:
+        classify: 判断URL主机类别的函数，用于按类别统计
+        cookies: 与 requests 会话共用的 Cookie
+        prior_knowledge: 为True时不经协商直接使用HTTP/2（h2c），只用于明文的本地测试服务器
+        max_keepalive: 空闲连接的保留上限
+    """
+
+    name = "http2"
+
+    def __init__(self, classify: Callable[[str], str], cookies=None, prior_knowledge: bool = False,
+                 max_keepalive: int = 100):
+        if httpx is None:
+            raise ImportError("HTTP/2传输需要安装httpx: pip install httpx[http2]")
+        self.classify = classify
+        self.cookies = cookies
+        self.prior_knowledge = prior_knowledge
+        self.limits = httpx.Limits(max_connections=None, max_keepalive_connections=max_keepalive,
+                                   keepalive_expiry=60)
+        self.lock = threading.Lock()
+        self.proxies = None
+        self.client = self._create_client(None)
+        # 主机类别 -> {"requests", "connections", "http2"}
+        self.stats = {}
+
+    def _create_client(self, proxies: Optional[Dict]) -> "httpx.Client":
+        http1 = not self.prior_knowledge
+        mounts = {
+            f"{scheme}://": httpx.HTTPTransport(http1=http1, http2=True, limits=self.limits, proxy=proxy)
+            for scheme, proxy in (proxies or {}).items() if proxy
+        }
+        return httpx.Client(http1=http1, http2=True, limits=self.limits, cookies=self.cookies,
+                            mounts=mounts or None, follow_redirects=True, trust_env=False)
+
+    def _client_for(self, proxies: Optional[Dict]) -> "httpx.Client":
+        """代理设置变化时换用新的客户端，旧客户端上进行中的请求不受影响"""
+        proxies = proxies or None
+        if proxies != self.proxies:
+            with self.lock:
+                if proxies != self.proxies:
+                    self.client = self._create_client(proxies)
+                    self.proxies = proxies
+        return self.client
+
+    @staticmethod
+    def _timeout(timeout) -> "httpx.Timeout":
+        # 与 requests 相同：单个数字同时作为连接和读取超时，元组为 (连接, 读取)；不限制等待连接池的时间
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+        else:
+            connect = read = timeout
+        return httpx.Timeout(connect=connect, read=read, write=read, pool=None)
+
+    def request(self, method: str, url: str, headers=None, params=None, stream: bool = False,
+                timeout=30, proxies: Optional[Dict] = None, **kwargs) -> Http2Response:
+        """发起请求，参数与 requests.Session.request 的常用参数一致"""
+        stats = self._class_stats(url)
+        with self.lock:
+            stats["requests"] += 1
+
+        def trace(event: str, info: Dict):
+            if event == "connection.connect_tcp.complete":
+                with self.lock:
+                    stats["connections"] += 1
+
+        client = self._client_for(proxies)
+        request = client.build_request(method, url, headers=headers, params=params,
+                                       timeout=self._timeout(timeout), extensions={"trace": trace}, **kwargs)
+        with _translate_errors():
+            response = client.send(request, stream=stream)
+        if response.http_version == "HTTP/2":
+            with self.lock:
+                stats["http2"] += 1
+        return Http2Response(response)
+
+    def _class_stats(self, url: str) -> Dict:
+        host_class = self.classify(url)
+        stats = self.stats.get(host_class)
+        if stats is None:
+            with self.lock:
+                stats = self.stats.setdefault(host_class, {"requests": 0, "connections": 0, "http2": 0})
+        return stats
+
+    def get_stats(self) -> Dict:
+        """各类别的请求数、新建连接数、走HTTP/2的请求数和连接复用率"""
+        with self.lock:
+            by_class = {host_class: dict(stats) for host_class, stats in self.stats.items()}
+        for stats in by_class.values():
+            stats["reuse_ratio"] = round(1 - stats["connections"] / stats["requests"], 4) if stats["requests"] else None
+        requests_sum = sum(stats["requests"] for stats in by_class.values())
+        connections_sum = sum(stats["connections"] for stats in by_class.values())
+        return {
+            "transport": self.name,
+            "requests": requests_sum,
+            "connections": connections_sum,
+            "http2_requests": sum(stats["http2"] for stats in by_class.values()),
+            "reuse_ratio": round(1 - connections_sum / requests_sum, 4) if requests_sum else None,
+            "classes": by_class
+        }
+
+    def close(self):
+        self.client.close()
+
+
+def create_transport(name: str, sessions, classify: Callable[[str], str], prior_knowledge: bool = False,
+                     status_callback: Callable[[str], None] = None):
+    """按名称创建传输后端，HTTP/2后端不可用时退回 requests
+
+    Args:
+        name: "requests" 或 "http2"
+        sessions: requests 后端使用的分片会话（HostSessions）
+        classify: 判断URL主机类别的函数
+        prior_knowledge: HTTP/2后端是否直接使用h2c
+        status_callback: 退回 requests 时报告原因
+    """
+    if name == "http2":
+        try:
+            return Http2Transport(classify, sessions.base.cookies, prior_knowledge)
+        except ImportError as e:
+            if status_callback:
+                status_callback(f"{e}，改用requests")
+    elif name != "requests" and status_callback:
+        status_callback(f"未知的传输后端 {name}，使用requests")
+    return RequestsTransport(sessions)
@@ -0,0 +1,186 @@
+"""下载进度事件总线
+
+下载线程只更新各自任务的计数器（每个计数器只有一个写入者，不加锁），
+由一个采样线程按固定间隔读取全部计数器，计算指数加权平均（EWMA）速度和剩余时间，
+再把合并后的快照推送给订阅者。界面每个采样周期最多刷新一次，与并发任务数无关。
+
+快照格式：
+    {
+        "time": 采样时间戳,
+        "tasks": [自上次快照以来有变化的任务: {"id", "name", "label", "group", "host", "downloaded", "total",
+                   "speed": 字节/秒, "eta": 秒或None, "state": running、done 或 failed}],
+        "aggregate": {"active": 进行中的任务数, "downloaded": 字节, "total": 字节,
+                      "speed": 字节/秒, "eta": 秒或None}
+    }
+"""
+import itertools
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """把剩余秒数格式化为 mm:ss 或 h:mm:ss，未知时返回 --:--"""
+    if seconds is None:
+        return "--:--"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class TaskCounter:
+    """单个传输任务的进度计数器
+
+    只由所属的下载线程（或持有同一把锁的多个线程）写入，采样线程只读。
+
+    Args:
+        task_id: 任务编号，由 ProgressBus 分配，在同一总线内唯一
+        name: 调用方的任务名，例如 download_1_video
+        label: 显示名称，例如输出文件名
+        total: 需下载的总字节数，未知时为0
+        group: 所属的上层任务，例如分P任务的键，同一分P的视频流和音频流属于同一组
+    """
+
+    __slots__ = ("id", "name", "label", "group", "host", "downloaded", "total", "state")
+
+    def __init__(self, task_id: int, name: str, label: str, total: int = 0, group: Optional[str] = None):
+        self.id = task_id
+        self.name = name
+        self.label = label
+        self.group = group
+        # 当前使用的下载主机，由传输循环在选定镜像后写入
+        self.host = None
+        self.downloaded = 0
+        self.total = total
+        self.state = "running"
+
+    def update(self, downloaded: int, total: int = None):
+        self.downloaded = downloaded
+        if total is not None:
+            self.total = total
+
+    def add(self, amount: int):
+        self.downloaded += amount
+
+    def finish(self, ok: bool = True):
+        """标记任务结束，成功时进度补满"""
+        if ok and self.total:
+            self.downloaded = self.total
+        self.state = "done" if ok else "failed"
+
+
+class ProgressBus:
+    """进度聚合器，每个下载器一个
+
+    Args:
+        interval: 采样间隔（秒）
+        half_life: 速度EWMA的半衰期（秒），越大越平滑
+    """
+
+    def __init__(self, interval: float = 0.25, half_life: float = 2.0):
+        self.interval = max(0.05, float(interval))
+        self.half_life = max(0.1, float(half_life))
+        self.counters = {}
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.sampler = None
+        # 以下只由采样线程访问
+        self.samples = {}
+        self.last_sample = None
+
+    def task(self, name: str, total: int = 0, label: str = None, group: Optional[str] = None) -> TaskCounter:
+        """登记一个传输任务并返回其计数器，采样线程未运行时启动"""
+        with self.lock:
+            counter = TaskCounter(next(self.ids), name, label or name, total, group)
+            self.counters[counter.id] = counter
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._sample_loop, name="progress-sampler", daemon=True)
+                self.sampler.start()
+            return counter
+
+    def subscribe(self, callback: Callable[[Dict], None]) -> Callable[[Dict], None]:
+        """订阅快照，回调在采样线程中执行，应尽快返回"""
+        with self.lock:
+            self.subscribers = self.subscribers + [callback]
+        return callback
+
+    def unsubscribe(self, callback: Callable[[Dict], None]):
+        with self.lock:
+            self.subscribers = [s for s in self.subscribers if s is not callback]
+
+    def _sample_loop(self):
+        self.last_sample = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            snapshot = self._sample()
+            if snapshot["tasks"]:
+                for callback in self.subscribers:
+                    try:
+                        callback(snapshot)
+                    except Exception:
+                        pass
+            with self.lock:
+                if not self.counters:
+                    # 没有进行中的任务时退出，下次登记任务时重新启动
+                    self.sampler = None
+                    self.samples.clear()
+                    return
+
+    def _sample(self) -> Dict:
+        """读取全部计数器，更新EWMA速度，生成快照并移除已结束的任务"""
+        now = time.monotonic()
+        elapsed = max(now - self.last_sample, 1e-6)
+        self.last_sample = now
+        alpha = 1 - 0.5 ** (elapsed / self.half_life)
+
+        with self.lock:
+            counters = list(self.counters.values())
+        changed = []
+        active = 0
+        downloaded_sum = total_sum = speed_sum = remaining_sum = 0
+        for counter in counters:
+            downloaded, total, state = counter.downloaded, counter.total, counter.state
+            previous = self.samples.get(counter.id)
+            if previous is None:
+                last_downloaded, average, weight = 0, 0.0, 0.0
+            else:
+                last_downloaded, average, weight = previous["downloaded"], previous["average"], previous["weight"]
+            # 断点续传或换镜像重新计数时进度可能回退，不计入速度
+            instant = max(0, downloaded - last_downloaded) / elapsed
+            # 从0开始的EWMA除以累计权重做偏差修正，开头的突发流量不会长时间抬高速度
+            average = alpha * instant + (1 - alpha) * average
+            weight = alpha + (1 - alpha) * weight
+            speed = average / weight if state == "running" else 0.0
+            eta = (total - downloaded) / speed if total and speed > 0 and downloaded < total else None
+            info = {"id": counter.id, "name": counter.name, "label": counter.label, "group": counter.group,
+                    "host": counter.host, "downloaded": downloaded, "total": total, "speed": speed, "eta": eta,
+                    "state": state}
+            if previous is None or previous["downloaded"] != downloaded or previous["total"] != total \
+                    or previous["host"] != counter.host or state != "running" or abs(previous["speed"] - speed) > 1024:
+                changed.append(info)
+            self.samples[counter.id] = dict(info, average=average, weight=weight)
+
+            if state == "running":
+                active += 1
+                downloaded_sum += downloaded
+                total_sum += total
+                speed_sum += speed
+                remaining_sum += max(0, total - downloaded)
+            else:
+                with self.lock:
+                    self.counters.pop(counter.id, None)
+                del self.samples[counter.id]
+
+        return {
+            "time": time.time(),
+            "tasks": changed,
+            "aggregate": {
+                "active": active,
+                "downloaded": downloaded_sum,
+                "total": total_sum,
+                "speed": speed_sum,
+                "eta": remaining_sum / speed_sum if speed_sum > 0 and remaining_sum else None
+            }
+        }
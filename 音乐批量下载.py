@@ -1,12 +1,14 @@
 import re
+import sys
+import copy
 import json
 import random
 import time
 import os
 from urllib.parse import urlparse, parse_qs
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union, Iterator, Iterable, Tuple, Callable
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError, wait, FIRST_COMPLETED
 import yt_dlp
 from rich.console import Console
 from rich.prompt import Prompt, IntPrompt, Confirm
@@ -17,15 +19,28 @@ from rich.progress import (
     TaskProgressColumn,
     TimeElapsedColumn,
     DownloadColumn,
-    TransferSpeedColumn
+    TransferSpeedColumn,
+    TextColumn
 )
 from rich.table import Table
 from rich.panel import Panel
 from rich.text import Text
 from rich.box import SIMPLE, MINIMAL_DOUBLE_HEAD
 import requests
+from requests.adapters import HTTPAdapter
 from enum import Enum
 import threading
+import queue
+import weakref
+import contextvars
+import functools
+import sqlite3
+import subprocess
+from collections import OrderedDict, deque
+from types import MappingProxyType
+from progress_bus import ProgressBus, TaskCounter, format_eta
+from http_transport import create_transport
+from disk_writer import DiskWriter, WriteStream, response_reader
 
 console = Console()
 
@@ -37,6 +52,60 @@ USER_AGENTS = [
     "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36"
 ]
 
+# 各主机类别的固定请求头，每个User-Agent预先生成一份只读副本，请求时直接挑选
+_BASE_REQUEST_HEADERS = {
+    "api": {"Accept": "application/json, text/plain, */*"},
+    "comment": {"Accept": "application/xml, text/xml, */*"},
+    "cdn": {"Accept": "*/*"},
+    "other": {"Accept": "application/json, text/plain, */*"}
+}
+REQUEST_HEADER_SETS = {
+    host_class: tuple(
+        MappingProxyType({
+            "User-Agent": user_agent,
+            "Referer": "https://www.bilibili.com/",
+            "Accept-Encoding": "gzip, deflate",
+            "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+            **extra
+        })
+        for user_agent in USER_AGENTS
+    )
+    for host_class, extra in _BASE_REQUEST_HEADERS.items()
+}
+
+
+def request_headers(host_class: str) -> MappingProxyType:
+    """随机选取一套该主机类别的预生成请求头"""
+    return random.choice(REQUEST_HEADER_SETS.get(host_class) or REQUEST_HEADER_SETS["other"])
+
+# MP4容器可直接封装（无需转码）的音频编码
+MP4_COPY_AUDIO_CODECS = {"aac", "mp3", "ac3", "eac3", "alac", "flac", "opus"}
+
+# 分段下载配置
+SEGMENT_MIN_SIZE = 8 * 1024 * 1024  # 小于该大小的文件不分段
+SEGMENT_SPLIT_MIN = 2 * 1024 * 1024  # 剩余量小于该值的分段不再拆分
+
+# 镜像测速时读取的字节数
+MIRROR_RACE_BYTES = 256 * 1024
+
+# 带宽限制：每个连接累计该字节数后才访问共享令牌桶；令牌桶最多积攒该秒数的流量；时段限速的检查间隔（秒）
+BANDWIDTH_BATCH_BYTES = 64 * 1024
+BANDWIDTH_BURST_SECONDS = 0.5
+BANDWIDTH_SCHEDULE_CHECK = 30
+
+# 当前线程或协程正在执行的分P任务 {"key": 任务键, "cancel": threading.Event}，
+# 用于取消单个分P任务以及把传输进度归到对应的分P
+current_page_task = contextvars.ContextVar("current_page_task", default=None)
+
+# 收藏夹/课程分页接口每页的条目数
+COLLECTION_PAGE_SIZE = 100
+
+# 增量同步时各类合集列表的排序：newest_first 新分集出现在第一页，oldest_first 新分集追加在末尾
+SYNC_LISTING_ORDER = {
+    "mlid": "newest_first",
+    "ssid": "oldest_first"
+}
+
 class DownloadQuality(Enum):
     BEST = "bestvideo+bestaudio/best"
     HIGH_1080 = "bestvideo[height>=1080]+bestaudio/best[height>=1080]"
@@ -52,27 +121,1405 @@ class DownloadContent(Enum):
     SUBTITLE = "字幕"
     ALL = "全部"
 
+# DownloadQuality 对应的B站清晰度代码(qn)上限，None表示不限制
+QUALITY_MAX_QN = {
+    "BEST": None,
+    "HIGH_1080": 116,   # 1080P60 / 1080P+ / 1080P
+    "HIGH_720": 74,     # 720P60 / 720P
+    "MEDIUM_480": 32,
+    "LOW_360": 16,
+    "AUDIO_ONLY": 16
+}
+
+# DownloadQuality 对应的音频流id上限（30216=64K, 30232=132K, 30280=192K）
+QUALITY_MAX_AUDIO_ID = {
+    "MEDIUM_480": 30232,
+    "LOW_360": 30216
+}
+
+# DASH视频编码id
+VIDEO_CODEC_IDS = {
+    "avc": 7,
+    "hevc": 12,
+    "av1": 13
+}
+
+# HDR / 杜比视界的清晰度代码
+HDR_QN = {125, 126}
+
 class VideoType(Enum):
     SINGLE = "单视频"
     COLLECTION = "合集"
     MULTI_PART = "多P视频"
     UP_SERIES = "UP主系列"
 
+class StreamSelector:
+    """根据下载质量和编码偏好从DASH流中选择视频流和音频流
+    
+    Args:
+        quality: 下载质量
+        codecs: 编码偏好顺序，如 ["avc", "hevc", "av1"]
+        exclude_codecs: 排除的编码
+        allow_hdr: 是否允许HDR/杜比视界流
+        max_frame_rate: 帧率上限，None表示不限制
+    """
+
+    def __init__(self, quality: DownloadQuality, codecs: Optional[List[str]] = None,
+                 exclude_codecs: Optional[List[str]] = None, allow_hdr: bool = False,
+                 max_frame_rate: Optional[float] = None):
+        self.quality = quality
+        self.max_qn = QUALITY_MAX_QN.get(quality.name)
+        self.max_audio_id = QUALITY_MAX_AUDIO_ID.get(quality.name)
+        self.codecs = [VIDEO_CODEC_IDS[c] for c in (codecs or ["avc", "hevc", "av1"]) if c in VIDEO_CODEC_IDS]
+        self.exclude_codecs = {VIDEO_CODEC_IDS[c] for c in (exclude_codecs or []) if c in VIDEO_CODEC_IDS}
+        self.allow_hdr = allow_hdr
+        self.max_frame_rate = max_frame_rate
+
+    @property
+    def qn(self) -> int:
+        """请求playurl时使用的清晰度代码"""
+        return self.max_qn or 127
+
+    @staticmethod
+    def _frame_rate(stream: Dict) -> float:
+        try:
+            return float(stream.get('frameRate') or stream.get('frame_rate') or 0)
+        except ValueError:
+            return 0.0
+
+    def _codec_rank(self, stream: Dict) -> int:
+        codecid = stream.get('codecid')
+        return self.codecs.index(codecid) if codecid in self.codecs else len(self.codecs)
+
+    def select_video(self, videos: List[Dict]) -> Optional[Dict]:
+        """选择视频流：清晰度不超过上限时取最高，同清晰度按编码偏好和码率排序"""
+        candidates = [v for v in videos if v.get('codecid') not in self.exclude_codecs]
+        if not self.allow_hdr:
+            candidates = [v for v in candidates if v.get('id') not in HDR_QN] or candidates
+        if self.max_frame_rate:
+            candidates = [v for v in candidates if self._frame_rate(v) <= self.max_frame_rate + 0.5] or candidates
+        if not candidates:
+            return None
+        
+        capped = [v for v in candidates if self.max_qn is None or v.get('id', 0) <= self.max_qn]
+        if not capped:
+            # 没有不超过上限的流时退而求其次，取最低清晰度
+            lowest = min(v.get('id', 0) for v in candidates)
+            capped = [v for v in candidates if v.get('id', 0) == lowest]
+        
+        return sorted(
+            capped,
+            key=lambda v: (-v.get('id', 0), self._codec_rank(v), -v.get('bandwidth', 0))
+        )[0]
+
+    def select_audio(self, audios: List[Dict]) -> Optional[Dict]:
+        """选择音频流：不超过音质上限时取码率最高的"""
+        if not audios:
+            return None
+        capped = [a for a in audios if self.max_audio_id is None or a.get('id', 0) <= self.max_audio_id]
+        if capped:
+            return max(capped, key=lambda a: a.get('bandwidth', 0))
+        # 没有不超过上限的流时取码率最低的
+        return min(audios, key=lambda a: a.get('bandwidth', 0))
+
+class SlowMirrorError(Exception):
+    """当前镜像吞吐量低于阈值，需要切换到其他镜像"""
+
+class DownloadCancelled(Exception):
+    """任务已被取消"""
+
+class MirrorManager:
+    """CDN镜像管理
+    
+    记录每个CDN主机在本次会话中的下载速度（指数加权平均）和失败次数，
+    并据此对候选地址排序。未测速就失败的主机速度记为0，视为已知的慢主机，
+    不会在每个文件开始时被重新测速；之后成功的传输会逐渐拉高它的速度。
+    """
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def host(url: str) -> str:
+        return urlparse(url).hostname or ""
+
+    def record(self, url: str, nbytes: int, seconds: float):
+        """记录一次传输的字节数和耗时"""
+        if seconds <= 0 or nbytes <= 0:
+            return
+        speed = nbytes / seconds
+        with self.lock:
+            stats = self.hosts.setdefault(self.host(url), {"speed": None, "bytes": 0, "seconds": 0.0, "failures": 0})
+            stats["speed"] = speed if stats["speed"] is None else self.alpha * speed + (1 - self.alpha) * stats["speed"]
+            stats["bytes"] += nbytes
+            stats["seconds"] += seconds
+
+    def record_failure(self, url: str):
+        with self.lock:
+            stats = self.hosts.setdefault(self.host(url), {"speed": None, "bytes": 0, "seconds": 0.0, "failures": 0})
+            stats["failures"] += 1
+            if stats["speed"] is None:
+                stats["speed"] = 0.0
+
+    def score(self, url: str) -> Optional[float]:
+        """主机评分（速度按失败次数折减），没有测速数据时返回None"""
+        with self.lock:
+            stats = self.hosts.get(self.host(url))
+            if not stats or stats["speed"] is None:
+                return None
+            return stats["speed"] / (1 + stats["failures"])
+
+    def is_known(self, url: str) -> bool:
+        return self.score(url) is not None
+
+    def _rank_key(self, url: str) -> float:
+        # rank 与 has_better 共用的排序依据，未测速的主机按0分处理
+        return self.score(url) or 0.0
+
+    def has_better(self, url: str, urls: List[str]) -> bool:
+        """候选中是否存在按 rank 的顺序排在当前主机之前的其他主机"""
+        current = self._rank_key(url)
+        return any(self.host(other) != self.host(url) and self._rank_key(other) > current for other in urls)
+
+    def rank(self, urls: List[str], exclude: str = None) -> List[str]:
+        """按评分从高到低排序，评分相同的保持原顺序
+        
+        Args:
+            urls: 候选地址
+            exclude: 要排除的主机名；排除后没有候选时忽略该参数
+        """
+        candidates = [u for u in urls if self.host(u) != exclude] or list(urls)
+        return sorted(candidates, key=self._rank_key, reverse=True)
+
+    def get_stats(self) -> Dict:
+        """各主机的平均速度(MB/s)、累计字节数和失败次数"""
+        with self.lock:
+            return {
+                host: {
+                    "speed_mb": round((stats["speed"] or 0) / 1024 / 1024, 2),
+                    "bytes": stats["bytes"],
+                    "failures": stats["failures"]
+                }
+                for host, stats in self.hosts.items()
+            }
+
+class FFmpegError(subprocess.CalledProcessError):
+    """ffmpeg/ffprobe执行失败，错误信息中附带stderr末尾内容"""
+
+    def __str__(self):
+        stderr = (self.stderr or b"").decode('utf-8', errors='ignore').strip()
+        tail = stderr.splitlines()[-1] if stderr else "无输出"
+        return f"ffmpeg执行失败(退出码 {self.returncode}): {tail}"
+
+class PostProcessor:
+    """ffmpeg后处理线程池
+    
+    合并、转码等CPU密集任务在独立线程中执行，与下载线程互不阻塞。
+    输入队列有界，后处理积压时 submit 会阻塞调用方，从而反向限制下载速度。
+    每个任务的ffmpeg stderr会被保存，便于排查失败原因。
+    """
+
+    def __init__(self, max_workers: int = None, queue_size: int = None, log_limit: int = 200):
+        self.max_workers = max_workers or os.cpu_count() or 2
+        self.queue = queue.Queue(maxsize=queue_size or self.max_workers * 2)
+        self.job_logs = OrderedDict()
+        self.log_limit = log_limit
+        self.stats = {"completed": 0, "failed": 0}
+        self.lock = threading.Lock()
+        self.threads = []
+        for i in range(self.max_workers):
+            thread = threading.Thread(target=self._worker, name=f"postprocess_{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """提交后处理任务，队列已满时阻塞等待"""
+        future = Future()
+        self.queue.put((future, fn, args, kwargs))
+        return future
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self.queue.task_done()
+                return
+            future, fn, args, kwargs = item
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as e:
+                    with self.lock:
+                        self.stats["failed"] += 1
+                    future.set_exception(e)
+                else:
+                    with self.lock:
+                        self.stats["completed"] += 1
+                    future.set_result(result)
+            finally:
+                self.queue.task_done()
+
+    def run_ffmpeg(self, job_name: str, cmd: List[str]) -> subprocess.CompletedProcess:
+        """执行ffmpeg/ffprobe命令并记录stderr
+        
+        Args:
+            job_name: 任务名称，用于检索日志
+            cmd: 命令行参数
+            
+        Returns:
+            执行结果
+            
+        Raises:
+            FFmpegError: 命令返回非零退出码
+        """
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.record_log(job_name, result.stderr)
+        if result.returncode != 0:
+            raise FFmpegError(result.returncode, cmd, result.stdout, result.stderr)
+        return result
+
+    def record_log(self, job_name: str, stderr: bytes):
+        """保存任务的stderr末尾内容，超过上限时丢弃最早的记录"""
+        with self.lock:
+            self.job_logs[job_name] = (stderr or b"").decode('utf-8', errors='ignore')[-4000:]
+            self.job_logs.move_to_end(job_name)
+            while len(self.job_logs) > self.log_limit:
+                self.job_logs.popitem(last=False)
+
+    def pending_count(self) -> int:
+        """队列中等待处理的任务数"""
+        return self.queue.qsize()
+
+    def shutdown(self):
+        """通知所有工作线程在处理完队列后退出"""
+        for _ in self.threads:
+            self.queue.put(None)
+
+class ApiCache:
+    """持久化的API元数据缓存
+    
+    以单个SQLite文件保存，按 (接口, 键) 存取JSON数据。
+    每个接口有独立的过期时间，条目总数超过上限时按最近访问时间淘汰。
+    """
+
+    DEFAULT_TTLS = {
+        "view": 24 * 3600,
+        "collection": 3600
+    }
+
+    def __init__(self, path: Path, max_entries: int = 5000, ttls: Optional[Dict] = None):
+        self.max_entries = max_entries
+        self.ttls = dict(self.DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+        self.lock = threading.Lock()
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(str(path), check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.Error:
+            # 缓存文件不可用时退回内存缓存
+            self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS api_cache (
+                endpoint TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (endpoint, key)
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_api_cache_accessed ON api_cache (accessed)")
+        self.conn.commit()
+
+    def get(self, endpoint: str, key: str):
+        """读取缓存，未命中或已过期时返回None"""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, created FROM api_cache WHERE endpoint = ? AND key = ?",
+                (endpoint, key)
+            ).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            
+            ttl = self.ttls.get(endpoint)
+            if ttl is not None and now - row[1] > ttl:
+                self.conn.execute("DELETE FROM api_cache WHERE endpoint = ? AND key = ?", (endpoint, key))
+                self.conn.commit()
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return None
+            
+            self.conn.execute(
+                "UPDATE api_cache SET accessed = ? WHERE endpoint = ? AND key = ?",
+                (now, endpoint, key)
+            )
+            self.conn.commit()
+            self.stats["hits"] += 1
+        return json.loads(row[0])
+
+    def contains(self, endpoint: str, key: str) -> bool:
+        """判断是否有未过期的缓存，不计入命中统计也不更新访问时间"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT created FROM api_cache WHERE endpoint = ? AND key = ?", (endpoint, key)
+            ).fetchone()
+        ttl = self.ttls.get(endpoint)
+        return row is not None and (ttl is None or time.time() - row[0] <= ttl)
+
+    def set(self, endpoint: str, key: str, value):
+        """写入缓存，超过条目上限时淘汰最久未访问的条目"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO api_cache (endpoint, key, value, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (endpoint, key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            count = self.conn.execute("SELECT COUNT(*) FROM api_cache").fetchone()[0]
+            if count > self.max_entries:
+                overflow = count - self.max_entries
+                self.conn.execute(
+                    "DELETE FROM api_cache WHERE rowid IN "
+                    "(SELECT rowid FROM api_cache ORDER BY accessed LIMIT ?)",
+                    (overflow,)
+                )
+                self.stats["evicted"] += overflow
+            self.conn.commit()
+
+    def get_stats(self) -> Dict:
+        """返回命中统计与当前条目数"""
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM api_cache").fetchone()[0]
+            return dict(self.stats, entries=entries)
+
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.conn.execute("DELETE FROM api_cache")
+            self.conn.commit()
+
+class SingleFlight:
+    """合并相同的进行中接口请求
+    
+    API缓存要等响应返回后才写入，并发的调用方同时未命中缓存时会发出多个相同的请求。
+    同一个键（接口与参数）的请求进行中时，后来的调用方不再发出请求，而是等待这次请求
+    并共用其结果或异常；请求结束后键即释放，之后的调用照常先查缓存。
+    共用的结果按调用方深拷贝，调用方修改结果不会互相影响。
+    
+    线程中用 do() 调用；协程中由调用方用 acquire()/release() 自行等待
+    （见 AsyncBiliEngine.single_flight），两者共用同一张进行中的请求表。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # 键 -> 进行中请求的 Future
+        self.calls: Dict[Tuple, Future] = {}
+        # 接口 -> {"requests": 实际发出的请求数, "saved": 合并掉的请求数}
+        self.stats = {}
+
+    def acquire(self, key: Tuple) -> Tuple[Future, bool]:
+        """登记一次调用，返回 (请求的Future, 是否由本调用方发出请求)"""
+        with self.lock:
+            stats = self.stats.setdefault(key[0], {"requests": 0, "saved": 0})
+            future = self.calls.get(key)
+            if future is not None:
+                stats["saved"] += 1
+                return future, False
+            future = self.calls[key] = Future()
+            stats["requests"] += 1
+            return future, True
+
+    def release(self, key: Tuple, future: Future):
+        """发出请求的调用方在设置结果之前释放键"""
+        with self.lock:
+            if self.calls.get(key) is future:
+                del self.calls[key]
+
+    def do(self, key: Tuple, func: Callable, *args):
+        """执行 func(*args)，相同键的请求进行中时等待其结果
+        
+        Args:
+            key: (接口, 参数...)，第一个元素用于按接口统计
+            func: 发出请求的函数
+            
+        Returns:
+            func 的返回值
+        """
+        while True:
+            future, leader = self.acquire(key)
+            if not leader:
+                try:
+                    return copy.deepcopy(future.result())
+                except CancelledError:
+                    # 发出请求的协程被取消，由本调用方重新发出
+                    continue
+            try:
+                result = func(*args)
+            except BaseException as e:
+                self.release(key, future)
+                future.set_exception(e)
+                raise
+            self.release(key, future)
+            future.set_result(result)
+            return result
+
+    def get_stats(self) -> Dict:
+        """实际请求数、合并掉的请求数、进行中的请求数和各接口的统计"""
+        with self.lock:
+            by_endpoint = {endpoint: dict(stats) for endpoint, stats in self.stats.items()}
+            in_flight = len(self.calls)
+        return {
+            "requests": sum(stats["requests"] for stats in by_endpoint.values()),
+            "saved": sum(stats["saved"] for stats in by_endpoint.values()),
+            "in_flight": in_flight,
+            "endpoints": by_endpoint
+        }
+
+
+class SyncManifest:
+    """单个合集的增量同步清单
+    
+    以JSON文件保存已见过的分集（键、序号、cid、首次/最后出现时间、已下载文件及大小）
+    和列表水位。同步时只获取水位之后的分页，并且只把新增、cid变化或文件缺失的分集加入下载队列。
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                return data
+        except (OSError, ValueError):
+            pass
+        return {"version": self.VERSION, "watermark": {}, "episodes": {}}
+
+    @property
+    def episodes(self) -> Dict:
+        return self.data["episodes"]
+
+    def save(self):
+        """原子地写入清单文件"""
+        with self.lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+
+class BatchJournal:
+    """批量下载的持久化任务日志
+    
+    以SQLite保存每个URL文件的读取位置、每个URL和每个分P的状态与尝试次数，
+    每次状态变化立即提交。程序崩溃或重启后，用同一个URL文件再次开始批量下载，
+    会从上次读到的位置继续读取文件，已完成的URL和分P直接跳过，
+    中断时处于解析/下载/合并中的任务重新排队。
+    
+    URL状态：pending、resolving、downloading、done、failed
+    分P状态：pending、downloading、muxing、done、failed
+    """
+
+    def __init__(self, path: Path):
+        self.lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS batches (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT NOT NULL UNIQUE,
+                read_offset INTEGER NOT NULL DEFAULT 0,
+                line_count INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                updated REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS batch_items (
+                batch_id INTEGER NOT NULL,
+                key TEXT NOT NULL,
+                url TEXT NOT NULL,
+                line INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                title TEXT,
+                error TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (batch_id, key)
+            );
+            CREATE INDEX IF NOT EXISTS idx_batch_items_state ON batch_items (batch_id, state, line);
+            CREATE TABLE IF NOT EXISTS batch_pages (
+                batch_id INTEGER NOT NULL,
+                item_key TEXT NOT NULL,
+                p INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                state TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated REAL NOT NULL,
+                PRIMARY KEY (batch_id, item_key, p, content)
+            );
+        """)
+        self.conn.commit()
+
+    def open_batch(self, source: str, file_size: int, max_attempts: int) -> Tuple[int, int, int]:
+        """打开或创建URL文件对应的批次，并把中断的任务重新排队
+        
+        Args:
+            source: URL文件的绝对路径
+            file_size: URL文件当前大小，小于已读位置时说明文件被重写，批次从头开始
+            max_attempts: 失败次数未达到该值的URL重新排队
+            
+        Returns:
+            (批次ID, 文件读取位置, 已读取行数)
+        """
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id, read_offset, line_count FROM batches WHERE source = ?", (source,)
+            ).fetchone()
+            if row is None:
+                cursor = self.conn.execute(
+                    "INSERT INTO batches (source, created, updated) VALUES (?, ?, ?)", (source, now, now)
+                )
+                self.conn.commit()
+                return cursor.lastrowid, 0, 0
+            
+            batch_id, read_offset, line_count = row
+            if file_size < read_offset:
+                self.conn.execute("DELETE FROM batch_items WHERE batch_id = ?", (batch_id,))
+                self.conn.execute("DELETE FROM batch_pages WHERE batch_id = ?", (batch_id,))
+                read_offset = line_count = 0
+            self.conn.execute(
+                "UPDATE batch_items SET state = 'pending', updated = ? "
+                "WHERE batch_id = ? AND (state IN ('resolving', 'downloading') "
+                "OR (state = 'failed' AND attempts < ?))",
+                (now, batch_id, max_attempts)
+            )
+            self.conn.execute(
+                "UPDATE batch_pages SET state = 'pending', updated = ? "
+                "WHERE batch_id = ? AND state != 'done'",
+                (now, batch_id)
+            )
+            self.conn.execute(
+                "UPDATE batches SET read_offset = ?, line_count = ?, updated = ? WHERE id = ?",
+                (read_offset, line_count, now, batch_id)
+            )
+            self.conn.commit()
+            return batch_id, read_offset, line_count
+
+    def add_items(self, batch_id: int, items: List[Tuple[str, str, int]], read_offset: int, line_count: int) -> int:
+        """在同一事务中写入新读取的URL和文件读取位置，键相同的URL只保留第一个
+        
+        Returns:
+            实际新增的URL数
+        """
+        now = time.time()
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO batch_items (batch_id, key, url, line, state, updated) "
+                "VALUES (?, ?, ?, ?, 'pending', ?)",
+                [(batch_id, key, url, line, now) for key, url, line in items]
+            )
+            added = self.conn.total_changes - before
+            self.conn.execute(
+                "UPDATE batches SET read_offset = ?, line_count = ?, updated = ? WHERE id = ?",
+                (read_offset, line_count, now, batch_id)
+            )
+            self.conn.commit()
+            return added
+
+    def pending_items(self, batch_id: int, limit: int) -> List[Dict]:
+        """文件中最靠前的若干个待处理URL，不改变状态"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, url FROM batch_items WHERE batch_id = ? AND state = 'pending' ORDER BY line LIMIT ?",
+                (batch_id, limit)
+            ).fetchall()
+        return [{"key": key, "url": url} for key, url in rows]
+
+    def claim_item(self, batch_id: int, key: str = None) -> Optional[Dict]:
+        """取出待处理URL并标记为解析中
+        
+        Args:
+            batch_id: 批次ID
+            key: 指定要取出的URL，为None时取文件中最靠前的一个
+            
+        Returns:
+            URL信息，没有（或指定的URL已不是）待处理状态时返回None
+        """
+        with self.lock:
+            if key is None:
+                row = self.conn.execute(
+                    "SELECT key, url, attempts FROM batch_items WHERE batch_id = ? AND state = 'pending' "
+                    "ORDER BY line LIMIT 1",
+                    (batch_id,)
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    "SELECT key, url, attempts FROM batch_items WHERE batch_id = ? AND key = ? AND state = 'pending'",
+                    (batch_id, key)
+                ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE batch_items SET state = 'resolving', attempts = attempts + 1, error = NULL, updated = ? "
+                "WHERE batch_id = ? AND key = ?",
+                (time.time(), batch_id, row[0])
+            )
+            self.conn.commit()
+        return {"key": row[0], "url": row[1], "attempts": row[2] + 1}
+
+    def set_item_state(self, batch_id: int, key: str, state: str, error: str = None, title: str = None):
+        with self.lock:
+            self.conn.execute(
+                "UPDATE batch_items SET state = ?, error = ?, title = COALESCE(?, title), updated = ? "
+                "WHERE batch_id = ? AND key = ?",
+                (state, error, title, time.time(), batch_id, key)
+            )
+            self.conn.commit()
+
+    def page_done(self, batch_id: int, key: str, p: int, content: str) -> bool:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT state FROM batch_pages WHERE batch_id = ? AND item_key = ? AND p = ? AND content = ?",
+                (batch_id, key, p, content)
+            ).fetchone()
+        return row is not None and row[0] == "done"
+
+    def set_page_state(self, batch_id: int, key: str, p: int, content: str, state: str, error: str = None):
+        """更新分P状态，进入下载中时尝试次数加一"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO batch_pages (batch_id, item_key, p, content, state, attempts, error, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (batch_id, item_key, p, content) DO UPDATE SET "
+                "state = excluded.state, attempts = attempts + excluded.attempts, "
+                "error = excluded.error, updated = excluded.updated",
+                (batch_id, key, p, content, state, 1 if state == "downloading" else 0, error, time.time())
+            )
+            self.conn.commit()
+
+    def page_counts(self, batch_id: int, key: str) -> Dict[str, int]:
+        """某个URL下各状态的分P数"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT state, COUNT(*) FROM batch_pages WHERE batch_id = ? AND item_key = ? GROUP BY state",
+                (batch_id, key)
+            ).fetchall()
+        return dict(rows)
+
+    def item_counts(self, batch_id: int) -> Dict[str, int]:
+        """批次中各状态的URL数"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT state, COUNT(*) FROM batch_items WHERE batch_id = ? GROUP BY state", (batch_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def failed_items(self, batch_id: int) -> List[Dict]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT url, attempts, error FROM batch_items WHERE batch_id = ? AND state = 'failed' ORDER BY line",
+                (batch_id,)
+            ).fetchall()
+        return [{"url": url, "attempts": attempts, "error": error} for url, attempts, error in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class MetadataResolver:
+    """批量下载的元数据预取阶段
+    
+    批量下载时在下载之前提前解析后续URL的view接口数据：已有未过期缓存的视频直接就绪，
+    其余视频在独立的小线程池中并发请求（同样经过 _safe_request，受共享的限速器约束），
+    结果写入API缓存。下载阶段按就绪顺序取出URL，parse_url 和 get_video_info 直接命中缓存，
+    元数据请求与文件传输并行进行，而不是在每个URL的下载之前串行等待。
+    
+    预取失败时不报错，该URL照常进入下载阶段，由原有的解析和重试逻辑处理。
+    
+    Args:
+        downloader: 发出请求并持有API缓存的下载器
+        concurrency: 同时进行的元数据请求数
+    """
+
+    def __init__(self, downloader: "BiliDownloader", concurrency: int):
+        self.downloader = downloader
+        self.executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="metadata")
+        # URL键 -> 预取任务，按提交顺序排列；就绪的URL被取走后删除
+        self.futures: Dict[str, Future] = {}
+        self.stats = {"submitted": 0, "cached": 0, "fetched": 0, "failed": 0}
+        self.lock = threading.Lock()
+
+    def submit(self, key: str, url: str):
+        """提交一个URL的预取，已提交过的键直接忽略"""
+        if key in self.futures:
+            return
+        self.stats["submitted"] += 1
+        match = re.search(r"video/(BV\w+)", urlparse(url).path)
+        if match and not self.downloader.api_cache.contains("view", match.group(1)):
+            self.futures[key] = self.executor.submit(self._fetch, match.group(1))
+            return
+        # 已缓存的视频以及收藏夹/课程等不需要view数据的链接立即就绪
+        if match:
+            self.stats["cached"] += 1
+        future = Future()
+        future.set_result(None)
+        self.futures[key] = future
+
+    def _fetch(self, bvid: str):
+        try:
+            self.downloader._get_view_data(bvid)
+            outcome = "fetched"
+        except Exception:
+            outcome = "failed"
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def take_ready(self) -> Optional[str]:
+        """取出最早提交的已就绪URL键，没有时返回None"""
+        for key, future in self.futures.items():
+            if future.done():
+                del self.futures[key]
+                return key
+        return None
+
+    def in_flight(self) -> set:
+        """尚未完成的预取任务，供调用方与下载任务一起等待"""
+        return {future for future in self.futures.values() if not future.done()}
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+
+class TokenBucket:
+    """自适应令牌桶（AIMD）
+    
+    触发限流（412/429）时速率减半；持续正常响应时，每隔 increase_interval 秒
+    速率增加 increase，直到 max_rate。
+    """
+
+    def __init__(self, rate: float, burst: float = None, min_rate: float = 0.5, max_rate: float = None,
+                 increase: float = 0.5, increase_interval: float = 5.0):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate, 1))
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate or rate * 4)
+        self.increase = float(increase)
+        self.increase_interval = float(increase_interval)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.last_adjust = self.updated
+        self.stats = {"requests": 0, "throttled": 0, "waited": 0.0}
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """获取一个令牌，没有可用令牌时阻塞等待"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.stats["requests"] += 1
+                    return
+                wait_time = (1 - self.tokens) / self.rate
+                self.stats["waited"] += wait_time
+            time.sleep(wait_time)
+
+    def reserve(self) -> float:
+        """预占一个令牌并返回需要等待的秒数，供异步调用方自行等待"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            self.stats["requests"] += 1
+            wait_time = max(0.0, -self.tokens) / self.rate
+            self.stats["waited"] += wait_time
+            return wait_time
+
+    def on_success(self):
+        """正常响应，满足间隔时加性增加速率"""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_adjust >= self.increase_interval:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+                self.last_adjust = now
+
+    def on_throttle(self):
+        """被限流，乘性降低速率并清空令牌"""
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0
+            self.last_adjust = time.monotonic()
+            self.stats["throttled"] += 1
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return dict(self.stats, rate=round(self.rate, 2))
+
+class RateLimiter:
+    """按主机类别共享的请求限速器，线程安全
+    
+    主机类别：api（api.bilibili.com）、comment（comment.bilibili.com）、
+    cdn（upos等视频CDN节点），其余主机不限速。
+    host_classes 可额外指定主机到类别的映射，优先于内置规则。
+    """
+
+    DEFAULT_LIMITS = {
+        "api": {"rate": 4, "burst": 4, "min_rate": 0.5, "max_rate": 20},
+        "comment": {"rate": 2, "burst": 2, "min_rate": 0.5, "max_rate": 10},
+        "cdn": {"rate": 20, "burst": 20, "min_rate": 2, "max_rate": 100}
+    }
+
+    def __init__(self, limits: Optional[Dict] = None, host_classes: Optional[Dict] = None):
+        self.host_classes = dict(host_classes or {})
+        self.buckets = {}
+        for host_class, default in self.DEFAULT_LIMITS.items():
+            options = dict(default)
+            options.update((limits or {}).get(host_class, {}))
+            self.buckets[host_class] = TokenBucket(**options)
+
+    def classify(self, url: str) -> str:
+        """判断URL所属的主机类别"""
+        host = urlparse(url).hostname or ""
+        if host in self.host_classes:
+            return self.host_classes[host]
+        if host == "api.bilibili.com":
+            return "api"
+        if host == "comment.bilibili.com":
+            return "comment"
+        if "upos" in host or host.endswith((".bilivideo.com", ".bilivideo.cn", ".akamaized.net", ".hdslb.com")):
+            return "cdn"
+        return "other"
+
+    def acquire(self, url: str):
+        bucket = self.buckets.get(self.classify(url))
+        if bucket:
+            bucket.acquire()
+
+    def reserve(self, url: str) -> float:
+        """预占令牌并返回需要等待的秒数，不限速的主机返回0"""
+        bucket = self.buckets.get(self.classify(url))
+        return bucket.reserve() if bucket else 0.0
+
+    def report(self, url: str, status_code: int):
+        """根据响应状态码调整对应类别的速率"""
+        bucket = self.buckets.get(self.classify(url))
+        if not bucket:
+            return
+        if status_code in (412, 429):
+            bucket.on_throttle()
+        elif status_code < 400:
+            bucket.on_success()
+
+    def current_rate(self, url: str) -> Optional[float]:
+        bucket = self.buckets.get(self.classify(url))
+        return bucket.get_stats()["rate"] if bucket else None
+
+    def get_stats(self) -> Dict:
+        """各类别的当前速率、请求数与限流次数"""
+        return {host_class: bucket.get_stats() for host_class, bucket in self.buckets.items()}
+
+class HostSessions:
+    """按主机分片的HTTP会话，线程安全
+    
+    api 和 comment 按类别各用一个会话，CDN 和其他主机（例如未识别的镜像节点）每个主机单独一个会话，
+    每个会话挂载按类别设置连接池大小的 HTTPAdapter。requests 默认每主机只保留10个空闲连接，
+    并发超过该数时归还的连接会被丢弃，下次请求重新建立TCP/TLS连接；分片后连接池按主机计算，
+    大小可配置，稳定运行时几乎所有请求都复用已有连接。
+    所有分片共用基础会话的 Cookie，请求头由调用方按类别用 request_headers 选取。
+    
+    Args:
+        base: 基础会话，提供共享的 Cookie
+        classify: 判断URL主机类别的函数，通常是 RateLimiter.classify
+        pool_sizes: 各类别每主机的连接池大小，hosts 可单独指定主机，例如 {"cdn": 64, "hosts": {主机: 大小}}；
+            未指定的类别使用 DEFAULT_POOL_SIZES
+    """
+
+    DEFAULT_POOL_SIZES = {"api": 16, "comment": 4, "cdn": 32, "other": 8}
+
+    def __init__(self, base: requests.Session, classify: Callable[[str], str], pool_sizes: Optional[Dict] = None):
+        self.base = base
+        self.classify = classify
+        self.lock = threading.Lock()
+        # 分片键（类别名或主机名）-> {"session", "adapter", "class"}
+        self.shards = {}
+        self.requested_sizes = None
+        self.configure(pool_sizes)
+
+    def configure(self, pool_sizes: Optional[Dict]):
+        """更新连接池大小，大小有变化时丢弃已有分片，进行中的请求继续使用旧连接池直到结束"""
+        pool_sizes = pool_sizes or {}
+        if pool_sizes == self.requested_sizes:
+            return
+        self.requested_sizes = pool_sizes
+        sizes = dict(self.DEFAULT_POOL_SIZES)
+        sizes.update({key: value for key, value in pool_sizes.items() if key in self.DEFAULT_POOL_SIZES})
+        with self.lock:
+            self.pool_sizes = {key: max(1, int(value)) for key, value in sizes.items()}
+            self.host_pool_sizes = {host: max(1, int(value)) for host, value in (pool_sizes.get("hosts") or {}).items()}
+            self.retired = self._count(self.shards.values(), getattr(self, "retired", None))
+            self.shards = {}
+
+    def get(self, url: str) -> Tuple[requests.Session, str]:
+        """返回URL对应的会话及其主机类别"""
+        host_class = self.classify(url)
+        host = urlparse(url).hostname or ""
+        key = host_class if host_class in ("api", "comment") and host not in self.host_pool_sizes else host
+        shard = self.shards.get(key)
+        if shard is None:
+            with self.lock:
+                shard = self.shards.get(key)
+                if shard is None:
+                    shard = self.shards[key] = self._create(host_class, self.host_pool_sizes.get(host))
+        return shard["session"], host_class
+
+    def _create(self, host_class: str, pool_size: Optional[int]) -> Dict:
+        pool_size = pool_size or self.pool_sizes.get(host_class, self.pool_sizes["other"])
+        session = requests.Session()
+        session.cookies = self.base.cookies
+        # api 和 comment 分片可能对应多个主机，其余分片只有一个主机
+        adapter = HTTPAdapter(pool_connections=4 if host_class in ("api", "comment") else 1, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return {"session": session, "adapter": adapter, "class": host_class}
+
+    @staticmethod
+    def _count(shards, totals: Optional[Dict] = None) -> Dict:
+        """按类别累计请求数与新建连接数"""
+        totals = {key: dict(value) for key, value in (totals or {}).items()}
+        for shard in list(shards):
+            stats = totals.setdefault(shard["class"], {"requests": 0, "connections": 0})
+            pools = shard["adapter"].poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                stats["requests"] += pool.num_requests
+                stats["connections"] += pool.num_connections
+        return totals
+
+    def get_stats(self) -> Dict:
+        """各类别的请求数、新建连接数（HTTPS即TLS握手数）和连接复用率"""
+        with self.lock:
+            shards = list(self.shards.values())
+            retired = self.retired
+        return self.summarize(self._count(shards, retired), shards=len(shards),
+                              pool_sizes=dict(self.pool_sizes, hosts=dict(self.host_pool_sizes)))
+
+    @staticmethod
+    def summarize(by_class: Dict, **extra) -> Dict:
+        """由各类别的请求数与新建连接数计算复用率和合计"""
+        for stats in by_class.values():
+            stats["reuse_ratio"] = round(1 - stats["connections"] / stats["requests"], 4) if stats["requests"] else None
+        requests_sum = sum(stats["requests"] for stats in by_class.values())
+        connections_sum = sum(stats["connections"] for stats in by_class.values())
+        return dict(
+            extra,
+            requests=requests_sum,
+            connections=connections_sum,
+            reuse_ratio=round(1 - connections_sum / requests_sum, 4) if requests_sum else None,
+            classes=by_class
+        )
+
+class ByteBucket:
+    """按字节计量的令牌桶，允许欠账
+    
+    预占后令牌可以为负，调用方在锁外按返回的秒数等待，
+    多个连接同时预占时总吞吐仍收敛到设定速率。rate为0表示不限速，此时不加锁。
+    """
+
+    def __init__(self, rate: float = 0):
+        self.rate = float(rate or 0)
+        self.tokens = self.rate * BANDWIDTH_BURST_SECONDS
+        self.updated = time.monotonic()
+        self.stats = {"bytes": 0, "waited": 0.0}
+        self.lock = threading.Lock()
+
+    def set_rate(self, rate: float):
+        """修改速率，已欠的令牌保留，正在进行的传输随即按新速率限速"""
+        with self.lock:
+            now = time.monotonic()
+            if self.rate > 0:
+                self.tokens = min(self.rate * BANDWIDTH_BURST_SECONDS,
+                                  self.tokens + (now - self.updated) * self.rate)
+            self.rate = float(rate or 0)
+            self.tokens = min(self.tokens, self.rate * BANDWIDTH_BURST_SECONDS)
+            self.updated = now
+
+    def reserve(self, amount: int) -> float:
+        """预占amount字节并返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self.lock:
+            rate = self.rate
+            if rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            self.tokens = min(rate * BANDWIDTH_BURST_SECONDS, self.tokens + (now - self.updated) * rate)
+            self.updated = now
+            self.tokens -= amount
+            wait_time = max(0.0, -self.tokens) / rate
+            self.stats["bytes"] += amount
+            self.stats["waited"] += wait_time
+            return wait_time
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            return dict(self.stats, waited=round(self.stats["waited"], 2), rate_kb=round(self.rate / 1024, 1))
+
+class Throttle:
+    """单个传输连接的带宽限制
+    
+    接收的字节先在连接内累计，满 BANDWIDTH_BATCH_BYTES 才向全局、任务和主机三个令牌桶预占，
+    高并发时共享的锁不会随每个数据块争用。
+    """
+
+    def __init__(self, shaper: "BandwidthShaper", buckets: List[ByteBucket]):
+        self.shaper = shaper
+        self.buckets = buckets
+        self.pending = 0
+
+    def consume(self, amount: int) -> float:
+        """记录已接收的字节
+        
+        Returns:
+            继续读取前需要等待的秒数
+        """
+        self.pending += amount
+        if self.pending < BANDWIDTH_BATCH_BYTES:
+            return 0.0
+        amount, self.pending = self.pending, 0
+        self.shaper.refresh()
+        if not self.shaper.active:
+            return 0.0
+        return max(bucket.reserve(amount) for bucket in self.buckets)
+
+class BandwidthShaper:
+    """全局、单任务和单主机三级的下载带宽限制，线程安全
+    
+    limits: {"global": KB/s, "job": KB/s, "host": KB/s, "hosts": {主机名: KB/s}}，0表示不限。
+    schedule: [{"start": "09:00", "end": "18:00", "global": 1024, ...}]，
+    当前时间落在时段内时覆盖 limits 中的同名项，end早于start表示跨午夜。
+    """
+
+    SCOPES = ("global", "job", "host")
+
+    def __init__(self, limits: Optional[Dict] = None, schedule: Optional[List[Dict]] = None):
+        self.global_bucket = ByteBucket()
+        self.job_buckets = weakref.WeakSet()
+        self.host_buckets = {}
+        self.lock = threading.Lock()
+        self.effective = {}
+        self.active = False
+        self.next_refresh = 0.0
+        self.configure(limits, schedule)
+
+    def configure(self, limits: Optional[Dict] = None, schedule: Optional[List[Dict]] = None):
+        """替换限速配置，正在进行的传输立即生效"""
+        with self.lock:
+            self.limits = dict(limits or {})
+            self.schedule = [dict(entry) for entry in (schedule or [])]
+        self.refresh(force=True)
+
+    @staticmethod
+    def _minutes(value: str) -> int:
+        hour, minute = str(value).split(":")
+        return int(hour) * 60 + int(minute)
+
+    def effective_limits(self, now: Optional[time.struct_time] = None) -> Dict:
+        """计算当前时刻生效的限速（KB/s）"""
+        now = now or time.localtime()
+        current = now.tm_hour * 60 + now.tm_min
+        limits = {scope: float(self.limits.get(scope) or 0) for scope in self.SCOPES}
+        limits["hosts"] = dict(self.limits.get("hosts") or {})
+        for entry in self.schedule:
+            start, end = self._minutes(entry["start"]), self._minutes(entry["end"])
+            if start <= current < end or (end < start and (current >= start or current < end)):
+                for scope in self.SCOPES:
+                    if scope in entry:
+                        limits[scope] = float(entry[scope] or 0)
+                if "hosts" in entry:
+                    limits["hosts"].update(entry["hosts"])
+        return limits
+
+    def refresh(self, force: bool = False):
+        """按时段重新计算限速；未到检查时间时只做一次比较"""
+        if not force and time.monotonic() < self.next_refresh:
+            return
+        with self.lock:
+            self.next_refresh = time.monotonic() + BANDWIDTH_SCHEDULE_CHECK
+            limits = self.effective_limits()
+            if limits == self.effective and not force:
+                return
+            self.effective = limits
+            self.global_bucket.set_rate(limits["global"] * 1024)
+            for bucket in list(self.job_buckets):
+                bucket.set_rate(limits["job"] * 1024)
+            for host, bucket in self.host_buckets.items():
+                bucket.set_rate(self._host_rate(limits, host))
+            self.active = bool(limits["global"] or limits["job"] or limits["host"]
+                               or any(limits["hosts"].values()))
+
+    @staticmethod
+    def _host_rate(limits: Dict, host: str) -> float:
+        return float(limits["hosts"].get(host, limits["host"]) or 0) * 1024
+
+    def job_bucket(self) -> ByteBucket:
+        """为一个任务创建令牌桶，任务结束后随下载器副本一起回收"""
+        with self.lock:
+            bucket = ByteBucket(self.effective.get("job", 0) * 1024)
+            self.job_buckets.add(bucket)
+            return bucket
+
+    def throttle(self, url: str, job_bucket: ByteBucket) -> Throttle:
+        """为一次传输创建限速器"""
+        host = urlparse(url).hostname or ""
+        bucket = self.host_buckets.get(host)
+        if bucket is None:
+            with self.lock:
+                bucket = self.host_buckets.get(host)
+                if bucket is None:
+                    bucket = self.host_buckets[host] = ByteBucket(self._host_rate(self.effective, host))
+        return Throttle(self, [self.global_bucket, job_bucket, bucket])
+
+    @classmethod
+    def parse_schedule(cls, text: str) -> List[Dict]:
+        """解析时段限速文本
+        
+        格式为分号分隔的 "09:00-18:00 2048" 或 "09:00-18:00 global=2048 job=512"，
+        单独的数字表示全局限速（KB/s）。
+        """
+        schedule = []
+        for part in re.split(r"[;；\n]", text or ""):
+            fields = part.split()
+            if not fields:
+                continue
+            span = re.fullmatch(r"(\d{1,2}:\d{2})-(\d{1,2}:\d{2})", fields[0])
+            if not span:
+                raise ValueError(f"无效的时段: {fields[0]}")
+            entry = {"start": span.group(1), "end": span.group(2)}
+            for start_end in (entry["start"], entry["end"]):
+                if not 0 <= cls._minutes(start_end) <= 24 * 60:
+                    raise ValueError(f"无效的时间: {start_end}")
+            for field in fields[1:]:
+                scope, _, value = field.rpartition("=")
+                scope = scope or "global"
+                if scope not in cls.SCOPES:
+                    raise ValueError(f"无效的限速范围: {scope}")
+                entry[scope] = max(0.0, float(value))
+            schedule.append(entry)
+        return schedule
+
+    @classmethod
+    def format_schedule(cls, schedule: List[Dict]) -> str:
+        """parse_schedule 的逆操作，用于在设置界面中显示"""
+        parts = []
+        for entry in schedule or []:
+            fields = [f"{entry['start']}-{entry['end']}"]
+            fields += [f"{scope}={entry[scope]:g}" for scope in cls.SCOPES if scope in entry]
+            parts.append(" ".join(fields))
+        return "; ".join(parts)
+
+    def get_stats(self) -> Dict:
+        """当前生效的限速与各级令牌桶的统计"""
+        with self.lock:
+            hosts = dict(self.host_buckets)
+            effective = dict(self.effective)
+        return {
+            "limits_kb": effective,
+            "global": self.global_bucket.get_stats(),
+            "hosts": {host: bucket.get_stats() for host, bucket in hosts.items() if bucket.rate > 0}
+        }
+
+class ConsoleProgressView:
+    """在终端中显示进度总线的快照：每个进行中的传输一行，另有一行汇总速度与剩余时间，结束后清除
+    
+    用法：with ConsoleProgressView(downloader.progress_bus): downloader.download_video(...)
+    """
+
+    def __init__(self, progress_bus: ProgressBus):
+        self.progress_bus = progress_bus
+        self.progress = Progress(
+            TextColumn("{task.description}"),
+            BarColumn(),
+            TaskProgressColumn(),
+            DownloadColumn(),
+            TextColumn("[green]{task.fields[speed]}"),
+            TextColumn("[yellow]剩余 {task.fields[eta]}"),
+            console=console,
+            transient=True
+        )
+        self.rows = {}
+        self.total_row = None
+
+    def __enter__(self):
+        self.progress.start()
+        self.total_row = self.progress.add_task("[bold cyan]总计", total=None, speed="", eta=format_eta(None))
+        self.progress_bus.subscribe(self._on_snapshot)
+        return self
+
+    def __exit__(self, *exc):
+        self.progress_bus.unsubscribe(self._on_snapshot)
+        self.progress.stop()
+
+    def _on_snapshot(self, snapshot: Dict):
+        for task in snapshot["tasks"]:
+            row = self.rows.get(task["id"])
+            if task["state"] != "running":
+                # 结束的传输移出列表，失败原因由错误回调报告
+                if row is not None:
+                    self.progress.remove_task(row)
+                    del self.rows[task["id"]]
+                continue
+            if row is None:
+                row = self.rows[task["id"]] = self.progress.add_task(
+                    f"[cyan]{task['label'][:30]}", total=None, speed="", eta=""
+                )
+            self.progress.update(row, completed=task["downloaded"], total=task["total"] or None,
+                                 speed=f"{task['speed'] / 1024 / 1024:.1f}MB/s", eta=format_eta(task["eta"]))
+        aggregate = snapshot["aggregate"]
+        self.progress.update(self.total_row, completed=aggregate["downloaded"], total=aggregate["total"] or None,
+                             speed=f"{aggregate['speed'] / 1024 / 1024:.1f}MB/s", eta=format_eta(aggregate["eta"]))
+
 class BiliDownloader:
     def __init__(self, status_callback=None, progress_callback=None, error_callback=None):
+        # 基础会话提供共享的Cookie，下载器自身的请求通过 self.sessions 按主机分片发出
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         self._init_anti_spider()
         self.download_root = Path("./downloads")
         self.download_root.mkdir(exist_ok=True)
         self.config_path = Path("./config.json")
-        self.api_cache = {}
         self.page_workers = min(os.cpu_count() * 2, 16)
         self.item_workers = min(os.cpu_count() * 4, 32)
         self.lock = threading.Lock()
+        self.merge_stats = {"copy": 0, "transcode": 0}
+        self.playurl_cache = {}
+        self.playurl_stats = {"hits": 0, "misses": 0}
         self.status_callback = status_callback
         self.progress_callback = progress_callback
         self.error_callback = error_callback
         self.load_config()
+        # 传输进度由采样线程按固定间隔汇总，界面订阅 progress_bus 而不是逐块回调
+        self.progress_bus = ProgressBus(float(self.config.get("progress_interval", 0.25)))
+        self._init_concurrency_limits()
+        self.api_base = self.config.get("api_base", "https://api.bilibili.com").rstrip("/")
+        self.comment_base = self.config.get("comment_base", "https://comment.bilibili.com").rstrip("/")
+        # 接口与弹幕使用同一主机时按接口类别限速
+        host_classes = {urlparse(self.comment_base).hostname: "comment"}
+        host_classes[urlparse(self.api_base).hostname] = "api"
+        host_classes.update(self.config.get("host_classes") or {})
+        self.rate_limiter = RateLimiter(self.config.get("rate_limits"), host_classes)
+        # 按主机类别和CDN主机分片的会话，连接池大小由 connection_pools 配置
+        self.sessions = HostSessions(self.session, self.rate_limiter.classify, self._connection_pool_sizes())
+        # 请求经由可替换的传输后端发出，默认 requests，可选 HTTP/2
+        self.transport = create_transport(self.config.get("transport", "requests"), self.sessions,
+                                          self.rate_limiter.classify,
+                                          bool(self.config.get("http2_prior_knowledge", False)), status_callback)
+        # 下载带宽限制：全局与主机令牌桶由所有任务共用，每个任务（下载器副本）另有自己的令牌桶
+        self.bandwidth = BandwidthShaper(self.config.get("bandwidth_limits"), self.config.get("bandwidth_schedule"))
+        self.job_bandwidth = self.bandwidth.job_bucket()
+        self.mirror_manager = MirrorManager()
+        self.api_cache = ApiCache(
+            Path(self.config.get("api_cache_path", "./api_cache.db")),
+            max_entries=int(self.config.get("api_cache_max_entries", 5000)),
+            ttls=self.config.get("api_cache_ttls")
+        )
+        # 缓存未命中时，相同的进行中接口请求只发出一次
+        self.single_flight = SingleFlight()
+        # 合并与转码在独立线程池中进行，不占用下载线程
+        self.postprocessor = PostProcessor(
+            max_workers=self.config.get("postprocess_workers"),
+            queue_size=self.config.get("postprocess_queue_size")
+        )
+        self.cancel_event = threading.Event()
+        # 进行中的分P任务的取消标志：任务键 -> threading.Event
+        self.task_cancels = {}
+
+    def fork(self, status_callback=None, progress_callback=None, error_callback=None) -> "BiliDownloader":
+        """创建用于单个任务的下载器副本
+        
+        副本与原下载器共用HTTP会话、配置、API缓存、playurl缓存、限速器、
+        并发配额和后处理线程池，只有回调、取消标志、单任务带宽令牌桶和进度总线是独立的，
+        因此同时运行的多个任务共享限速和连接，并能分别取消。
+        """
+        job = copy.copy(self)
+        job.status_callback = status_callback
+        job.progress_callback = progress_callback
+        job.error_callback = error_callback
+        job.cancel_event = threading.Event()
+        job.job_bandwidth = self.bandwidth.job_bucket()
+        job.progress_bus = ProgressBus(self.progress_bus.interval, self.progress_bus.half_life)
+        job.task_cancels = {}
+        return job
+
+    def cancel(self):
+        """取消正在进行的下载，已下载的部分保留断点记录"""
+        self.cancel_event.set()
+
+    def cancel_task(self, key: str) -> bool:
+        """取消单个分P任务，key为 download_pages 报告的任务键（分P序号_内容类型）
+        
+        Returns:
+            任务是否仍在排队或下载中
+        """
+        cancel = self.task_cancels.get(key)
+        if cancel is None:
+            return False
+        cancel.set()
+        return True
+
+    @staticmethod
+    def page_task_key(page: Dict, content_type: DownloadContent) -> str:
+        """分P任务键，用于 cancel_task 和进度计数器的 group"""
+        return f"{page['p']}_{content_type.name}"
+
+    def _check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise DownloadCancelled("任务已取消")
+        task = current_page_task.get()
+        if task is not None and task["cancel"].is_set():
+            raise DownloadCancelled("任务已取消")
+
+    def _connection_pool_sizes(self) -> Dict:
+        """每主机连接池大小，未在 connection_pools 中指定的类别按并发配置估算，
+        使并发请求归还的连接都能留在池中"""
+        transfers = int(self.config.get("transfer_concurrency", 8)) * max(1, int(self.config.get("segment_count", 4)))
+        sizes = {
+            "api": max(16, int(self.config.get("api_concurrency", 4)), int(self.config.get("max_workers", 4))),
+            "comment": 4,
+            "cdn": max(32, transfers),
+            "other": max(8, transfers)
+        }
+        sizes.update(self.config.get("connection_pools") or {})
+        return sizes
+
+    def get_connection_stats(self) -> Dict:
+        """HTTP连接复用统计：传输后端、各主机类别的请求数、新建连接数和复用率"""
+        return self.transport.get_stats()
+
+    def _throttle(self, url: str) -> Throttle:
+        """为一次CDN传输创建带宽限制器，按全局、当前任务和主机三级限速"""
+        return self.bandwidth.throttle(url, self.job_bandwidth)
 
     def _init_anti_spider(self):
         """初始化反爬设置"""
@@ -86,6 +1533,11 @@ class BiliDownloader:
         self.min_delay = 1.0
         self.max_delay = 3.0
 
+    def _init_concurrency_limits(self):
+        """根据配置初始化playurl接口调用与CDN传输的并发上限"""
+        self.api_semaphore = threading.BoundedSemaphore(max(1, int(self.config.get("api_concurrency", 4))))
+        self.transfer_semaphore = threading.BoundedSemaphore(max(1, int(self.config.get("transfer_concurrency", 8))))
+
     def _random_delay(self):
         """随机延迟"""
         time.sleep(random.uniform(self.min_delay, self.max_delay))
@@ -103,6 +1555,8 @@ class BiliDownloader:
         """
         retry = 0
         max_retries = 5  # 增加重试次数
+        # 调用方的请求头不做修改，每次请求与预生成的请求头合并
+        caller_headers = kwargs.pop("headers", None)
         
         while retry < max_retries:
             try:
@@ -114,32 +1568,32 @@ class BiliDownloader:
                 # 设置默认参数    
                 kwargs["timeout"] = kwargs.get("timeout", 30)  # 增加超时时间
                 
-                # 每次请求都更新随机UA
-                headers = kwargs.get("headers", {})
-                headers["User-Agent"] = random.choice(USER_AGENTS)
+                # 每次请求随机选一套该主机类别的请求头（含UA），调用方指定的其他请求头优先
+                base_headers = request_headers(self.rate_limiter.classify(url))
+                if caller_headers:
+                    headers = dict(base_headers)
+                    headers.update(caller_headers)
+                    headers["User-Agent"] = base_headers["User-Agent"]
+                else:
+                    headers = base_headers
                 kwargs["headers"] = headers
                 
-                # 添加重要的请求头
-                if "Referer" not in headers:
-                    headers["Referer"] = "https://www.bilibili.com/"
-                if "Accept" not in headers:
-                    headers["Accept"] = "application/json, text/plain, */*"
-                if "Accept-Encoding" not in headers:
-                    headers["Accept-Encoding"] = "gzip, deflate"
-                if "Accept-Language" not in headers:
-                    headers["Accept-Language"] = "zh-CN,zh;q=0.9,en;q=0.8"
-                
                 # 添加代理
                 if self.proxies:
                     kwargs["proxies"] = self.proxies
                 
-                # 发起请求
-                response = self.session.request(method, url, **kwargs)
+                # 发起请求，按主机类别限速
+                self.rate_limiter.acquire(url)
+                response = self.transport.request(method, url, **kwargs)
+                self.rate_limiter.report(url, response.status_code)
                 
                 # 处理特殊状态码
                 if response.status_code == 412:
                     if self.status_callback:
-                        self.status_callback(f"触发反爬机制，正在尝试绕过... (尝试 {retry+1}/{max_retries})")
+                        self.status_callback(
+                            f"触发反爬机制，降低请求速率至 {self.rate_limiter.current_rate(url)}/s "
+                            f"(尝试 {retry+1}/{max_retries})"
+                        )
                     retry += 1
                     time.sleep(5 + 5 * retry)  # 逐渐增加等待时间
                     continue
@@ -221,7 +1675,51 @@ class BiliDownloader:
             "download_path": "./downloads",
             "download_content": ["video"],
             "theme": "default",
-            "proxies": None
+            "proxies": None,
+            "segment_count": 4,
+            "segment_stall_timeout": 15,
+            "api_concurrency": 4,
+            "transfer_concurrency": 8,
+            "postprocess_workers": None,
+            "postprocess_queue_size": None,
+            "api_cache_path": "./api_cache.db",
+            "api_cache_max_entries": 5000,
+            "api_cache_ttls": {"view": 24 * 3600, "collection": 3600},
+            "rate_limits": {},
+            "video_codecs": ["avc", "hevc", "av1"],
+            "exclude_codecs": [],
+            "allow_hdr": False,
+            "max_frame_rate": None,
+            "mirror_min_speed": 256 * 1024,
+            "mirror_check_interval": 5,
+            "engine": "threads",
+            "api_base": "https://api.bilibili.com",
+            "comment_base": "https://comment.bilibili.com",
+            "host_classes": {},
+            "async_connection_limit": 100,
+            "connection_pools": {"hosts": {}},
+            "transport": "requests",
+            "http2_prior_knowledge": False,
+            "collection_read_ahead": 4,
+            "sync_manifest_dir": "./sync_manifests",
+            "sync_listing_order": {},
+            "batch_journal_path": "./batch_journal.db",
+            "batch_concurrency": 4,
+            "batch_max_attempts": 3,
+            "disk_buffer_size": 1024 * 1024,
+            "disk_buffers": 4,
+            "disk_preallocate": False,
+            "disk_sync": "none",
+            "disk_direct_io": False,
+            "metadata_concurrency": 8,
+            "service_host": "127.0.0.1",
+            "service_port": 8760,
+            "service_max_jobs": 2,
+            "service_token": "",
+            "service_job_history": 200,
+            "bandwidth_limits": {"global": 0, "job": 0, "host": 0, "hosts": {}},
+            "bandwidth_schedule": [],
+            "progress_interval": 0.25
         }
         
         if self.config_path.exists():
@@ -248,7 +1746,7 @@ class BiliDownloader:
     def sanitize_filename(filename: str) -> str:
         return re.sub(r'[\\/*?:"<>|]', "_", filename).strip()[:100]
 
-    def parse_url(self, url: str) -> Dict:
+    def parse_url(self, url: str, use_cache: bool = True) -> Dict:
         parsed = urlparse(url)
         path = parsed.path
         query = parse_qs(parsed.query)
@@ -271,12 +1769,7 @@ class BiliDownloader:
 
         if match := re.search(r"video/(BV\w+)", path):
             bvid = match.group(1)
-            if bvid not in self.api_cache:
-                api_url = f"https://api.bilibili.com/x/web-interface/view?bvid={bvid}"
-                response = self._safe_request('GET', api_url)
-                self.api_cache[bvid] = response.json().get("data", {})
-            
-            data = self.api_cache[bvid]
+            data = self._get_view_data(bvid, use_cache=use_cache)
             if "ugc_season" in data:
                 return {
                     "type": VideoType.COLLECTION,
@@ -289,7 +1782,116 @@ class BiliDownloader:
                     "p": int(query.get("p", [1])[0])
                 }
 
-        raise ValueError("无法识别的B站URL类型")
+        raise ValueError("无法识别的B站URL类型")
+
+    def _get_view_data(self, bvid: str, use_cache: bool = True) -> Dict:
+        """获取视频的view接口数据，优先读取缓存
+        
+        Args:
+            bvid: 视频BV号
+            use_cache: 为False时忽略缓存重新请求，结果仍写入缓存
+            
+        Returns:
+            view接口返回的data字段
+        """
+        data = self.api_cache.get("view", bvid) if use_cache else None
+        if data is not None:
+            return data
+        return self.single_flight.do(("view", bvid), self._fetch_view_data, bvid)
+
+    def _fetch_view_data(self, bvid: str) -> Dict:
+        response = self._safe_request('GET', f"{self.api_base}/x/web-interface/view?bvid={bvid}")
+        data = self._parse_view_response(response.json())
+        self.api_cache.set("view", bvid, data)
+        return data
+
+    @staticmethod
+    def _parse_view_response(response_json: Dict) -> Dict:
+        """校验view接口响应并返回data字段"""
+        if response_json.get('code') != 0:
+            raise ValueError(f"获取视频信息失败: {response_json.get('message', '未知错误')}")
+        
+        data = response_json.get('data')
+        if not data:
+            raise ValueError("无法获取视频信息")
+        return data
+
+    def _build_video_info(self, bvid: str, data: Dict) -> Dict:
+        """由view接口数据构建单视频/多P视频的信息字典"""
+        return {
+            "bvid": bvid,
+            "title": self.sanitize_filename(data.get("title", "无标题")),
+            "author": data.get("owner", {}).get("name", "未知UP主"),
+            "author_mid": str(data.get("owner", {}).get("mid", "")),
+            "pages": [
+                {
+                    "p": page.get("page", 1),
+                    "title": f'P{page.get("page", 1)}_{self.sanitize_filename(page.get("part", "无标题"))}',
+                    "duration": page.get("duration", 0),
+                    "cid": page.get("cid", 0)
+                } for page in data.get("pages", [])
+            ],
+            "type": VideoType.MULTI_PART if data.get("videos", 1) > 1 else VideoType.SINGLE,
+            "subtitle": data.get("subtitle", "")
+        }
+
+    def _build_season_info(self, bvid: str, data: Dict) -> Dict:
+        """由view接口数据中的ugc_season构建合集信息字典"""
+        info = {
+            "bvid": bvid,
+            "title": self.sanitize_filename(data.get("title", "无标题")),
+            "author": data.get("owner", {}).get("name", "未知UP主"),
+            "author_mid": str(data.get("owner", {}).get("mid", "")),
+            "type": VideoType.COLLECTION,
+            "pages": []
+        }
+        for section in data.get("ugc_season", {}).get("sections", []):
+            for idx, ep in enumerate(section.get("episodes", []), start=len(info["pages"])+1):
+                page = {
+                    "p": idx,
+                    "title": self.sanitize_filename(ep.get("title", "无标题")),
+                    "duration": ep.get("duration", ep.get("arc", {}).get("duration", 0)),
+                    "cid": ep.get("cid", 0)
+                }
+                # 合集中的每个分集是独立的视频
+                for field in ("id", "bvid"):
+                    if ep.get(field):
+                        page[field] = ep[field]
+                info["pages"].append(page)
+        return info
+
+    def _collection_api_url(self, collection_id: str, collection_type: str, pn: Optional[int] = None) -> str:
+        """合集分页接口地址，pn为None时用于获取总数"""
+        if collection_type == "ssid":
+            api_url = f"{self.api_base}/pugv/view/web/season?season_id={collection_id}"
+            return api_url if pn is None else f"{api_url}&pn={pn}"
+        api_url = f"{self.api_base}/x/v1/medialist/info?type=8&biz_id={collection_id}"
+        return api_url if pn is None else f"{api_url}&pn={pn}&ps={COLLECTION_PAGE_SIZE}"
+
+    @staticmethod
+    def _parse_collection_meta(collection_type: str, response_json: Dict) -> Dict:
+        """从合集首个接口响应中提取分页数、标题和UP主"""
+        data = response_json.get("data") or {}
+        if collection_type == "ssid":
+            upper = data.get("up_info") or {}
+            return {
+                "total": data.get("page", {}).get("total", 1),
+                "title": data.get("title", ""),
+                "author": upper.get("uname", ""),
+                "author_mid": str(upper.get("mid", ""))
+            }
+        upper = data.get("upper") or {}
+        return {
+            "total": data.get("total", 1),
+            "title": data.get("title", ""),
+            "author": upper.get("name", ""),
+            "author_mid": str(upper.get("mid", ""))
+        }
+
+    @staticmethod
+    def _parse_collection_page(collection_type: str, response_json: Dict) -> list:
+        data = response_json.get("data", {})
+        return data.get("episodes" if collection_type == "ssid" else "medias", [])
 
     def get_video_info(self, bvid: str) -> Dict:
         """获取视频信息
@@ -305,38 +1907,8 @@ class BiliDownloader:
         
         while retry_count < max_retries:
             try:
-                if bvid in self.api_cache:
-                    data = self.api_cache[bvid]
-                else:
-                    api_url = f"https://api.bilibili.com/x/web-interface/view?bvid={bvid}"
-                    response = self._safe_request('GET', api_url)
-                    response_json = response.json()
-                    
-                    if response_json.get('code') != 0:
-                        raise ValueError(f"获取视频信息失败: {response_json.get('message', '未知错误')}")
-                    
-                    data = response_json.get('data')
-                    if not data:
-                        raise ValueError("无法获取视频信息")
-                    
-                    self.api_cache[bvid] = data
-                
-                return {
-                    "bvid": bvid,
-                    "title": self.sanitize_filename(data.get("title", "无标题")),
-                    "author": data.get("owner", {}).get("name", "未知UP主"),
-                    "author_mid": str(data.get("owner", {}).get("mid", "")),
-                    "pages": [
-                        {
-                            "p": page.get("page", 1),
-                            "title": f'P{page.get("page", 1)}_{self.sanitize_filename(page.get("part", "无标题"))}',
-                            "duration": page.get("duration", 0),
-                            "cid": page.get("cid", 0)
-                        } for page in data.get("pages", [])
-                    ],
-                    "type": VideoType.MULTI_PART if data.get("videos", 1) > 1 else VideoType.SINGLE,
-                    "subtitle": data.get("subtitle", "")
-                }
+                data = self._get_view_data(bvid)
+                return self._build_video_info(bvid, data)
                 
             except Exception as e:
                 retry_count += 1
@@ -352,118 +1924,166 @@ class BiliDownloader:
         raise ValueError("获取视频信息失败，已达到最大重试次数")
 
     def get_collection_info(self, collection_id: str, collection_type: str) -> Dict:
-        info = {"pages": []}
+        """获取合集信息和完整的分集列表，分集顺序与合集中的顺序一致"""
+        info, pages = self.resolve_collection(collection_id, collection_type)
+        info["pages"] = list(pages)
+        return info
+
+    def resolve_collection(self, collection_id: str, collection_type: str) -> Tuple[Dict, Iterable[Dict]]:
+        """获取合集的基本信息和分集迭代器
         
+        收藏夹与课程的分集按分页逐步获取，迭代器边获取边产出，
+        调用方可以在后续分页返回之前就开始处理前面的分集。
+        
+        Args:
+            collection_id: 合集ID（BV号、season_id或media_id）
+            collection_type: "bvid"、"ssid" 或 "mlid"
+            
+        Returns:
+            (不含分集的合集信息, 按顺序产出分P信息的可迭代对象)
+        """
         if collection_type == "bvid":
-            data = self.api_cache.get(collection_id, {})
-            if not data:
-                api_url = f"https://api.bilibili.com/x/web-interface/view?bvid={collection_id}"
-                response = self._safe_request('GET', api_url)
-                data = response.json().get("data", {})
-            
-            season_data = data.get("ugc_season", {})
-            info.update({
-                "bvid": collection_id,
-                "title": self.sanitize_filename(data.get("title", "无标题")),
-                "author": data.get("owner", {}).get("name", "未知UP主"),
-                "author_mid": str(data.get("owner", {}).get("mid", "")),
-                "type": VideoType.COLLECTION
-            })
+            data = self._get_view_data(collection_id)
+            info = self._build_season_info(collection_id, data)
+            return info, info.pop("pages")
+        
+        meta = self.get_collection_meta(collection_id, collection_type)
+        info = self._build_collection_header(collection_id, collection_type, meta)
+        return info, self.iter_collection_episodes(collection_id, collection_type)
+
+    def _build_collection_header(self, collection_id: str, collection_type: str, meta: Dict) -> Dict:
+        """由收藏夹/课程的元数据构建不含分集的合集信息"""
+        return {
+            "bvid": "",
+            "title": self.sanitize_filename(meta.get("title") or f"{collection_type}_{collection_id}"),
+            "author": meta.get("author") or "未知UP主",
+            "author_mid": meta.get("author_mid", ""),
+            "type": VideoType.COLLECTION
+        }
+
+    def iter_collection_episodes(self, collection_id: str, collection_type: str,
+                                 read_ahead: Optional[int] = None, start_pn: int = 1,
+                                 use_cache: bool = True, strict: bool = False) -> Iterator[Dict]:
+        """按合集中的顺序逐个产出分集，分页边获取边产出
+        
+        等待当前分页时最多预读 read_ahead 个后续分页。后面的分页即使先返回，
+        也要等前面的分页产出完毕，因此序号p始终与真实顺序一致。
+        调用方提前结束迭代时，尚未开始的预读请求会被取消。
+        
+        Args:
+            collection_id: 合集ID
+            collection_type: "ssid" 或 "mlid"
+            read_ahead: 预读的分页数，默认取配置 collection_read_ahead，0为不预读
+            start_pn: 起始分页，序号p按完整列表中的位置计算
+            use_cache: 为False时分页忽略缓存重新请求
+            strict: 为True时分页获取失败直接抛出异常，否则跳过该分页
             
-            for section in season_data.get("sections", []):
-                for idx, ep in enumerate(section.get("episodes", []), start=len(info["pages"])+1):
-                    info["pages"].append({
-                        "p": idx,
-                        "title": self.sanitize_filename(ep.get("title", "无标题")),
-                        "duration": ep.get("duration", ep.get("arc", {}).get("duration", 0)),
-                        "cid": ep.get("cid", 0)
-                    })
-        else:
-            total_pages = self.precheck_collection_size(collection_id, collection_type)
-            console.print(f"[yellow]检测到合集包含约{total_pages*100}个视频，开始并行获取...[/yellow]")
-            
-            with ThreadPoolExecutor(max_workers=self.page_workers) as executor:
-                futures = []
-                for pn in range(1, total_pages+1):
-                    futures.append(executor.submit(
-                        self.fetch_collection_page,
-                        collection_id, 
-                        collection_type,
-                        pn
-                    ))
-                
-                episodes = []
-                for future in as_completed(futures):
+        Yields:
+            分P信息字典
+        """
+        total_pages = self.precheck_collection_size(collection_id, collection_type)
+        if read_ahead is None:
+            read_ahead = self.config.get("collection_read_ahead", 4)
+        read_ahead = max(0, int(read_ahead))
+        console.print(f"[yellow]检测到合集包含约{total_pages*COLLECTION_PAGE_SIZE}个视频，开始分页获取...[/yellow]")
+        
+        idx = (start_pn - 1) * COLLECTION_PAGE_SIZE + 1
+        next_pn = start_pn
+        window = deque()
+        with ThreadPoolExecutor(max_workers=read_ahead + 1) as executor:
+            try:
+                while window or next_pn <= total_pages:
+                    # 当前分页加上预读的分页
+                    while next_pn <= total_pages and len(window) <= read_ahead:
+                        window.append((next_pn, executor.submit(
+                            self.fetch_collection_page, collection_id, collection_type, next_pn, use_cache
+                        )))
+                        next_pn += 1
+                    
+                    pn, future = window.popleft()
                     try:
-                        page_data = future.result()
-                        episodes.extend(page_data)
+                        episodes = future.result()
                     except Exception as e:
+                        if strict:
+                            raise
                         console.print(f"[red]分页获取失败: {str(e)}[/red]")
+                        # 跳过的分页仍占用序号，后续分集的p与文件名保持不变
+                        idx = pn * COLLECTION_PAGE_SIZE + 1
+                        continue
+                    for ep in episodes:
+                        yield self._episode_to_page(ep, idx)
+                        idx += 1
+            finally:
+                for _, future in window:
+                    future.cancel()
 
-            with ThreadPoolExecutor(max_workers=self.item_workers) as executor:
-                futures = []
-                batch_size = 50
-                
-                for i in range(0, len(episodes), batch_size):
-                    batch = episodes[i:i+batch_size]
-                    futures.append(executor.submit(
-                        self.process_episode_batch,
-                        batch,
-                        info["pages"],
-                        i+1
-                    ))
-                
-                for future in as_completed(futures):
-                    future.result()
+    def get_collection_meta(self, collection_id: str, collection_type: str, use_cache: bool = True) -> Dict:
+        """获取收藏夹/课程的分页数、标题和UP主，失败时按单页处理
+        
+        use_cache为False时忽略缓存重新请求并抛出请求错误，结果仍写入缓存。
+        """
+        cache_key = f"{collection_type}:{collection_id}:meta"
+        cached = self.api_cache.get("collection", cache_key) if use_cache else None
+        if cached is not None:
+            return cached
+        try:
+            return self.single_flight.do(("collection", cache_key), self._fetch_collection_meta,
+                                         collection_id, collection_type, cache_key)
+        except Exception:
+            if not use_cache:
+                raise
+            return {"total": 1}
 
-        return info
+    def _fetch_collection_meta(self, collection_id: str, collection_type: str, cache_key: str) -> Dict:
+        response = self._safe_request('GET', self._collection_api_url(collection_id, collection_type))
+        meta = self._parse_collection_meta(collection_type, response.json())
+        self.api_cache.set("collection", cache_key, meta)
+        return meta
 
     def precheck_collection_size(self, collection_id: str, collection_type: str) -> int:
-        try:
-            if collection_type == "ssid":
-                api_url = f"https://api.bilibili.com/pugv/view/web/season?season_id={collection_id}"
-            else:
-                api_url = f"https://api.bilibili.com/x/v1/medialist/info?type=8&biz_id={collection_id}"
-            
-            response = self._safe_request('GET', api_url)
-            data = response.json().get("data", {})
-            return data.get("page", {}).get("total", 1) if collection_type == "ssid" else data.get("total", 1)
-        except:
-            return 1
+        return int(self.get_collection_meta(collection_id, collection_type).get("total") or 1)
 
-    def fetch_collection_page(self, collection_id: str, collection_type: str, pn: int) -> list:
+    def fetch_collection_page(self, collection_id: str, collection_type: str, pn: int,
+                              use_cache: bool = True) -> list:
+        cache_key = f"{collection_type}:{collection_id}:{pn}"
+        cached = self.api_cache.get("collection", cache_key) if use_cache else None
+        if cached is not None:
+            return cached
+        return self.single_flight.do(("collection", cache_key), self._fetch_collection_page,
+                                     collection_id, collection_type, pn, cache_key)
+
+    def _fetch_collection_page(self, collection_id: str, collection_type: str, pn: int, cache_key: str) -> list:
         retry = 0
         while retry < 3:
             try:
-                if collection_type == "ssid":
-                    api_url = f"https://api.bilibili.com/pugv/view/web/season?season_id={collection_id}&pn={pn}"
-                else:
-                    api_url = f"https://api.bilibili.com/x/v1/medialist/info?type=8&biz_id={collection_id}&pn={pn}&ps=100"
-                
+                api_url = self._collection_api_url(collection_id, collection_type, pn)
                 response = self._safe_request('GET', api_url)
-                data = response.json().get("data", {})
-                return data.get("episodes" if collection_type == "ssid" else "medias", [])
+                episodes = self._parse_collection_page(collection_type, response.json())
+                self.api_cache.set("collection", cache_key, episodes)
+                return episodes
             except Exception as e:
                 retry += 1
                 time.sleep(retry * 1.5)
         raise Exception(f"分页{pn}获取失败")
 
-    def process_episode_batch(self, batch: list, pages: list, start_idx: int):
-        temp = []
-        for idx, ep in enumerate(batch, start=start_idx):
-            duration = ep.get("duration") or \
-                      ep.get("timelength", 0) // 1000 or \
-                      ep.get("archive", {}).get("duration", 0)
-            
-            temp.append({
-                "p": idx,
-                "title": self.sanitize_filename(ep.get("title", "无标题")),
-                "duration": duration,
-                "cid": ep.get("cid", 0)
-            })
-        
-        with self.lock:
-            pages.extend(temp)
+    def _episode_to_page(self, ep: Dict, idx: int) -> Dict:
+        """把收藏夹/课程接口中的一个分集转换为分P信息"""
+        duration = ep.get("duration") or \
+                  ep.get("timelength", 0) // 1000 or \
+                  ep.get("archive", {}).get("duration", 0)
+        page = {
+            "p": idx,
+            "title": self.sanitize_filename(ep.get("title", "无标题")),
+            "duration": duration,
+            "cid": ep.get("cid", 0)
+        }
+        # 收藏夹中的每个分集是独立的视频
+        bvid = ep.get("bvid") or ep.get("bv_id")
+        if bvid:
+            page["bvid"] = bvid
+        if ep.get("id"):
+            page["id"] = ep["id"]
+        return page
 
     def show_video_info(self, info: Dict):
         info_panel = Panel(
@@ -767,7 +2387,7 @@ class BiliDownloader:
 
     def download_danmaku(self, cid: int, output_path: Path):
         try:
-            url = f"https://comment.bilibili.com/{cid}.xml"
+            url = f"{self.comment_base}/{cid}.xml"
             response = self._safe_request('GET', url)
             with open(output_path.with_suffix(".xml"), 'wb') as f:
                 f.write(response.content)
@@ -777,7 +2397,7 @@ class BiliDownloader:
             return False
 
     def download_video(self, url: str, quality: DownloadQuality = None, content: List[DownloadContent] = None,
-                    custom_max_workers: int = None, selected_pages: List[int] = None):
+                    custom_max_workers: int = None, selected_pages: List[int] = None, on_task_state=None):
         """下载单个视频或合集
         
         Args:
@@ -786,6 +2406,7 @@ class BiliDownloader:
             content: 下载内容列表
             custom_max_workers: 自定义线程数
             selected_pages: 选中的分P列表，如果为None则下载全部分P
+            on_task_state: 可选的分P任务状态回调，见 download_pages
         """
         try:
             if self.status_callback:
@@ -794,76 +2415,198 @@ class BiliDownloader:
             # 解析URL
             parsed = self.parse_url(url)
             
-            # 获取视频信息
+            # 获取视频信息，合集的分集列表边获取边下载
             if parsed["type"] == VideoType.COLLECTION:
                 collection_type = "bvid" if "bvid" in parsed else ("ssid" if "ssid" in parsed else "mlid")
-                info = self.get_collection_info(parsed[collection_type], collection_type)
+                info, pages = self.resolve_collection(parsed[collection_type], collection_type)
             else:
                 info = self.get_video_info(parsed["bvid"])
+                pages = info['pages'] if info else []
                 
             if not info:
                 raise Exception("无法获取视频信息")
-                
-            # 过滤选中的分P
-            if selected_pages:
-                info['pages'] = [page for page in info['pages'] if page['p'] in selected_pages]
-                if not info['pages']:
-                    raise Exception("未选择任何分P")
-                
+            
+            return self.download_pages(info, pages, quality, content, custom_max_workers, selected_pages,
+                                       on_task_state)
+            
+        except Exception as e:
+            if self.error_callback:
+                self.error_callback("download", str(e))
+            return False
+
+    def _resolve_download_options(self, quality: Optional[DownloadQuality],
+                                  content: Optional[List[DownloadContent]]) -> Tuple[DownloadQuality, List[DownloadContent]]:
+        """补全默认的下载质量与内容，返回 (质量, 需要下载的视频/音频内容类型)"""
+        if not quality:
+            quality = getattr(DownloadQuality, self.config.get("quality", "HIGH_1080"))
+        if not content:
+            content_names = self.config.get("download_content", ["VIDEO"])
+            content = [getattr(DownloadContent, name) for name in content_names]
+        
+        # 仅音频质量时，视频任务也只下载音频
+        if quality == DownloadQuality.AUDIO_ONLY:
+            content = [DownloadContent.AUDIO if c == DownloadContent.VIDEO else c for c in content]
+            content = list(dict.fromkeys(content))
+        return quality, [c for c in content if c in [DownloadContent.VIDEO, DownloadContent.AUDIO]]
+
+    def _output_dir(self, info: Dict) -> Path:
+        return self.download_root / info['type'].value / self.sanitize_filename(info["author"]) / self.sanitize_filename(info["title"])
+
+    def _output_filename(self, page: Dict) -> str:
+        """分P输出文件名（不含扩展名）"""
+        return f"P{page['p']}_{self._sanitize_filename(page['title'])}"
+
+    def download_pages(self, info: Dict, pages: Iterable[Dict], quality: DownloadQuality = None,
+                       content: List[DownloadContent] = None, custom_max_workers: int = None,
+                       selected_pages: List[int] = None, on_task_state=None) -> bool:
+        """下载已解析视频的分P，pages可以是边获取边产出的迭代器
+        
+        Args:
+            info: 视频或合集信息
+            pages: 分P信息列表或迭代器
+            quality: 下载质量
+            content: 下载内容列表
+            custom_max_workers: 自定义线程数
+            selected_pages: 选中的分P列表，如果为None则下载全部分P
+            on_task_state: 可选回调 (page, content_type, state)，state为
+                queued、downloading、muxing、done、failed 或 cancelled；
+                排队中和下载中的任务可以用 cancel_task(分P序号_内容类型) 单独取消
+            
+        Returns:
+            是否至少有一个文件下载成功
+        """
+        try:
             # 设置下载参数
-            if not quality:
-                quality = getattr(DownloadQuality, self.config.get("quality", "HIGH_1080"))
-            if not content:
-                content_names = self.config.get("download_content", ["VIDEO"])
-                content = [getattr(DownloadContent, name) for name in content_names]
+            quality, content_types = self._resolve_download_options(quality, content)
             
             # 设置输出目录
-            output_dir = self.download_root / info['type'].value / self.sanitize_filename(info["author"]) / self.sanitize_filename(info["title"])
+            output_dir = self._output_dir(info)
             output_dir.mkdir(parents=True, exist_ok=True)
             
             if self.status_callback:
                 self.status_callback(f"准备下载到: {output_dir}")
                 
-            # 本次直接使用单线程下载，确保稳定性
-            max_workers = 1
-            
-            # 创建任务列表
-            download_tasks = []
-            for page in info['pages']:
-                # 记录需要下载的内容，支持视频和音频
-                for content_type in content:
-                    if content_type in [DownloadContent.VIDEO, DownloadContent.AUDIO]:
-                        download_tasks.append({
-                            "page": page,
-                            "content_type": content_type
-                        })
-            
-            # 开始下载
-            total_tasks = len(download_tasks)
+            # 页面/内容级并发数，API调用和CDN传输另有独立上限
+            max_workers = max(1, int(custom_max_workers or self.config.get("max_workers", 4)))
+            
+            # 下载视频和音频，过滤未选中的分P
+            download_tasks = (
+                {"page": page, "content_type": content_type, "key": self.page_task_key(page, content_type),
+                 "cancel": threading.Event()}
+                for page in pages
+                if not selected_pages or page['p'] in selected_pages
+                for content_type in content_types
+            )
+            
+            # 开始下载，任务总数在分集列表获取完毕后才确定
+            total_tasks = 0
             current_task = 0
             success_count = 0
             
             if self.status_callback:
-                self.status_callback(f"开始下载 {total_tasks} 个文件...")
+                self.status_callback(f"开始下载 (并发 {max_workers})...")
             
-            for task in download_tasks:
-                current_task += 1
+            def report(task, state):
+                if on_task_state:
+                    on_task_state(task["page"], task["content_type"], state)
+            
+            def run_task(task):
                 page = task["page"]
                 content_type = task["content_type"]
-                
-                # 更新状态
+                if self.cancel_event.is_set() or task["cancel"].is_set():
+                    return False
                 if self.status_callback:
-                    self.status_callback(f"下载中 ({current_task}/{total_tasks}): P{page['p']} - {content_type.value}")
+                    self.status_callback(f"下载中: P{page['p']} - {content_type.value}")
+                report(task, "downloading")
+                # 调用直接下载方法，合并在后台进行，下载线程随即处理下一个任务
+                token = current_page_task.set(task)
+                try:
+                    return self._direct_download(info, page, quality, content_type, output_dir, defer_merge=True)
+                finally:
+                    current_page_task.reset(token)
+            
+            def run_fallback(task, fallback):
+                """在下载线程中执行合并失败后的直接下载，沿用分P任务的上下文以支持单独取消和进度分组"""
+                if self.cancel_event.is_set() or task["cancel"].is_set():
+                    return False
+                token = current_page_task.set(task)
+                try:
+                    return fallback()
+                finally:
+                    current_page_task.reset(token)
+            
+            task_of = {}
+            
+            def collect(done) -> set:
+                """统计已完成的任务，返回仍在合并或改为直接下载的任务"""
+                nonlocal current_task, success_count
+                merging = set()
+                for future in done:
+                    task = task_of.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = False
+                        if self.error_callback:
+                            self.error_callback("download", str(e))
+                    
+                    # 下载完成但仍在合并的任务，等合并结束再计数
+                    if isinstance(result, Future):
+                        task_of[result] = task
+                        report(task, "muxing")
+                        merging.add(result)
+                        continue
+                    # 合并失败需要直接下载时交回下载线程池，不占用后处理线程
+                    if callable(result):
+                        future = executor.submit(run_fallback, task, result)
+                        task_of[future] = task
+                        report(task, "downloading")
+                        merging.add(future)
+                        continue
+                    
+                    current_task += 1
+                    if result:
+                        success_count += 1
+                    if self.task_cancels.get(task["key"]) is task["cancel"]:
+                        del self.task_cancels[task["key"]]
+                    if result:
+                        report(task, "done")
+                    else:
+                        cancelled = task["cancel"].is_set() or self.cancel_event.is_set()
+                        report(task, "cancelled" if cancelled else "failed")
+                    
+                    # 更新进度
+                    if self.progress_callback:
+                        self.progress_callback("main", current_task, total_tasks, 0)
+                return merging
+            
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                pending = set()
+                for task in download_tasks:
+                    if self.cancel_event.is_set():
+                        break
+                    self.task_cancels[task["key"]] = task["cancel"]
+                    report(task, "queued")
+                    future = executor.submit(run_task, task)
+                    task_of[future] = task
+                    pending.add(future)
+                    total_tasks += 1
+                    # 分集列表仍在获取时，顺便处理已完成的任务
+                    done = {future for future in pending if future.done()}
+                    if done:
+                        pending -= done
+                        pending |= collect(done)
                 
-                # 调用直接下载方法
-                success = self._direct_download(info, page, quality, content_type, output_dir)
-                if success:
-                    success_count += 1
+                if total_tasks == 0:
+                    raise Exception("未选择任何分P")
+                if self.status_callback:
+                    self.status_callback(f"分集列表获取完成，共 {total_tasks} 个文件")
                 
-                # 更新进度
-                if self.progress_callback:
-                    self.progress_callback("main", current_task, total_tasks, 0)
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    pending |= collect(done)
             
+            self._check_cancelled()
             # 检查是否所有文件都下载成功
             if success_count == 0:
                 raise Exception("所有下载任务均失败")
@@ -882,8 +2625,199 @@ class BiliDownloader:
                 self.error_callback("download", str(e))
             return False
             
+    def sync_collection(self, url: str, quality: DownloadQuality = None, content: List[DownloadContent] = None,
+                        custom_max_workers: int = None, full: bool = False) -> bool:
+        """增量同步合集、收藏夹、课程或多P视频
+        
+        按合集保存同步清单，只获取列表水位之后的分页，只下载新增、cid变化
+        或本地文件缺失/大小不符的分集。没有变化时收藏夹与课程只需2次接口调用，
+        UGC合集与多P视频只需1次。
+        
+        Args:
+            url: 合集或视频链接
+            quality: 下载质量
+            content: 下载内容列表
+            custom_max_workers: 自定义线程数
+            full: 为True时忽略水位重新获取完整列表
+            
+        Returns:
+            是否同步成功（没有需要下载的分集也视为成功）
+        """
+        try:
+            if self.status_callback:
+                self.status_callback(f"正在同步: {url}")
+            
+            # 同步必须看到最新的列表，不使用缓存
+            parsed = self.parse_url(url, use_cache=False)
+            if parsed["type"] == VideoType.COLLECTION:
+                collection_type = "bvid" if "bvid" in parsed else ("ssid" if "ssid" in parsed else "mlid")
+                collection_id = parsed[collection_type]
+            elif "bvid" in parsed:
+                collection_type, collection_id = "video", parsed["bvid"]
+            else:
+                raise Exception("该链接不支持同步")
+            
+            manifest = SyncManifest(
+                Path(self.config.get("sync_manifest_dir", "./sync_manifests")) / f"{collection_type}_{collection_id}.json"
+            )
+            info, listed, watermark = self._list_sync_episodes(collection_type, collection_id, manifest, full)
+            
+            # 合集改名后仍下载到原来的目录
+            if manifest.data.get("title"):
+                info["title"] = manifest.data["title"]
+                info["author"] = manifest.data["author"]
+            quality, content_types = self._resolve_download_options(quality, content)
+            to_download = self._plan_sync(manifest, listed, self._output_dir(info), content_types)
+            
+            manifest.data.update({
+                "url": url,
+                "type": collection_type,
+                "id": collection_id,
+                "title": info["title"],
+                "author": info["author"],
+                "last_sync": time.time()
+            })
+            
+            success = True
+            if to_download:
+                if self.status_callback:
+                    self.status_callback(f"发现 {len(to_download)} 个新增或需要重新下载的分集")
+                success = self.download_pages(info, to_download, quality, content_types, custom_max_workers)
+                self._record_sync_files(manifest, to_download, self._output_dir(info), content_types)
+            elif self.status_callback:
+                self.status_callback("没有新的分集，无需下载")
+            
+            # 下载失败的分集没有文件记录，下次同步会重新加入队列
+            manifest.data["watermark"] = watermark
+            manifest.save()
+            return success
+            
+        except Exception as e:
+            if self.error_callback:
+                self.error_callback("sync", f"同步失败: {str(e)}")
+            return False
+
+    def _list_sync_episodes(self, collection_type: str, collection_id: str, manifest: SyncManifest,
+                            full: bool) -> Tuple[Dict, List[Dict], Dict]:
+        """获取水位之后的分集
+        
+        Returns:
+            (不含分集的合集信息, 按发布先后排列的分集, 新的水位)
+        """
+        if collection_type in ("bvid", "video"):
+            # parse_url 刚刚刷新过view缓存，整个列表只需这一次接口调用
+            data = self._get_view_data(collection_id)
+            info = (self._build_season_info if collection_type == "bvid" else self._build_video_info)(collection_id, data)
+            return info, info.pop("pages"), {}
+        
+        meta = self.get_collection_meta(collection_id, collection_type, use_cache=False)
+        info = self._build_collection_header(collection_id, collection_type, meta)
+        total_pages = int(meta.get("total") or 1)
+        watermark = {} if full else manifest.data.get("watermark", {})
+        order = (self.config.get("sync_listing_order") or {}).get(collection_type) \
+            or SYNC_LISTING_ORDER.get(collection_type, "oldest_first")
+        
+        if order == "newest_first":
+            # 新分集在最前面，遇到已知分集即停止，增量同步时不预读
+            listed = []
+            known = manifest.episodes if not full else {}
+            for page in self.iter_collection_episodes(collection_id, collection_type,
+                                                      read_ahead=0 if known else None,
+                                                      use_cache=False, strict=True):
+                if self._episode_key(page) in known:
+                    break
+                listed.append(page)
+            listed.reverse()
+            newest = self._episode_key(listed[-1]) if listed else watermark.get("newest")
+            return info, listed, {"newest": newest} if newest else {}
+        
+        # 新分集追加在末尾，从水位所在的分页开始获取
+        listed_count = int(watermark.get("listed", 0))
+        start_pn = min(total_pages, listed_count // COLLECTION_PAGE_SIZE + 1)
+        listed = list(self.iter_collection_episodes(collection_id, collection_type, start_pn=start_pn,
+                                                    use_cache=False, strict=True))
+        return info, listed, {"listed": (start_pn - 1) * COLLECTION_PAGE_SIZE + len(listed)}
+
+    @staticmethod
+    def _episode_key(page: Dict) -> str:
+        """分集在同步清单中的键，优先使用分集ID和BV号，多P视频使用分P序号"""
+        return str(page.get("id") or page.get("bvid") or f"p{page['p']}")
+
+    def _plan_sync(self, manifest: SyncManifest, listed: List[Dict], output_dir: Path,
+                   content_types: List[DownloadContent]) -> List[Dict]:
+        """对比同步清单，返回需要下载的分集并更新清单中的分集记录
+        
+        已知分集沿用清单中的序号，新分集按发布先后接在最大序号之后，
+        因此收藏夹前面插入新视频时，已下载文件的文件名保持不变。
+        """
+        episodes = manifest.episodes
+        now = time.time()
+        next_p = max((entry["p"] for entry in episodes.values()), default=0) + 1
+        to_download = {}
+        
+        for page in listed:
+            key = self._episode_key(page)
+            entry = episodes.get(key)
+            if entry is None:
+                entry = episodes[key] = {"p": next_p, "first_seen": now, "files": {}}
+                next_p += 1
+                to_download[key] = page
+            elif entry.get("cid") != page["cid"]:
+                # 重新上传过的分集，旧文件作废
+                self._remove_sync_files(entry, output_dir)
+                to_download[key] = page
+            page["p"] = entry["p"]
+            entry.update({
+                "title": page["title"],
+                "cid": page["cid"],
+                "bvid": page.get("bvid", ""),
+                "last_seen": now
+            })
+        
+        # 不需要接口调用即可发现的本地文件缺失或损坏
+        for key, entry in episodes.items():
+            if key in to_download or self._sync_files_complete(entry, output_dir, content_types):
+                continue
+            self._remove_sync_files(entry, output_dir)
+            page = {"p": entry["p"], "title": entry["title"], "duration": 0, "cid": entry["cid"]}
+            if entry.get("bvid"):
+                page["bvid"] = entry["bvid"]
+            to_download[key] = page
+        
+        return sorted(to_download.values(), key=lambda page: page["p"])
+
+    @staticmethod
+    def _sync_files_complete(entry: Dict, output_dir: Path, content_types: List[DownloadContent]) -> bool:
+        for content_type in content_types:
+            record = entry["files"].get(content_type.name)
+            if not record:
+                return False
+            path = output_dir / record["name"]
+            if not path.exists() or path.stat().st_size != record["size"]:
+                return False
+        return True
+
+    @staticmethod
+    def _remove_sync_files(entry: Dict, output_dir: Path):
+        """删除清单中记录的旧文件，避免重新下载时被当作已存在而跳过"""
+        for record in entry["files"].values():
+            (output_dir / record["name"]).unlink(missing_ok=True)
+        entry["files"] = {}
+
+    def _record_sync_files(self, manifest: SyncManifest, pages: List[Dict], output_dir: Path,
+                           content_types: List[DownloadContent]):
+        """把下载完成的文件和大小写入同步清单"""
+        by_p = {entry["p"]: entry for entry in manifest.episodes.values()}
+        for page in pages:
+            entry = by_p[page["p"]]
+            for content_type in content_types:
+                suffix = ".mp4" if content_type == DownloadContent.VIDEO else ".mp3"
+                path = output_dir / f"{self._output_filename(page)}{suffix}"
+                if path.exists() and path.stat().st_size > 0:
+                    entry["files"][content_type.name] = {"name": path.name, "size": path.stat().st_size}
+
     def _direct_download(self, info: Dict, page: Dict, quality: DownloadQuality, 
-                         content_type: DownloadContent, download_dir: Path) -> bool:
+                         content_type: DownloadContent, download_dir: Path, defer_merge: bool = False):
         """直接使用纯API下载视频和音频，完全不依赖yt-dlp
         
         Args:
@@ -892,13 +2826,15 @@ class BiliDownloader:
             quality: 下载质量
             content_type: 下载内容类型
             download_dir: 下载目录
+            defer_merge: 为True时音视频合并交给后台线程，返回合并任务的Future
             
         Returns:
-            是否下载成功
+            是否下载成功；defer_merge为True且需要合并时返回合并任务的Future，
+            结果为bool，或合并失败时需要在下载线程中执行的直接下载（见 _merge_and_verify）
         """
         try:
             # 构建输出文件名
-            output_filename = f"P{page['p']}_{self._sanitize_filename(page['title'])}"
+            output_filename = self._output_filename(page)
             
             # 根据内容类型选择下载方式
             if content_type == DownloadContent.VIDEO:
@@ -916,92 +2852,46 @@ class BiliDownloader:
                     self.status_callback(f"文件已存在: {output_path.name}")
                 return True
             
-            # 获取视频下载地址
-            # 尝试所有可能的API接口
-            api_urls = [
-                f"https://api.bilibili.com/x/player/playurl?bvid={info['bvid']}&cid={page['cid']}&qn=112&fnval=16&fourk=1",
-                f"https://api.bilibili.com/x/player/wbi/playurl?bvid={info['bvid']}&cid={page['cid']}&qn=112&fnval=4048&fourk=1",
-                f"https://api.bilibili.com/pgc/player/web/playurl?bvid={info['bvid']}&cid={page['cid']}&qn=112",
-                f"https://api.bilibili.com/x/player/playurl?bvid={info['bvid']}&cid={page['cid']}&qn=80"
-            ]
-            
             if self.status_callback:
                 self.status_callback(f"获取{file_type}下载地址...")
             
+            # 同一分P的视频和音频任务共用一次解析结果
+            selector = self._create_stream_selector(quality)
+            api_data = self._get_playurl(page.get('bvid') or info['bvid'], page['cid'], qn=selector.qn, fnval=4048)
+            
             # 对于视频下载，我们需要同时获取视频和音频流
             video_url = None
             audio_url = None
-            error_msgs = []
-            api_data = None
+            dash = api_data.get('dash') or {}
+            durl = api_data.get('durl') or []
             
-            # 尝试所有可能的API
-            for api_url in api_urls:
-                try:
-                    response = self._safe_request("GET", api_url)
-                    data = response.json()
-                    
-                    # 检查API响应
-                    if data.get('code') != 0:
-                        error_msgs.append(f"API错误: {data.get('message', '未知错误')}")
-                        continue
-                        
-                    data = data.get('data', {})
-                    if not data:
-                        error_msgs.append("API返回数据为空")
-                        continue
-                    
-                    # 保存API数据
-                    api_data = data
-                    
-                    # 提取下载URL
-                    if content_type == DownloadContent.AUDIO:
-                        # 音频下载 - 从dash或durl获取音频URL
-                        if 'dash' in data and 'audio' in data['dash'] and len(data['dash']['audio']) > 0:
-                            audios = sorted(data['dash']['audio'], key=lambda x: x.get('bandwidth', 0), reverse=True)
-                            if audios:
-                                audio_url = audios[0]['baseUrl']
-                                break
-                        elif 'durl' in data and len(data['durl']) > 0:
-                            audio_url = data['durl'][0]['url']
-                            break
-                    else:
-                        # 视频下载 - 检查是否有dash格式（分离的视频和音频）
-                        if 'dash' in data:
-                            dash = data['dash']
-                            # 获取视频流
-                            if 'video' in dash and len(dash['video']) > 0:
-                                videos = sorted(dash['video'], key=lambda x: x.get('bandwidth', 0), reverse=True)
-                                if videos:
-                                    video_url = videos[0]['baseUrl']
-                            
-                            # 获取音频流
-                            if 'audio' in dash and len(dash['audio']) > 0:
-                                audios = sorted(dash['audio'], key=lambda x: x.get('bandwidth', 0), reverse=True)
-                                if audios:
-                                    audio_url = audios[0]['baseUrl']
-                            
-                            # 如果都获取到了，就可以跳出循环
-                            if video_url and audio_url:
-                                break
-                        # 如果没有dash格式，尝试获取普通URL
-                        elif 'durl' in data and len(data['durl']) > 0:
-                            video_url = data['durl'][0]['url']
-                            # 这里没有单独的音频流，可能是已经合并好的
-                            break
-                except Exception as e:
-                    error_msgs.append(f"API调用异常: {str(e)}")
-                    continue
+            # 每个流都收集主地址和全部备用镜像地址
+            audio_stream = selector.select_audio(dash.get('audio') or [])
+            if audio_stream:
+                audio_url = self._stream_urls(audio_stream)
             
-            # 如果是视频下载，但未获取到必要的URL
-            if content_type == DownloadContent.VIDEO:
-                if not video_url:
-                    error_msg = "无法获取视频下载地址: " + "; ".join(error_msgs)
-                    raise Exception(error_msg)
-            # 如果是音频下载，但未获取到音频URL
-            elif content_type == DownloadContent.AUDIO:
+            if content_type == DownloadContent.AUDIO:
+                # 音频下载 - 没有dash音频时使用durl
+                if not audio_url and durl:
+                    audio_url = self._stream_urls(durl[0])
                 if not audio_url:
-                    error_msg = "无法获取音频下载地址: " + "; ".join(error_msgs)
-                    raise Exception(error_msg)
+                    raise Exception("无法获取音频下载地址")
+            else:
+                # 视频下载 - 优先使用dash格式（分离的视频和音频）
+                video_stream = selector.select_video(dash.get('video') or []) if audio_url else None
+                if video_stream:
+                    video_url = self._stream_urls(video_stream)
+                    if self.status_callback:
+                        self.status_callback(
+                            f"选择视频流: 清晰度{video_stream.get('id')} {video_stream.get('codecs', '')} "
+                            f"{video_stream.get('width', '?')}x{video_stream.get('height', '?')}"
+                        )
+                # 如果没有dash格式，使用普通URL，这里没有单独的音频流，可能是已经合并好的
+                elif durl:
+                    video_url = self._stream_urls(durl[0])
+                    audio_url = None
+                if not video_url:
+                    raise Exception("无法获取视频下载地址")
             
             # 添加必要的请求头
             headers = {
@@ -1016,16 +2906,15 @@ class BiliDownloader:
                 if self.status_callback:
                     self.status_callback(f"开始下载音频: {output_path.name}")
                 
-                # 下载音频文件
-                self._download_file(audio_url, output_path, headers, f"download_{page['p']}_audio")
+                # 下载原始音频流，再转换为mp3
+                audio_source = download_dir / f"{output_filename}_audio_src.m4a"
+                if not audio_source.exists():
+                    self._download_file(audio_url, audio_source, headers, f"download_{page['p']}_audio")
                 
-                # 如果需要转换音频格式
-                if output_path.suffix != '.mp3':
-                    try:
-                        self._convert_to_mp3(output_path, download_dir / f"{output_filename}_temp.mp3")
-                    except Exception as e:
-                        if self.status_callback:
-                            self.status_callback(f"音频转换失败: {str(e)}")
+                convert_args = (audio_source, output_path, page, file_type, content_type)
+                if defer_merge:
+                    return self.postprocessor.submit(self._convert_and_verify, *convert_args)
+                return self._convert_and_verify(*convert_args)
                 
             else:
                 # 视频下载
@@ -1034,146 +2923,927 @@ class BiliDownloader:
                 
                 # 如果有分离的视频和音频流，需要下载后合并
                 if video_url and audio_url:
-                    # 分别下载视频和音频
                     video_temp = download_dir / f"{output_filename}_video_temp.mp4"
                     audio_temp = download_dir / f"{output_filename}_audio_temp.m4a"
                     
+                    # 视频流和音频流同时下载
+                    # 临时流文件只有在长度校验通过后才会出现，已存在的可直接复用
                     if self.status_callback:
-                        self.status_callback("下载视频流...")
-                    self._download_file(video_url, video_temp, headers, f"download_{page['p']}_video")
-                    
-                    if self.status_callback:
-                        self.status_callback("下载音频流...")
-                    self._download_file(audio_url, audio_temp, headers, f"download_{page['p']}_audio")
-                    
-                    # 使用ffmpeg合并视频和音频
-                    if self.status_callback:
-                        self.status_callback("合并视频和音频...")
-                    
-                    try:
-                        import subprocess
-                        
-                        # 确保目标文件不存在
-                        if output_path.exists():
-                            output_path.unlink()
-                        
-                        # 构建ffmpeg命令
-                        ffmpeg_cmd = [
-                            'ffmpeg',
-                            '-i', str(video_temp),
-                            '-i', str(audio_temp),
-                            '-c:v', 'copy',
-                            '-c:a', 'aac',
-                            '-strict', 'experimental',
-                            str(output_path),
-                            '-y'
+                        self.status_callback("下载视频流和音频流...")
+                    streams = [
+                        (video_url, video_temp, f"download_{page['p']}_video"),
+                        (audio_url, audio_temp, f"download_{page['p']}_audio")
+                    ]
+                    with ThreadPoolExecutor(max_workers=len(streams)) as stream_executor:
+                        # 流下载线程沿用当前分P任务的上下文，单个任务取消时一起中断
+                        futures = [
+                            stream_executor.submit(contextvars.copy_context().run,
+                                                   self._download_file, url, path, headers, task_id)
+                            for url, path, task_id in streams if not path.exists()
                         ]
-                        
-                        # 执行合并
-                        subprocess.run(ffmpeg_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                        
-                        # 清理临时文件
-                        if video_temp.exists():
-                            video_temp.unlink()
-                        if audio_temp.exists():
-                            audio_temp.unlink()
-                            
-                    except Exception as e:
-                        if self.status_callback:
-                            self.status_callback(f"合并视频失败: {str(e)}，尝试直接下载...")
-                        
-                        # 如果合并失败，尝试直接下载durl视频
-                        if api_data and 'durl' in api_data and len(api_data['durl']) > 0:
-                            direct_url = api_data['durl'][0]['url']
-                            self._download_file(direct_url, output_path, headers, f"download_{page['p']}_direct")
-                        else:
-                            raise Exception(f"无法合并视频和音频: {str(e)}")
+                        for future in futures:
+                            future.result()
+                    
+                    # 合并交给后处理线程池，当前线程可以继续下载下一个分P
+                    merge_args = (video_temp, audio_temp, output_path, download_dir / f"{output_filename}_merging.mp4",
+                                  api_data, headers, page, file_type, content_type)
+                    if defer_merge:
+                        return self.postprocessor.submit(self._merge_and_verify, *merge_args)
+                    result = self._merge_and_verify(*merge_args)
+                    return result() if callable(result) else result
                 else:
                     # 直接下载完整视频
                     self._download_file(video_url, output_path, headers, f"download_{page['p']}_video")
             
-            # 验证下载结果
-            if not output_path.exists():
-                raise Exception(f"下载后文件不存在: {output_path.name}")
-                
-            actual_size = output_path.stat().st_size
-            if actual_size == 0:
-                raise Exception(f"下载文件大小为0: {output_path.name}")
-                
-            # 完成下载
+            self._verify_output(output_path, file_type)
+            return True
+            
+        except Exception as e:
+            self._report_download_error(page, content_type, e)
+            return False
+
+    def _report_download_error(self, page: Dict, content_type: DownloadContent, error: Exception):
+        """通过状态与错误回调报告分P下载失败，被取消的任务只更新状态"""
+        if isinstance(error, DownloadCancelled):
+            if self.status_callback:
+                self.status_callback(f"已取消: P{page['p']} - {content_type.value}")
+            return
+        error_msg = f"下载失败: {str(error)}"
+        if self.status_callback:
+            self.status_callback(error_msg)
+            
+        if self.error_callback:
+            self.error_callback(f"download_{page['p']}_{content_type.name}", error_msg)
+
+    def _convert_and_verify(self, audio_source: Path, output_path: Path, page: Dict, file_type: str,
+                            content_type: DownloadContent) -> bool:
+        """将音频流转换为mp3并校验结果，可在后处理线程中执行
+        
+        Args:
+            audio_source: 下载的原始音频文件
+            output_path: 输出路径
+            page: 分P信息
+            file_type: 文件类型描述
+            content_type: 下载内容类型
+            
+        Returns:
+            是否成功
+        """
+        try:
+            self._convert_to_mp3(audio_source, output_path)
+            self._verify_output(output_path, file_type)
+            return True
+        except Exception as e:
+            self._report_download_error(page, content_type, e)
+            return False
+
+    @staticmethod
+    def _stream_urls(stream: Dict) -> List[str]:
+        """收集一个流的主地址和备用镜像地址（兼容dash与durl的字段名）"""
+        urls = [stream.get('baseUrl'), stream.get('base_url'), stream.get('url')]
+        urls += stream.get('backupUrl') or []
+        urls += stream.get('backup_url') or []
+        return list(dict.fromkeys(u for u in urls if u))
+
+    def _create_stream_selector(self, quality: DownloadQuality) -> StreamSelector:
+        """根据配置中的编码偏好创建流选择器"""
+        return StreamSelector(
+            quality,
+            codecs=self.config.get("video_codecs"),
+            exclude_codecs=self.config.get("exclude_codecs"),
+            allow_hdr=bool(self.config.get("allow_hdr", False)),
+            max_frame_rate=self.config.get("max_frame_rate")
+        )
+
+    def _get_playurl(self, bvid: str, cid: int, qn: int = 112, fnval: int = 16) -> Dict:
+        """获取playurl接口数据，按 (bvid, cid, qn, fnval) 缓存
+        
+        依次尝试多个playurl接口，返回第一个包含可用流地址的结果。
+        缓存有效期取自CDN签名地址中的deadline参数。
+        同一分P的视频和音频任务同时未命中缓存时只请求一次，后到的任务等待并共用结果。
+        
+        Args:
+            bvid: 视频BV号
+            cid: 分P的cid
+            qn: 清晰度代码
+            fnval: 流格式标志
+            
+        Returns:
+            playurl接口返回的data字段
+        """
+        key = (bvid, cid, qn, fnval)
+        data = self._lookup_playurl(key)
+        if data is not None:
+            return data
+        
+        fetched = []
+        
+        def fetch():
+            fetched.append(True)
+            return self._fetch_playurl(key)
+        
+        data = self.single_flight.do(("playurl",) + key, fetch)
+        self._count_playurl_lookup(bool(fetched))
+        return data
+
+    def _fetch_playurl(self, key: tuple) -> Dict:
+        bvid, cid, qn, fnval = key
+        # 尝试所有可能的API接口
+        error_msgs = []
+        for api_url in self._playurl_api_urls(bvid, cid, qn, fnval):
+            try:
+                with self.api_semaphore:
+                    response = self._safe_request("GET", api_url)
+                data = self._parse_playurl_response(response.json())
+                self._store_playurl(key, data)
+                return data
+            except Exception as e:
+                error_msgs.append(str(e))
+        
+        raise Exception("无法获取下载地址: " + "; ".join(error_msgs))
+
+    def _playurl_api_urls(self, bvid: str, cid: int, qn: int, fnval: int) -> List[str]:
+        """按优先顺序排列的playurl接口地址"""
+        return [
+            f"{self.api_base}/x/player/playurl?bvid={bvid}&cid={cid}&qn={qn}&fnval={fnval}&fourk=1",
+            f"{self.api_base}/x/player/wbi/playurl?bvid={bvid}&cid={cid}&qn={qn}&fnval=4048&fourk=1",
+            f"{self.api_base}/pgc/player/web/playurl?bvid={bvid}&cid={cid}&qn={qn}",
+            f"{self.api_base}/x/player/playurl?bvid={bvid}&cid={cid}&qn={min(qn, 80)}"
+        ]
+
+    @staticmethod
+    def _parse_playurl_response(response_json: Dict) -> Dict:
+        """校验playurl接口响应，返回包含可用流地址的data字段"""
+        if response_json.get('code') != 0:
+            raise Exception(f"API错误: {response_json.get('message', '未知错误')}")
+        
+        data = response_json.get('data', {})
+        if not data:
+            raise Exception("API返回数据为空")
+        
+        if not ((data.get('dash') or {}).get('audio') or data.get('durl')):
+            raise Exception("API返回数据中没有可用的流地址")
+        return data
+
+    def _lookup_playurl(self, key: tuple) -> Optional[Dict]:
+        """读取未过期的playurl缓存，命中时计入统计"""
+        with self.lock:
+            entry = self.playurl_cache.get(key)
+            if entry and entry[1] > time.time():
+                self.playurl_stats["hits"] += 1
+                return entry[0]
+        return None
+
+    def _count_playurl_lookup(self, fetched: bool):
+        """缓存未命中的查询：实际发出请求的记为未命中，等待并共用他人请求结果的记为命中"""
+        with self.lock:
+            self.playurl_stats["misses" if fetched else "hits"] += 1
+
+    def _store_playurl(self, key: tuple, data: Dict):
+        """写入playurl缓存，顺便清理已过期的条目"""
+        now = time.time()
+        with self.lock:
+            for expired in [k for k, v in self.playurl_cache.items() if v[1] <= now]:
+                del self.playurl_cache[expired]
+            self.playurl_cache[key] = (data, self._playurl_expiry(data))
+
+    @staticmethod
+    def _playurl_expiry(data: Dict) -> float:
+        """根据流地址中的deadline参数计算缓存过期时间，预留60秒余量"""
+        urls = []
+        dash = data.get('dash') or {}
+        for stream in (dash.get('video') or []) + (dash.get('audio') or []):
+            urls.append(stream.get('baseUrl') or stream.get('base_url') or '')
+            urls.extend(stream.get('backupUrl') or stream.get('backup_url') or [])
+        for item in data.get('durl') or []:
+            urls.append(item.get('url', ''))
+            urls.extend(item.get('backup_url') or [])
+        
+        deadlines = []
+        for url in urls:
+            deadline = parse_qs(urlparse(url).query).get('deadline', [''])[0]
+            if deadline.isdigit():
+                deadlines.append(int(deadline))
+        if deadlines:
+            return min(deadlines) - 60
+        # 没有deadline时保守地缓存10分钟
+        return time.time() + 600
+
+    def _merge_and_verify(self, video_temp: Path, audio_temp: Path, output_path: Path, merge_temp: Path,
+                          api_data: Optional[Dict], headers: Dict, page: Dict, file_type: str,
+                          content_type: DownloadContent) -> bool:
+        """合并视频流和音频流并校验结果，可在后处理线程中执行
+        
+        合并失败时不在这里下载durl中的完整视频，以免慢速下载长时间占用后处理线程，
+        而是返回执行直接下载的函数，由调用方在下载线程中调用。
+        
+        Args:
+            video_temp: 视频流临时文件
+            audio_temp: 音频流临时文件
+            output_path: 输出路径
+            merge_temp: 合并过程中使用的临时输出文件
+            api_data: playurl接口返回的数据，合并失败时用于直接下载
+            headers: HTTP头信息
+            page: 分P信息
+            file_type: 文件类型描述
+            content_type: 下载内容类型
+            
+        Returns:
+            是否成功；合并失败且有durl地址时返回无参数、结果为bool的直接下载函数
+        """
+        try:
+            # 使用ffmpeg合并视频和音频
             if self.status_callback:
-                self.status_callback(f"{file_type}下载完成: {output_path.name}")
+                self.status_callback(f"合并视频和音频: {output_path.name}")
+            
+            try:
+                # 先输出到临时文件，合并成功后再改名，避免中断留下不完整的成品
+                audio_mode = self._mux_streams(video_temp, audio_temp, merge_temp)
+                os.replace(merge_temp, output_path)
+                if self.status_callback:
+                    mode_text = "音频直接复制" if audio_mode == "copy" else "音频转码为AAC"
+                    self.status_callback(f"合并完成({mode_text}): {output_path.name}")
+                
+                # 清理临时文件
+                if video_temp.exists():
+                    video_temp.unlink()
+                if audio_temp.exists():
+                    audio_temp.unlink()
+                    
+            except Exception as e:
+                if self.status_callback:
+                    self.status_callback(f"合并视频失败: {str(e)}，尝试直接下载...")
                 
+                # 如果合并失败，尝试直接下载durl视频
+                if api_data and 'durl' in api_data and len(api_data['durl']) > 0:
+                    direct_urls = self._stream_urls(api_data['durl'][0])
+                    return functools.partial(self._download_direct_video, direct_urls, output_path, headers,
+                                             page, file_type, content_type)
+                raise Exception(f"无法合并视频和音频: {str(e)}")
+            
+            self._verify_output(output_path, file_type)
             return True
             
         except Exception as e:
-            error_msg = f"下载失败: {str(e)}"
-            if self.status_callback:
-                self.status_callback(error_msg)
-                
-            if self.error_callback:
-                self.error_callback(f"download_{page['p']}_{content_type.name}", error_msg)
-                
+            self._report_download_error(page, content_type, e)
+            return False
+
+    def _download_direct_video(self, direct_urls: List[str], output_path: Path, headers: Dict, page: Dict,
+                               file_type: str, content_type: DownloadContent) -> bool:
+        """合并失败后直接下载durl中的完整视频，需在下载线程中、分P任务的上下文内执行"""
+        try:
+            self._download_file(direct_urls, output_path, headers, f"download_{page['p']}_direct")
+            self._verify_output(output_path, file_type)
+            return True
+        except Exception as e:
+            self._report_download_error(page, content_type, e)
             return False
+
+    def _probe_audio_codec(self, audio_path: Path) -> Optional[str]:
+        """使用ffprobe获取音频编码名称，ffprobe不可用或失败时返回None"""
+        try:
+            result = self.postprocessor.run_ffmpeg(f"probe_{audio_path.name}", self._probe_command(audio_path))
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        codec = result.stdout.decode('utf-8', errors='ignore').strip().lower()
+        return codec or None
+
+    def _mux_streams(self, video_path: Path, audio_path: Path, output_path: Path) -> str:
+        """使用ffmpeg合并视频流和音频流
+        
+        视频流始终直接复制。音频编码可被MP4容器直接封装时也直接复制，
+        仅在编码不兼容或复制失败时才转码为AAC。
+        
+        Args:
+            video_path: 视频流文件
+            audio_path: 音频流文件
+            output_path: 输出文件
+            
+        Returns:
+            音频处理方式："copy" 或 "transcode"
+        """
+        codec = self._probe_audio_codec(audio_path)
+        
+        # 无法探测编码时也先尝试直接复制，B站DASH音频通常就是AAC
+        if codec is None or codec in MP4_COPY_AUDIO_CODECS:
+            copy_cmd = self._mux_command(video_path, audio_path, output_path, transcode=False)
+            try:
+                self.postprocessor.run_ffmpeg(f"mux_{output_path.name}", copy_cmd)
+                with self.lock:
+                    self.merge_stats["copy"] += 1
+                return "copy"
+            except subprocess.CalledProcessError:
+                if self.status_callback:
+                    self.status_callback(f"音频({codec or '未知编码'})无法直接封装，改为转码...")
+        
+        transcode_cmd = self._mux_command(video_path, audio_path, output_path, transcode=True)
+        self.postprocessor.run_ffmpeg(f"mux_{output_path.name}", transcode_cmd)
+        with self.lock:
+            self.merge_stats["transcode"] += 1
+        return "transcode"
+
+    @staticmethod
+    def _probe_command(audio_path: Path) -> List[str]:
+        """获取音频编码名称的ffprobe命令"""
+        return [
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'a:0',
+            '-show_entries', 'stream=codec_name',
+            '-of', 'default=noprint_wrappers=1:nokey=1',
+            str(audio_path)
+        ]
+
+    @staticmethod
+    def _mux_command(video_path: Path, audio_path: Path, output_path: Path, transcode: bool) -> List[str]:
+        """合并音视频的ffmpeg命令，视频流始终直接复制，transcode为True时音频转码为AAC"""
+        audio_args = ['-c:a', 'aac', '-b:a', '320k'] if transcode else ['-c:a', 'copy']
+        return [
+            'ffmpeg',
+            '-i', str(video_path),
+            '-i', str(audio_path),
+            '-map', '0:v:0',
+            '-map', '1:a:0',
+            '-c:v', 'copy'
+        ] + audio_args + [str(output_path), '-y']
+
+    @staticmethod
+    def _mp3_command(input_path: Path, output_path: Path) -> List[str]:
+        """转换为mp3的ffmpeg命令"""
+        return [
+            'ffmpeg', 
+            '-i', str(input_path), 
+            '-vn', 
+            '-acodec', 'libmp3lame', 
+            '-q:a', '4', 
+            str(output_path), 
+            '-y'
+        ]
+
+    def _verify_output(self, output_path: Path, file_type: str):
+        """验证下载结果，文件缺失或为空时抛出异常"""
+        if not output_path.exists():
+            raise Exception(f"下载后文件不存在: {output_path.name}")
+            
+        actual_size = output_path.stat().st_size
+        if actual_size == 0:
+            raise Exception(f"下载文件大小为0: {output_path.name}")
+            
+        # 完成下载
+        if self.status_callback:
+            self.status_callback(f"{file_type}下载完成: {output_path.name}")
             
-    def _download_file(self, url: str, output_path: Path, headers: Dict, task_id: str) -> bool:
+    def _download_file(self, url: Union[str, List[str]], output_path: Path, headers: Dict, task_id: str) -> bool:
         """下载单个文件的通用方法
+
+        数据先写入 .part 文件，并在 .part.json 中记录已完成的字节范围、
+        ETag 和文件总长度，中断后重新下载会从记录处继续。
+        只有长度校验通过后才会改名为最终文件。
+        文件足够大且服务器支持Range请求时，使用多连接分段下载；
+        否则退回单连接流式下载。
+        传入多个镜像地址时，先按测速结果排序，传输中吞吐过低或出错时切换镜像。
         
         Args:
-            url: 下载URL
+            url: 下载URL，或同一文件的多个镜像URL
             output_path: 输出路径
             headers: HTTP头信息
-            task_id: 任务ID，用于进度回调
+            task_id: 任务名，登记到进度总线
             
         Returns:
             是否下载成功
         """
+        urls = [url] if isinstance(url, str) else list(url)
+        # 限制同时进行的CDN传输数量
+        with self.transfer_semaphore:
+            page_task = current_page_task.get()
+            progress = self.progress_bus.task(task_id, label=output_path.name,
+                                              group=page_task["key"] if page_task else None)
+            try:
+                result = self._transfer_file(urls, output_path, headers, progress)
+            except BaseException:
+                progress.finish(False)
+                raise
+            progress.finish(result)
+            return result
+
+    def _transfer_file(self, urls: List[str], output_path: Path, headers: Dict, progress: TaskCounter) -> bool:
+        """在获得传输配额后执行实际下载，progress 为进度计数器，其余参数同 _download_file"""
+        part_path = output_path.with_name(output_path.name + ".part")
+        state_path = output_path.with_name(output_path.name + ".part.json")
+        
+        if len(urls) > 1:
+            urls = self._order_mirrors(urls, headers)
+        
+        # 依次探测，跳过无法访问的镜像
+        total_size, accept_ranges, etag = 0, False, None
+        for index, url in enumerate(urls):
+            total_size, accept_ranges, etag = self._probe_remote_size(url, headers)
+            if total_size or accept_ranges:
+                urls = urls[index:] + urls[:index]
+                break
+            self.mirror_manager.record_failure(url)
+        
+        # 校验断点记录是否仍对应同一个远程文件
+        state = self._load_part_state(state_path)
+        if state and not (
+            accept_ranges
+            and part_path.exists()
+            and state.get("total_size") == total_size
+            and state.get("etag") == etag
+        ):
+            state = None
+        if state is None:
+            state = {"etag": etag, "total_size": total_size, "completed": []}
+            if part_path.exists():
+                part_path.unlink()
+        elif self.status_callback:
+            done = sum(end - start + 1 for start, end in state["completed"])
+            self.status_callback(f"继续未完成的下载: {output_path.name} ({done}/{total_size} 字节)")
+        
+        segment_count = int(self.config.get("segment_count", 1) or 1)
+        if segment_count > 1 and accept_ranges and total_size >= SEGMENT_MIN_SIZE:
+            self._segmented_download(urls, part_path, state_path, state, headers, progress, segment_count)
+        else:
+            # 单连接下载失败或过慢时换下一个镜像，借助断点记录继续
+            for index, url in enumerate(urls):
+                try:
+                    self._stream_download(url, part_path, state_path, state, headers, progress,
+                                          accept_ranges, fallbacks=urls[index + 1:])
+                    break
+                except DownloadCancelled:
+                    raise
+                except Exception as e:
+                    if index == len(urls) - 1:
+                        raise
+                    if not isinstance(e, SlowMirrorError):
+                        self.mirror_manager.record_failure(url)
+                    if self.status_callback:
+                        self.status_callback(f"切换镜像 {MirrorManager.host(urls[index + 1])}: {str(e)}")
+        
+        # 长度校验通过后才改名为最终文件
+        actual_size = part_path.stat().st_size
+        expected_size = state["total_size"]
+        if expected_size and actual_size != expected_size:
+            raise Exception(f"文件长度校验失败: {actual_size}/{expected_size} 字节")
+        os.replace(part_path, output_path)
+        if state_path.exists():
+            state_path.unlink()
+        return True
+
+    def _order_mirrors(self, urls: List[str], headers: Dict) -> List[str]:
+        """对镜像地址排序；存在未测速的主机时先并发测速
+        
+        Args:
+            urls: 镜像地址列表
+            headers: HTTP头信息
+            
+        Returns:
+            按速度从快到慢排列的地址列表
+        """
+        if all(self.mirror_manager.is_known(url) for url in urls):
+            return self.mirror_manager.rank(urls)
+        
+        def race(url):
+            race_headers = dict(headers)
+            race_headers['Range'] = f'bytes=0-{MIRROR_RACE_BYTES - 1}'
+            try:
+                self.rate_limiter.acquire(url)
+                start = time.monotonic()
+                response = self.transport.request("GET", url, headers=race_headers, stream=True, timeout=(5, 10),
+                                                  proxies=self.proxies)
+                with response:
+                    if response.status_code not in (200, 206):
+                        raise Exception(f"HTTP {response.status_code}")
+                    received = 0
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        received += len(chunk)
+                        if received >= MIRROR_RACE_BYTES:
+                            break
+                self.mirror_manager.record(url, received, time.monotonic() - start)
+            except Exception:
+                self.mirror_manager.record_failure(url)
+        
+        # 同时请求各镜像的前若干字节，按首段吞吐量排序
+        with ThreadPoolExecutor(max_workers=min(len(urls), 8)) as executor:
+            list(executor.map(race, urls))
+        
+        ranked = self.mirror_manager.rank(urls)
+        if self.status_callback:
+            self.status_callback(f"镜像测速完成，使用 {MirrorManager.host(ranked[0])}")
+        return ranked
+
+    def _stream_download(self, url: str, part_path: Path, state_path: Path, state: Dict,
+                         headers: Dict, progress: TaskCounter, accept_ranges: bool, fallbacks: List[str] = ()):
+        """单连接流式下载，支持从已完成的前缀继续
+        
+        Args:
+            url: 下载URL
+            part_path: 临时文件路径
+            state_path: 断点记录路径
+            state: 断点记录
+            headers: HTTP头信息
+            progress: 进度计数器
+            accept_ranges: 服务器是否支持Range请求
+            fallbacks: 可切换的其余镜像，其中有评分更高的主机时吞吐过低会抛出SlowMirrorError
+        """
+        completed = state["completed"]
+        resume_from = completed[0][1] + 1 if accept_ranges and completed and completed[0][0] == 0 else 0
+        min_speed = float(self.config.get("mirror_min_speed", 0) or 0)
+        check_interval = float(self.config.get("mirror_check_interval", 5))
+        
+        request_headers = dict(headers)
+        request_headers['Range'] = f'bytes={resume_from}-'
+        progress.host = MirrorManager.host(url)
+        
         # 强制使用流式下载
-        response = self._safe_request("GET", url, headers=headers, stream=True, timeout=30)
-        total_size = int(response.headers.get('content-length', 0))
+        response = self._safe_request("GET", url, headers=request_headers, stream=True, timeout=30)
         
         # 确保响应是成功的
         if response.status_code not in [200, 206]:  # 200正常, 206部分内容
             raise Exception(f"下载请求失败: HTTP {response.status_code}")
+        if response.status_code == 200:
+            # 服务器忽略了Range，只能从头下载
+            resume_from = 0
+        elif state["total_size"] and not response.headers.get('Content-Range', '').endswith(f"/{state['total_size']}"):
+            response.close()
+            raise Exception("镜像返回的文件长度与记录不一致")
+        if not state["total_size"]:
+            state["total_size"] = resume_from + int(response.headers.get('content-length', 0))
+        total_size = state["total_size"]
             
-        downloaded = 0
+        downloaded = resume_from
         last_progress_time = time.time()
-        chunk_size = 1024 * 1024  # 1MB
-        start_time = time.time()
-        
-        # 实际下载文件
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
+        progress.update(0, total_size - resume_from)
+        window_start, window_bytes = time.monotonic(), 0
+        throttle = self._throttle(url)
+        
+        # 网络数据直接读入写入器的缓冲区，由后台线程写盘；断点记录只包含已写盘的部分
+        writer, preallocated = self._open_disk_writer(part_path, resume_from, total_size)
+        stream = WriteStream(writer, resume_from)
+        read = response_reader(response)
+        with response:
+            try:
+                while True:
+                    length = stream.readinto(read)
+                    if not length:
+                        break
+                    downloaded += length
+                    window_bytes += length
+                    progress.add(length)
                     
-                    # 计算下载速度
-                    current_time = time.time()
-                    elapsed = current_time - start_time
-                    speed = downloaded / elapsed / 1024 / 1024 if elapsed > 0 else 0
+                    # 带宽限制的等待不计入镜像吞吐量
+                    wait_time = throttle.consume(length)
+                    if wait_time > 0:
+                        time.sleep(wait_time)
+                        window_start += wait_time
                     
-                    # 更新进度，但不要太频繁
-                    if current_time - last_progress_time >= 0.2:  # 200ms更新一次
-                        if self.progress_callback:
-                            # 回调通知GUI更新进度条
-                            self.progress_callback(
-                                task_id,
-                                downloaded, 
-                                total_size,
-                                speed
+                    # 按窗口统计镜像吞吐量，过低且有更好的备用镜像时切换
+                    window_elapsed = time.monotonic() - window_start
+                    if window_elapsed >= check_interval:
+                        self.mirror_manager.record(url, window_bytes, window_elapsed)
+                        if (window_bytes / window_elapsed < min_speed
+                                and self.mirror_manager.has_better(url, fallbacks)):
+                            raise SlowMirrorError(
+                                f"镜像速度过低: {window_bytes / window_elapsed / 1024:.0f}KB/s"
                             )
-                            
-                        if self.status_callback:
-                            percent = (downloaded / total_size * 100) if total_size > 0 else 0
-                            self.status_callback(f"下载中: {percent:.1f}% | 速度: {speed:.1f}MB/s")
-                            
+                        window_start, window_bytes = time.monotonic(), 0
+                    
+                    # 检查取消并更新断点记录，但不要太频繁
+                    current_time = time.time()
+                    if current_time - last_progress_time >= 0.2:  # 200ms更新一次
+                        self._check_cancelled()
+                        written = writer.end
+                        writer.checkpoint()
+                        state["completed"] = [[0, written - 1]] if written else []
+                        self._save_part_state(state_path, state)
                         last_progress_time = current_time
-                        
-        return True
+                self.mirror_manager.record(url, window_bytes, time.monotonic() - window_start)
+                stream.flush()
+                writer.flush()
+            finally:
+                stream.flush()
+                # 预分配的文件截断到实际写入的长度，长度校验仍然有效
+                writer.close(trim=preallocated)
+                state["completed"] = [[0, writer.end - 1]] if writer.end else []
+                self._save_part_state(state_path, state)
+
+    def _open_disk_writer(self, part_path: Path, size: int, total_size: int,
+                          buffer_count: int = None) -> Tuple[DiskWriter, bool]:
+        """按 disk_* 配置为临时文件创建后台写入器
+        
+        Args:
+            part_path: 临时文件路径
+            size: 文件截断为该长度（顺序下载为已完成的前缀，分段下载为总长度）
+            total_size: 文件总长度，disk_preallocate 开启时预分配到该长度
+            buffer_count: 缓冲区数量，默认取 disk_buffers
+            
+        Returns:
+            (写入器, 是否已预分配)
+        """
+        writer = DiskWriter(
+            part_path, size,
+            buffer_size=int(self.config.get("disk_buffer_size", 1024 * 1024)),
+            buffer_count=buffer_count or int(self.config.get("disk_buffers", 4)),
+            sync=self.config.get("disk_sync", "none"),
+            direct=bool(self.config.get("disk_direct_io", False))
+        )
+        preallocated = bool(self.config.get("disk_preallocate", False)) and writer.allocate(0, total_size)
+        return writer, preallocated
+
+    def _probe_remote_size(self, url: str, headers: Dict) -> tuple:
+        """探测远程文件大小、是否支持Range请求以及ETag
+        
+        Args:
+            url: 下载URL
+            headers: HTTP头信息
+            
+        Returns:
+            (文件总字节数, 是否支持分段请求, ETag)
+        """
+        probe_headers = dict(headers)
+        probe_headers['Range'] = 'bytes=0-0'
+        try:
+            response = self._safe_request("GET", url, headers=probe_headers, stream=True, timeout=15)
+        except Exception:
+            return 0, False, None
+        
+        try:
+            etag = response.headers.get('ETag')
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and '/' in content_range:
+                # 读完1字节的响应体，连接才能放回连接池，否则关闭响应时会断开连接
+                response.content
+                total = content_range.rsplit('/', 1)[-1].strip()
+                if total.isdigit():
+                    return int(total), True, etag
+            return int(response.headers.get('content-length', 0)), False, etag
+        finally:
+            response.close()
+
+    @staticmethod
+    def _load_part_state(state_path: Path) -> Optional[Dict]:
+        """读取断点记录，文件不存在或损坏时返回None"""
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            state["completed"] = [list(r) for r in state.get("completed", [])]
+            return state
+        except (OSError, ValueError, TypeError):
+            return None
+
+    @staticmethod
+    def _save_part_state(state_path: Path, state: Dict):
+        """原子地写入断点记录"""
+        temp_path = state_path.with_name(state_path.name + ".tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(temp_path, state_path)
+
+    @staticmethod
+    def _merge_ranges(ranges: List[List[int]]) -> List[List[int]]:
+        """合并相邻或重叠的闭区间字节范围"""
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def _segmented_download(self, urls: List[str], part_path: Path, state_path: Path, state: Dict,
+                            headers: Dict, progress: TaskCounter, segment_count: int):
+        """多连接分段下载
+        
+        未完成的字节范围拆分为多个分段，由连接池中的多个连接同时下载，
+        经后台写入器写入预分配文件的对应偏移。空闲连接会拆分剩余量最大的分段，
+        长时间无进展的分段会整体转交给其他连接。
+        每次发起分段请求时选用当前评分最高的镜像，分段吞吐过低或出错时换镜像重新请求。
+        
+        Args:
+            urls: 镜像地址列表
+            part_path: 临时文件路径
+            state_path: 断点记录路径
+            state: 断点记录
+            headers: HTTP头信息
+            progress: 进度计数器
+            segment_count: 并发连接数
+        """
+        stall_timeout = float(self.config.get("segment_stall_timeout", 15))
+        min_speed = float(self.config.get("mirror_min_speed", 0) or 0)
+        check_interval = float(self.config.get("mirror_check_interval", 5))
+        total_size = state["total_size"]
+        completed = self._merge_ranges(state["completed"])
+        
+        # 计算尚未完成的区间
+        gaps = []
+        cursor = 0
+        for start, end in completed + [[total_size, total_size]]:
+            if start > cursor:
+                gaps.append((cursor, start - 1))
+            cursor = max(cursor, end + 1)
+        missing = sum(end - start + 1 for start, end in gaps)
+        
+        # 初始分段，end为闭区间
+        segment_size = max(-(-missing // segment_count), 1)
+        segments = []
+        for gap_start, gap_end in gaps:
+            for start in range(gap_start, gap_end + 1, segment_size):
+                segments.append({
+                    "start": start,
+                    "end": min(start + segment_size - 1, gap_end),
+                    "pos": start,
+                    "written": start,
+                    "running": False,
+                    "last_active": time.time()
+                })
+        pending = list(segments)
+        state_lock = threading.Lock()
+        abort = threading.Event()
+        counter = {"downloaded": total_size - missing}
+        
+        def remaining(seg):
+            return seg["end"] - seg["pos"] + 1
+        
+        def take_segment():
+            """领取一个分段；没有待领取分段时拆分或接管正在下载的分段"""
+            with state_lock:
+                if pending:
+                    seg = pending.pop(0)
+                    seg["running"] = True
+                    seg["last_active"] = time.time()
+                    return seg
+                
+                active = [s for s in segments if s["running"] and remaining(s) > 0]
+                if not active:
+                    return None
+                
+                now = time.time()
+                stalled = [s for s in active if now - s["last_active"] >= stall_timeout]
+                if stalled:
+                    # 接管停滞分段的全部剩余范围，原连接写入前会发现范围已被收回
+                    victim = max(stalled, key=remaining)
+                    split_at = victim["pos"]
+                else:
+                    victim = max(active, key=remaining)
+                    if remaining(victim) < SEGMENT_SPLIT_MIN * 2:
+                        return None
+                    split_at = victim["pos"] + remaining(victim) // 2
+                
+                seg = {
+                    "start": split_at,
+                    "end": victim["end"],
+                    "pos": split_at,
+                    "written": split_at,
+                    "running": True,
+                    "last_active": now
+                }
+                victim["end"] = split_at - 1
+                segments.append(seg)
+                return seg
+        
+        def fetch_segment(seg):
+            """下载单个分段，连接中断或镜像过慢时从当前位置续传"""
+            attempts = 0
+            # 因速度过低而断开的主机，下一次选择镜像时排除
+            slow_host = None
+            while not abort.is_set():
+                with state_lock:
+                    start, end = seg["pos"], seg["end"]
+                if start > end:
+                    return
+                
+                url = self.mirror_manager.rank(urls, exclude=slow_host)[0]
+                slow_host = None
+                progress.host = MirrorManager.host(url)
+                seg_headers = dict(headers)
+                seg_headers['Range'] = f'bytes={start}-{end}'
+                try:
+                    response = self._safe_request("GET", url, headers=seg_headers, stream=True, timeout=30)
+                    if response.status_code != 206:
+                        response.close()
+                        raise Exception(f"服务器未返回分段内容: HTTP {response.status_code}")
+                    if not response.headers.get('Content-Range', '').endswith(f"/{total_size}"):
+                        response.close()
+                        raise Exception("镜像返回的文件长度与记录不一致")
+                    
+                    window_start, window_bytes = time.monotonic(), 0
+                    throttle = self._throttle(url)
+                    read = response_reader(response)
+                    
+                    def on_written(offset, length, seg=seg):
+                        # 在写入线程中计数，计数满即表示数据已全部落盘
+                        seg["written"] = offset + length
+                        counter["downloaded"] += length
+                        progress.add(length)
+                    
+                    stream = WriteStream(writer, start, on_written)
+                    with response:
+                        try:
+                            while not abort.is_set():
+                                # 先读入本连接的缓冲区，再在锁内占用写入范围，
+                                # 被接管而超出范围的部分不提交；
+                                # 限速等待期间分段仍视为活跃，不会被当作停滞分段接管
+                                view = stream.space()
+                                length = read(view)
+                                if not length:
+                                    self.mirror_manager.record(url, window_bytes, time.monotonic() - window_start)
+                                    break
+                                wait_time = throttle.consume(length)
+                                with state_lock:
+                                    allowed = min(length, seg["end"] - seg["pos"] + 1)
+                                    if allowed <= 0:
+                                        return
+                                    seg["pos"] += allowed
+                                    seg["last_active"] = time.time() + wait_time
+                                stream.commit(allowed)
+                                if allowed < length:
+                                    return
+                                if wait_time > 0:
+                                    time.sleep(wait_time)
+                                    window_start += wait_time
+                                
+                                # 按窗口统计镜像吞吐量，过低且有其他镜像时断开并换镜像重新请求
+                                window_bytes += allowed
+                                window_elapsed = time.monotonic() - window_start
+                                if window_elapsed >= check_interval:
+                                    self.mirror_manager.record(url, window_bytes, window_elapsed)
+                                    if (window_bytes / window_elapsed < min_speed
+                                            and self.mirror_manager.has_better(url, urls)):
+                                        slow_host = MirrorManager.host(url)
+                                        break
+                                    window_start, window_bytes = time.monotonic(), 0
+                        finally:
+                            stream.flush()
+                    attempts = 0
+                except Exception:
+                    if writer.error is not None:
+                        # 写盘失败（例如磁盘已满）换镜像也无济于事
+                        raise
+                    self.mirror_manager.record_failure(url)
+                    attempts += 1
+                    if attempts >= 5:
+                        raise
+                    time.sleep(min(2 * attempts, 10))
+        
+        def worker():
+            while not abort.is_set():
+                with state_lock:
+                    if all(remaining(s) <= 0 for s in segments):
+                        return
+                seg = take_segment()
+                if seg is None:
+                    time.sleep(0.5)
+                    continue
+                try:
+                    fetch_segment(seg)
+                finally:
+                    with state_lock:
+                        seg["running"] = False
+                        # 异常退出时，未完成的部分交还给其他连接
+                        if remaining(seg) > 0 and seg not in pending:
+                            pending.append(seg)
+        
+        def save_state():
+            with state_lock:
+                written = [[s["start"], s["written"] - 1] for s in segments if s["written"] > s["start"]]
+            writer.checkpoint()
+            state["completed"] = self._merge_ranges(completed + written)
+            self._save_part_state(state_path, state)
+        
+        last_save_time = time.time()
+        progress.update(0, missing)
+        # 临时文件扩展到总长度；每个连接至少有一个缓冲区可填充，另有一个等待写盘
+        writer, _ = self._open_disk_writer(part_path, total_size, total_size,
+                                           max(int(self.config.get("disk_buffers", 4)), segment_count + 1))
+        executor = ThreadPoolExecutor(max_workers=segment_count)
+        try:
+            futures = [executor.submit(worker) for _ in range(segment_count)]
+            while True:
+                done, not_done = wait(futures, timeout=0.2)
+                current_time = time.time()
+                # 分段连接定期经过这里，取消的任务在此中断
+                self._check_cancelled()
+                if current_time - last_save_time >= 1:
+                    save_state()
+                    last_save_time = current_time
+                for future in done:
+                    future.result()
+                # 被接管的停滞连接可能仍阻塞在读取上，数据齐全后不再等待
+                if not not_done or counter["downloaded"] >= total_size:
+                    break
+        finally:
+            abort.set()
+            executor.shutdown(wait=False)
+            writer.close()
+            save_state()
+        
+        if writer.error is not None:
+            raise writer.error
+        if counter["downloaded"] != total_size:
+            raise Exception(f"分段下载不完整: {counter['downloaded']}/{total_size} 字节")
         
     def _convert_to_mp3(self, input_path: Path, output_path: Path) -> bool:
-        """将音频文件转换为MP3格式
+        """将音频文件转换为MP3格式，成功后删除输入文件
         
         Args:
             input_path: 输入文件路径
@@ -1183,31 +3853,19 @@ class BiliDownloader:
             是否转换成功
         """
         if self.status_callback:
-            self.status_callback("转换音频格式...")
-        
-        # 尝试使用ffmpeg将下载的音频转换为mp3
-        import subprocess
+            self.status_callback(f"转换音频格式: {output_path.name}")
         
-        # 使用subprocess而不是os.system，更安全
-        ffmpeg_cmd = [
-            'ffmpeg', 
-            '-i', str(input_path), 
-            '-vn', 
-            '-acodec', 'libmp3lame', 
-            '-q:a', '4', 
-            str(output_path), 
-            '-y'
-        ]
+        # 先输出到临时文件，转换成功后再改名
+        temp_path = output_path.with_name(output_path.stem + "_converting.mp3")
         
         # 执行转换并等待完成
-        subprocess.run(ffmpeg_cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.postprocessor.run_ffmpeg(f"convert_{output_path.name}", self._mp3_command(input_path, temp_path))
         
         # 检查转换结果
-        if output_path.exists() and output_path.stat().st_size > 0:
-            # 替换原文件
+        if temp_path.exists() and temp_path.stat().st_size > 0:
+            os.replace(temp_path, output_path)
             if input_path.exists():
                 input_path.unlink()
-            output_path.rename(input_path)
             return True
         
         return False
@@ -1262,7 +3920,7 @@ class BiliDownloader:
                 video_url += f"?p={page['p']}"
                 
             # 构建输出文件名
-            output_filename = f"P{page['p']}_{self._sanitize_filename(page['title'])}"
+            output_filename = self._output_filename(page)
             
             # 根据内容类型选择下载方式
             if content_type == DownloadContent.VIDEO:
@@ -1344,7 +4002,7 @@ class BiliDownloader:
                                 self.status_callback(f"尝试使用备用方法下载...")
                             
                             # 尝试获取视频真实地址
-                            api_url = f"https://api.bilibili.com/x/player/playurl?bvid={info['bvid']}&cid={page['cid']}&qn=80&fnval=16"
+                            api_url = f"{self.api_base}/x/player/playurl?bvid={info['bvid']}&cid={page['cid']}&qn=80&fnval=16"
                             response = self._safe_request("GET", api_url)
                             data = response.json().get('data', {})
                             
@@ -1361,10 +4019,14 @@ class BiliDownloader:
                             }
                             
                             response = self._safe_request("GET", download_url, headers=headers, stream=True)
+                            throttle = self._throttle(download_url)
                             with open(output_path, 'wb') as f:
                                 for chunk in response.iter_content(chunk_size=8192):
                                     if chunk:
                                         f.write(chunk)
+                                        wait_time = throttle.consume(len(chunk))
+                                        if wait_time > 0:
+                                            time.sleep(wait_time)
                             
                             # 验证文件大小
                             if output_path.stat().st_size > 0:
@@ -1409,34 +4071,234 @@ class BiliDownloader:
         if self.error_callback:
             self.error_callback(task_id, error)
 
-    def batch_download_from_file(self, file_path: Path):
+    def batch_download_from_file(self, file_path: Path, quality_name: str = None, content_names: List[str] = None,
+                                 custom_max_workers: int = None) -> Optional[Dict]:
+        """按URL文件批量下载，进度记录在批量任务日志中，中断后再次运行会从中断处继续
+        
+        URL文件按行流式读取，不会整体载入内存；指向同一视频/合集的URL只下载一次。
+        最多同时处理 batch_concurrency 个URL，每个URL内的分P并发数为 custom_max_workers。
+        后续URL的元数据由 MetadataResolver 以 metadata_concurrency 的并发提前解析，
+        元数据就绪的URL优先开始下载。
+        
+        Args:
+            file_path: 每行一个链接的文本文件
+            quality_name: DownloadQuality 名称，默认取配置
+            content_names: DownloadContent 名称列表，默认取配置
+            custom_max_workers: 每个URL的分P并发数
+            
+        Returns:
+            各状态的URL数，文件不存在或没有有效URL时返回None
+        """
         file_path = Path(str(file_path).strip().strip("'").strip('"'))
         if not file_path.exists():
             console.print(f"[red]文件不存在: {file_path}[/red]")
-            return
+            return None
 
+        quality = getattr(DownloadQuality, quality_name) if quality_name else None
+        content = [getattr(DownloadContent, name) for name in content_names] if content_names else None
+        concurrency = max(1, int(self.config.get("batch_concurrency", 4)))
+        max_attempts = max(1, int(self.config.get("batch_max_attempts", 3)))
+        metadata_concurrency = max(1, int(self.config.get("metadata_concurrency", 8)))
+        # 预取窗口：最多提前解析这么多个待处理URL
+        lookahead = concurrency + 4 * metadata_concurrency
+        
+        journal = BatchJournal(Path(self.config.get("batch_journal_path", "./batch_journal.db")))
+        resolver = MetadataResolver(self, metadata_concurrency)
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                urls = [line.strip() for line in f if line.strip()]
+            batch_id, read_offset, line_count = journal.open_batch(
+                str(file_path.resolve()), file_path.stat().st_size, max_attempts
+            )
+            if read_offset:
+                console.print(f"[yellow]继续上次的批量下载（已读取 {line_count} 行）[/yellow]")
+            
+            with open(file_path, 'rb') as url_file:
+                url_file.seek(read_offset)
+                
+                def read_more(limit: int = 500) -> bool:
+                    """读取下一批URL写入任务日志，文件已读完时返回False"""
+                    nonlocal line_count
+                    items = []
+                    while len(items) < limit:
+                        line = url_file.readline()
+                        if not line:
+                            break
+                        line_count += 1
+                        url = line.decode('utf-8-sig', errors='replace').strip()
+                        if url and not url.startswith("#"):
+                            items.append((self._batch_item_key(url), url, line_count))
+                    journal.add_items(batch_id, items, url_file.tell(), line_count)
+                    return bool(items)
+                
+                file_exhausted = False
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    running = set()
+                    while True:
+                        # 预取窗口内的待处理URL，不足时继续读取文件
+                        pending = journal.pending_items(batch_id, lookahead)
+                        while len(pending) < lookahead and not file_exhausted:
+                            file_exhausted = not read_more()
+                            pending = journal.pending_items(batch_id, lookahead)
+                        for pending_item in pending:
+                            resolver.submit(pending_item["key"], pending_item["url"])
+                        
+                        while len(running) < concurrency:
+                            key = resolver.take_ready()
+                            if key is None:
+                                break
+                            item = journal.claim_item(batch_id, key)
+                            if item is None:
+                                continue
+                            console.print(f"\n[cyan]开始下载: {item['url']}[/cyan]")
+                            running.add(executor.submit(
+                                self._run_batch_item, journal, batch_id, item, quality, content, custom_max_workers
+                            ))
+                        
+                        resolving = resolver.in_flight()
+                        if not running and not resolving:
+                            if not pending:
+                                break
+                            continue
+                        done, _ = wait(running | resolving, return_when=FIRST_COMPLETED)
+                        for future in done & running:
+                            future.result()
+                        running -= done
+                        if self.progress_callback:
+                            counts = journal.item_counts(batch_id)
+                            finished = counts.get("done", 0) + counts.get("failed", 0)
+                            self.progress_callback("batch", finished, sum(counts.values()), 0)
             
-            if not urls:
+            counts = journal.item_counts(batch_id)
+            if not counts:
                 console.print("[red]文件中没有有效的URL[/red]")
-                return
+                return None
+            console.print(f"[green]批量下载结束: 完成 {counts.get('done', 0)}，失败 {counts.get('failed', 0)}[/green]")
+            console.print(f"[dim]元数据预取: 请求 {resolver.stats['fetched']}，"
+                          f"命中缓存 {resolver.stats['cached']}，失败 {resolver.stats['failed']}[/dim]")
+            for failed in journal.failed_items(batch_id):
+                console.print(f"[red]失败({failed['attempts']}次): {failed['url']} - {failed['error']}[/red]")
+            return counts
+        except Exception as e:
+            console.print(f"[red]批量下载失败: {str(e)}[/red]")
+            if self.error_callback:
+                self.error_callback("batch", f"批量下载失败: {str(e)}")
+            return None
+        finally:
+            resolver.close()
+            journal.close()
 
-            console.print("\n[bold cyan]╭────────── 批量下载设置 ──────────╮[/bold cyan]")
-            quality = self.select_quality()
-            content = self.select_content()
-            max_workers = self._get_valid_max_workers()
-            console.print("[bold cyan]╰──────────────────────────────────╯[/bold cyan]\n")
+    @staticmethod
+    def _batch_item_key(url: str) -> str:
+        """不调用接口得到用于去重的键：视频为BV号，收藏夹/课程为其ID"""
+        if match := re.search(r"(BV\w+)", url):
+            return match.group(1)
+        if match := re.search(r"/medialist/play/(\w+)", url):
+            return f"mlid:{match.group(1)}"
+        if match := re.search(r"/cheese/play/(\w+)", url):
+            return f"ssid:{match.group(1)}"
+        return url
 
-            self.config["max_workers"] = max_workers
-            self.save_config()
+    def _run_batch_item(self, journal: BatchJournal, batch_id: int, item: Dict, quality: Optional[DownloadQuality],
+                        content: Optional[List[DownloadContent]], custom_max_workers: Optional[int]):
+        """解析并下载一个URL，把URL和分P的状态写入任务日志"""
+        key = item["key"]
+        try:
+            parsed = self.parse_url(item["url"])
+            if parsed["type"] == VideoType.COLLECTION:
+                collection_type = "bvid" if "bvid" in parsed else ("ssid" if "ssid" in parsed else "mlid")
+                info, pages = self.resolve_collection(parsed[collection_type], collection_type)
+            elif "bvid" in parsed:
+                info = self.get_video_info(parsed["bvid"])
+                pages = info["pages"]
+            else:
+                raise Exception("不支持的链接类型")
+            journal.set_item_state(batch_id, key, "downloading", title=info["title"])
+            
+            quality, content_types = self._resolve_download_options(quality, content)
+            progress = {"queued": 0, "done": 0}
+            
+            def pending_pages():
+                """跳过任务日志中已完成的分P"""
+                for page in pages:
+                    if all(journal.page_done(batch_id, key, page["p"], c.name) for c in content_types):
+                        continue
+                    progress["queued"] += len(content_types)
+                    yield page
+            
+            def on_task_state(page, content_type, state):
+                # 排队状态不写入日志，分P只在开始下载时登记
+                if state == "queued":
+                    return
+                journal.set_page_state(batch_id, key, page["p"], content_type.name, state)
+                if state == "done":
+                    progress["done"] += 1
+            
+            if content_types:
+                self.download_pages(info, pending_pages(), quality, content_types, custom_max_workers,
+                                    on_task_state=on_task_state)
+            
+            if progress["done"] < progress["queued"]:
+                failed = progress["queued"] - progress["done"]
+                journal.set_item_state(batch_id, key, "failed", error=f"{failed} 个文件下载失败")
+            else:
+                journal.set_item_state(batch_id, key, "done")
+        except Exception as e:
+            journal.set_item_state(batch_id, key, "failed", error=str(e))
+            if self.error_callback:
+                self.error_callback(item["url"], str(e))
 
+    def batch_download(self, file_path: Path):
+        file_path = Path(str(file_path).strip().strip("'").strip('"'))
+        if not file_path.exists():
+            console.print(f"[red]文件不存在: {file_path}[/red]")
+            return
+
+        console.print("\n[bold cyan]╭────────── 批量下载设置 ──────────╮[/bold cyan]")
+        quality = self.select_quality()
+        content = self.select_content()
+        max_workers = self._get_valid_max_workers()
+        console.print("[bold cyan]╰──────────────────────────────────╯[/bold cyan]\n")
+
+        self.config["max_workers"] = max_workers
+        self.save_config()
+        with ConsoleProgressView(self.progress_bus):
+            self.batch_download_from_file(file_path, quality_name=quality.name,
+                                          content_names=[c.name for c in content], custom_max_workers=max_workers)
+
+    def sync_urls(self, sources: List[str], quality: DownloadQuality = None, content: List[DownloadContent] = None,
+                  custom_max_workers: int = None, full: bool = False) -> int:
+        """依次增量同步多个链接，sources中的文本文件按每行一个链接读取
+        
+        Returns:
+            同步失败的链接数
+        """
+        failed = 0
+        for source in sources:
+            source_path = Path(source.strip().strip("'").strip('"'))
+            if source_path.is_file():
+                with open(source_path, 'r', encoding='utf-8') as f:
+                    urls = [line.strip() for line in f if line.strip()]
+            else:
+                urls = [source]
             for url in urls:
-                console.print(f"\n[cyan]开始下载: {url}[/cyan]")
-                self.download_video(url, quality=quality, content=content, batch_mode=True)
-        except Exception as e:
-            console.print(f"[red]批量下载失败: {str(e)}[/red]")
+                console.print(f"\n[cyan]开始同步: {url}[/cyan]")
+                if not self.sync_collection(url, quality=quality, content=content,
+                                            custom_max_workers=custom_max_workers, full=full):
+                    console.print(f"[red]同步失败: {url}[/red]")
+                    failed += 1
+        return failed
+
+    def sync_download(self):
+        source = Prompt.ask("[bold cyan]➜[/bold cyan] 输入合集链接或包含链接的文件路径")
+        full = Confirm.ask("是否重新获取完整列表（忽略水位）?", default=False)
+        
+        console.print("\n[bold cyan]╭────────── 同步设置 ──────────╮[/bold cyan]")
+        quality = self.select_quality()
+        content = self.select_content()
+        max_workers = self._get_valid_max_workers()
+        console.print("[bold cyan]╰──────────────────────────────╯[/bold cyan]\n")
+        
+        with ConsoleProgressView(self.progress_bus):
+            self.sync_urls([source], quality=quality, content=content, custom_max_workers=max_workers, full=full)
 
     def _get_valid_max_workers(self) -> int:
         """获取有效线程数（1-32）"""
@@ -1464,12 +4326,13 @@ class BiliDownloader:
         max_workers = self._get_valid_max_workers()
         console.print("[bold cyan]╰──────────────────────────────╯[/bold cyan]\n")
         
-        self.download_video(
-            url, 
-            quality=quality,
-            content=content,
-            custom_max_workers=max_workers  # 传递自定义线程数
-        )
+        with ConsoleProgressView(self.progress_bus):
+            self.download_video(
+                url, 
+                quality=quality,
+                content=content,
+                custom_max_workers=max_workers  # 传递自定义线程数
+            )
 
     def select_quality(self) -> DownloadQuality:
         table = Table(title="视频质量", box=SIMPLE)
@@ -1557,6 +4420,10 @@ class BiliDownloader:
                 - download_content: 默认下载内容列表
                 - max_workers: 最大线程数
                 - proxies: 代理设置
+                - api_concurrency: playurl接口并发上限（可选）
+                - transfer_concurrency: CDN传输并发上限（可选）
+                - bandwidth_limits: 带宽限制（可选），格式见 BandwidthShaper
+                - bandwidth_schedule: 时段限速（可选），格式见 BandwidthShaper
         """
         try:
             # 更新下载路径
@@ -1569,8 +4436,16 @@ class BiliDownloader:
                 "quality": settings.get("quality", self.config.get("quality")),
                 "max_workers": settings.get("max_workers", self.config.get("max_workers")),
                 "download_content": settings.get("download_content", self.config.get("download_content")),
-                "proxies": settings.get("proxies")
+                "proxies": settings.get("proxies"),
+                "api_concurrency": settings.get("api_concurrency", self.config.get("api_concurrency")),
+                "transfer_concurrency": settings.get("transfer_concurrency", self.config.get("transfer_concurrency")),
+                "bandwidth_limits": settings.get("bandwidth_limits", self.config.get("bandwidth_limits")),
+                "bandwidth_schedule": settings.get("bandwidth_schedule", self.config.get("bandwidth_schedule"))
             })
+            self._init_concurrency_limits()
+            self.sessions.configure(self._connection_pool_sizes())
+            # 正在进行的下载立即按新的带宽限制限速
+            self.bandwidth.configure(self.config["bandwidth_limits"], self.config["bandwidth_schedule"])
             
             # 更新代理设置
             self.proxies = settings.get("proxies")
@@ -1608,8 +4483,9 @@ class BiliDownloader:
 │                                   │
 │   🎬 [bold cyan]1.[/bold cyan] 单视频下载            │
 │   📚 [bold cyan]2.[/bold cyan] 批量下载              │
-│   ⚙️  [bold cyan]3.[/bold cyan] 设置                 │ 
-│   🚪 [bold cyan]4.[/bold cyan] 退出                 │
+│   🔄 [bold cyan]3.[/bold cyan] 增量同步              │
+│   ⚙️  [bold cyan]4.[/bold cyan] 设置                 │ 
+│   🚪 [bold cyan]5.[/bold cyan] 退出                 │
 │                                   │
 [bold cyan]╰───────────────────────────────╯[/bold cyan]
                 """),
@@ -1621,7 +4497,7 @@ class BiliDownloader:
             
             choice = Prompt.ask(
                 "\n[bold cyan]➜[/bold cyan] 请选择操作",
-                choices=["1", "2", "3", "4"],
+                choices=["1", "2", "3", "4", "5"],
                 show_choices=False
             )
             
@@ -1631,12 +4507,16 @@ class BiliDownloader:
                 console.print("\n[bold cyan]╭──────────── 📚 批量下载 ────────────╮[/bold cyan]")
                 file_path = Prompt.ask("[bold cyan]➜[/bold cyan] 输入包含URL的文件路径")
                 console.print("[bold cyan]╰────────────────────────────────────╯[/bold cyan]\n")
-                self.batch_download_from_file(Path(file_path))
+                self.batch_download(Path(file_path))
             elif choice == "3":
+                console.print("\n[bold cyan]╭──────────── 🔄 增量同步 ────────────╮[/bold cyan]")
+                self.sync_download()
+                console.print("[bold cyan]╰────────────────────────────────────╯[/bold cyan]\n")
+            elif choice == "4":
                 console.print("\n[bold cyan]╭──────────── ⚙️ 设置 ────────────╮[/bold cyan]")
                 self.show_settings()
                 console.print("[bold cyan]╰────────────────────────────────────╯[/bold cyan]\n")
-            elif choice == "4":
+            elif choice == "5":
                 console.print(Panel.fit(
                     "[yellow]感谢使用，再见！👋[/yellow]",
                     border_style="yellow",
@@ -1644,9 +4524,40 @@ class BiliDownloader:
                 ))
                 break
 
+def create_downloader(status_callback=None, progress_callback=None, error_callback=None,
+                      engine: Optional[str] = None) -> BiliDownloader:
+    """按配置创建下载器
+    
+    Args:
+        status_callback: 状态回调
+        progress_callback: 进度回调
+        error_callback: 错误回调
+        engine: "threads"（默认，线程池）或 "asyncio"（需要aiohttp），为None时读取配置中的engine
+        
+    Returns:
+        BiliDownloader 或同步接口相同的 AsyncBiliDownloader
+    """
+    if engine is None:
+        try:
+            with open("./config.json", 'r', encoding='utf-8') as f:
+                engine = json.load(f).get("engine", "threads")
+        except (OSError, ValueError):
+            engine = "threads"
+    
+    callbacks = dict(status_callback=status_callback, progress_callback=progress_callback,
+                     error_callback=error_callback)
+    if engine == "asyncio":
+        from async_engine import AsyncBiliDownloader
+        return AsyncBiliDownloader(**callbacks)
+    return BiliDownloader(**callbacks)
+
 if __name__ == "__main__":
     try:
-        BiliDownloader().run()
+        # 定时任务使用：python 音乐批量下载.py --sync 链接或链接文件 [...]，按配置中的质量和内容下载
+        if len(sys.argv) > 2 and sys.argv[1] in ("--sync", "--sync-full"):
+            downloader = create_downloader()
+            sys.exit(1 if downloader.sync_urls(sys.argv[2:], full=sys.argv[1] == "--sync-full") else 0)
+        create_downloader().run()
     except KeyboardInterrupt:
         console.print("\n[red]程序已中断[/red]")
     except Exception as e:
@@ -9,6 +9,7 @@ import json
 import threading
 from concurrent.futures import ThreadPoolExecutor
 import time
+from progress_bus import ProgressBus, format_eta
 
 class DownloadWorker(QThread):
     progress_updated = pyqtSignal(int)
@@ -57,20 +58,30 @@ class DownloadWorker(QThread):
                 return
 
             block_size = 1024
-            downloaded_size = 0
             
+            # 下载循环只累加计数器，进度条和速度由进度总线按固定间隔刷新
+            progress_bus = ProgressBus()
+            progress_bus.subscribe(self._on_progress_snapshot)
             file_path = os.path.join(self.save_path, f"{video_info['title']}.mp4")
-            with open(file_path, 'wb') as f:
-                for data in response.iter_content(block_size):
-                    if not self.is_running:
-                        f.close()
-                        os.remove(file_path)
-                        return
-                    
-                    downloaded_size += len(data)
-                    f.write(data)
-                    progress = int((downloaded_size / total_size) * 100)
-                    self.progress_updated.emit(progress)
+            counter = progress_bus.task("download", total_size, label=video_info['title'])
+            try:
+                with open(file_path, 'wb') as f:
+                    for data in response.iter_content(block_size):
+                        if not self.is_running:
+                            counter.finish(False)
+                            f.close()
+                            os.remove(file_path)
+                            return
+                        
+                        f.write(data)
+                        counter.add(len(data))
+                counter.finish()
+            finally:
+                # 下载或写入出错时也结束计数器，否则采样线程不会退出，会一直推送过期的快照
+                if counter.state == "running":
+                    counter.finish(False)
+                progress_bus.unsubscribe(self._on_progress_snapshot)
+            self.progress_updated.emit(100)
 
             self.status_updated.emit('下载完成！')
             self.download_completed.emit()
@@ -78,6 +89,15 @@ class DownloadWorker(QThread):
         except Exception as e:
             self.error_occurred.emit(f'下载出错: {str(e)}')
 
+    def _on_progress_snapshot(self, snapshot):
+        """进度总线的订阅者，信号会被排队到界面线程"""
+        aggregate = snapshot["aggregate"]
+        if not aggregate["active"] or not aggregate["total"]:
+            return
+        self.progress_updated.emit(int(aggregate["downloaded"] / aggregate["total"] * 100))
+        self.status_updated.emit(f'下载中 {aggregate["speed"] / 1024 / 1024:.1f}MB/s，'
+                                 f'剩余 {format_eta(aggregate["eta"])}')
+
     def stop(self):
         self.is_running = False
 